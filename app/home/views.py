@@ -1,9 +1,11 @@
 # views.py
 from django.views.generic import ListView
 from app.medicine.models import Medicine
-from django.db.models import Q
+from app.medicine import composition, pricing
+from django.db.models import Case, Q, When
 from django.http import JsonResponse
 from django.views.decorators.http import require_GET
+from app.money import MoneyJSONEncoder
 
 class HomeView(ListView):
     model = Medicine
@@ -11,7 +13,7 @@ class HomeView(ListView):
     context_object_name = 'medicines'
 
     def get_queryset(self):
-        queryset = super().get_queryset()
+        queryset = Medicine.objects.with_pricing()
         query = self.request.GET.get('search_query', '')
         
         if query:
@@ -28,21 +30,34 @@ class HomeView(ListView):
         context['search_query'] = self.request.GET.get('search_query', '')
         return context
 
+FORMULA_SEARCH_LIMIT = 50
+SEARCH_RESULTS_LIMIT = 20
+
 @require_GET
 def search_by_formula(request):
-    query = request.GET.get('q', '').strip()
-    
-    if query:
-        medicines = Medicine.objects.filter(formula__icontains=query).values(
-            'name', 'formula', 'company', 'price', 'stock'
-        )
-        return JsonResponse(list(medicines), safe=False)
-    
-    return JsonResponse([], safe=False)
+    """
+    Medicines whose composition has every salt and strength of q, via the
+    composition token index; in-stock ones first, at most FORMULA_SEARCH_LIMIT.
+    """
+    compositions = composition.search(request.GET.get('q', ''))
+    if compositions is None:
+        return JsonResponse([], safe=False)
+
+    medicines = (
+        Medicine.objects.filter(composition__in=compositions)
+        .order_by(Case(When(stock__gt=0, then=0), default=1), 'composition', 'price', 'name')
+        .values('id', 'name', 'formula', 'company', 'price', 'stock')[:FORMULA_SEARCH_LIMIT]
+    )
+    return JsonResponse(list(medicines), safe=False, encoder=MoneyJSONEncoder)
 
 def medicine_search_results(request):
     query = request.GET.get('q', '')
-    medicines = Medicine.objects.all()
+    # Without a query the page loads the whole catalog once and filters it
+    # itself; with one it asks for typo-tolerant matches
+    if query.strip():
+        medicines = Medicine.objects.with_pricing().fuzzy_search(query)[:SEARCH_RESULTS_LIMIT]
+    else:
+        medicines = Medicine.objects.with_pricing()
     
     results = []
     for med in medicines:
@@ -53,13 +68,13 @@ def medicine_search_results(request):
             'formula': med.formula,
             'batch_no': med.batch_no if med.batch_no else None,  # Added batch_no field
             'highlighted_name': med.name.replace(query, f'<span class="font-bold">{query}</span>'),
-            'price': float(med.price),
-            'selling_price': float(med.selling_price),
+            'price': med.price,
+            'selling_price': med.selling_price,
             'stock': med.stock,
             'rack_number': med.rack_number if med.rack_number else None,
             'discount_display': med.get_discount_display(),
-            'calculated_discount': float(med.calculated_discount)
+            'calculated_discount': med.calculated_discount
         })
     
-    return JsonResponse({'results': results})
+    return JsonResponse({'results': results, 'catalog_version': pricing.catalog_version()}, encoder=MoneyJSONEncoder)
 
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class MedicineConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'app.medicine'
+
+    def ready(self):
+        from . import signals
@@ -0,0 +1,82 @@
+import threading
+
+
+def normalize_code(code):
+    """Canonical form used for both indexing and lookups"""
+    return (code or '').strip().upper()
+
+
+class BarcodeIndex:
+    """
+    In-memory exact-match index from barcode / batch number to medicine id.
+
+    The index is built lazily with a single query and then kept in sync by
+    the Medicine post_save / post_delete signals, so a scan never touches
+    the database to resolve its code.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_barcode = None
+        self._by_batch = None
+        self._codes_by_id = {}
+
+    def _build(self):
+        from .models import Medicine
+
+        self._by_barcode = {}
+        self._by_batch = {}
+        self._codes_by_id = {}
+        for medicine_id, barcode, batch_no in Medicine.objects.values_list('id', 'barcode', 'batch_no'):
+            self._add(medicine_id, barcode, batch_no)
+
+    def _add(self, medicine_id, barcode, batch_no):
+        barcode = normalize_code(barcode)
+        batch_no = normalize_code(batch_no)
+        if barcode:
+            self._by_barcode.setdefault(barcode, set()).add(medicine_id)
+        if batch_no:
+            self._by_batch.setdefault(batch_no, set()).add(medicine_id)
+        self._codes_by_id[medicine_id] = (barcode, batch_no)
+
+    def _remove(self, medicine_id):
+        barcode, batch_no = self._codes_by_id.pop(medicine_id, ('', ''))
+        for mapping, code in ((self._by_barcode, barcode), (self._by_batch, batch_no)):
+            ids = mapping.get(code)
+            if ids is not None:
+                ids.discard(medicine_id)
+                if not ids:
+                    del mapping[code]
+
+    def resolve(self, code):
+        """Return the list of medicine ids matching code (barcode wins over batch no)"""
+        code = normalize_code(code)
+        if not code:
+            return []
+        with self._lock:
+            if self._by_barcode is None:
+                self._build()
+            ids = self._by_barcode.get(code) or self._by_batch.get(code) or ()
+            return sorted(ids)
+
+    def update(self, medicine):
+        with self._lock:
+            if self._by_barcode is None:
+                return  # Not built yet; the next lookup will see fresh data
+            self._remove(medicine.pk)
+            self._add(medicine.pk, medicine.barcode, medicine.batch_no)
+
+    def discard(self, medicine_id):
+        with self._lock:
+            if self._by_barcode is not None:
+                self._remove(medicine_id)
+
+    def invalidate(self):
+        """Drop the whole index, e.g. after bulk writes that bypass signals"""
+        with self._lock:
+            self._by_barcode = None
+            self._by_batch = None
+            self._codes_by_id = {}
+
+
+barcode_index = BarcodeIndex()
@@ -0,0 +1,283 @@
+"""
+Bulk medicine catalog import from CSV.
+
+Rows are read from the file as a stream and handled in chunks of
+CHUNK_SIZE, so memory stays bounded however large the file is. Each chunk
+is validated in Python, matched to existing medicines on (name, company,
+batch_no), upserted by id with one bulk_create(update_conflicts=True) and
+its opening stock is received with one bulk insert of PurchaseRecords
+plus one stock UPDATE (PurchaseRecord.apply). Every chunk commits on its
+own; invalid rows are skipped and reported with their line number.
+
+Batch numbers are only unique when set, so a row without one updates the
+single medicine of that name and company without one, and is reported
+when there are several.
+
+Only the columns present in the header are written to existing
+medicines, so a price list with just name, company, batch_no and
+prices leaves racks, barcodes and expiry dates alone.
+"""
+import csv
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.utils import timezone
+
+from app.money import Money
+from . import composition, expiry, pricing
+from .barcodes import barcode_index
+from .fuzzy import fuzzy_index
+from .models import Medicine, PurchaseRecord
+
+KEY_FIELDS = ('name', 'company', 'batch_no')
+REQUIRED_COLUMNS = ('name', 'company', 'expiry_date')
+TEXT_COLUMNS = ('formula', 'barcode', 'rack_number')
+MONEY_COLUMNS = ('packet_price', 'retailers_price')
+# Units received with the import; added to stock with a purchase record
+STOCK_COLUMN = 'initial_stock'
+COLUMNS = KEY_FIELDS + ('expiry_date',) + TEXT_COLUMNS + MONEY_COLUMNS + (
+    'units_per_box', 'discount_type', 'discount', STOCK_COLUMN,
+)
+
+CHUNK_SIZE = 1000
+# Errors kept for the report; later ones are only counted
+MAX_REPORTED_ERRORS = 500
+PURCHASE_NOTE = 'Catalog import'
+
+
+class CatalogImportError(ValueError):
+    """The file as a whole cannot be imported (e.g. missing columns)"""
+
+
+def _text(row, column, max_length=None):
+    value = (row.get(column) or '').strip()
+    if max_length and len(value) > max_length:
+        raise ValueError(f"{column} is longer than {max_length} characters")
+    return value
+
+
+def _money(row, column):
+    value = (row.get(column) or '').strip()
+    if not value:
+        return Money.ZERO
+    try:
+        amount = Money.coerce(value)
+    except ArithmeticError:
+        raise ValueError(f"{column} must be an amount in rupees")
+    if amount < Money.ZERO:
+        raise ValueError(f"{column} cannot be negative")
+    return amount
+
+
+def _whole(row, column, default, minimum):
+    value = (row.get(column) or '').strip()
+    if not value:
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        raise ValueError(f"{column} must be a whole number")
+    if number < minimum:
+        raise ValueError(f"{column} must be at least {minimum}")
+    return number
+
+
+def parse_row(row, today):
+    """(field values, initial stock) for one CSV row; raises ValueError"""
+    fields = {
+        'name': _text(row, 'name', 100),
+        'company': _text(row, 'company', 100),
+        'batch_no': _text(row, 'batch_no'),
+    }
+    if not fields['name'] or not fields['company']:
+        raise ValueError("name and company are required")
+
+    for column in TEXT_COLUMNS:
+        fields[column] = _text(row, column, Medicine._meta.get_field(column).max_length)
+    if 'rack_number' in row and not fields['rack_number']:
+        raise ValueError("rack_number is required")
+    for column in MONEY_COLUMNS:
+        fields[column] = _money(row, column)
+    fields['units_per_box'] = _whole(row, 'units_per_box', 1, 1)
+
+    try:
+        fields['expiry_date'] = datetime.strptime(_text(row, 'expiry_date'), '%Y-%m-%d').date()
+    except ValueError:
+        raise ValueError("expiry_date must be YYYY-MM-DD")
+    if fields['expiry_date'] < today:
+        raise ValueError("expiry_date cannot be in the past")
+
+    fields['discount_type'] = _text(row, 'discount_type') or 'percent'
+    if fields['discount_type'] not in dict(Medicine.DISCOUNT_CHOICES):
+        raise ValueError("discount_type must be percent or flat")
+    try:
+        fields['discount'] = Decimal(_text(row, 'discount') or '0').quantize(Decimal('0.01'))
+    except InvalidOperation:
+        raise ValueError("discount must be a number")
+    if fields['discount'] < 0:
+        raise ValueError("discount cannot be negative")
+    if fields['discount_type'] == 'flat' and Money.coerce(fields['discount']) > fields['packet_price']:
+        raise ValueError("flat discount cannot exceed the packet price")
+
+    # Same derivations as Medicine.clean() and Medicine.save()
+    fields['price'] = fields['packet_price'] / fields['units_per_box']
+    fields['composition'] = composition.composition_key(fields['formula'])
+    return fields, _whole(row, STOCK_COLUMN, 0, 0)
+
+
+def _update_fields(header):
+    """Medicine fields overwritten on existing rows, from the columns present"""
+    fields = [column for column in COLUMNS if column in header and column not in KEY_FIELDS + (STOCK_COLUMN,)]
+    if 'packet_price' in fields and 'units_per_box' in fields:
+        fields.append('price')
+    if 'formula' in fields:
+        fields.append('composition')
+    return fields + ['updated_at']
+
+
+@transaction.atomic
+def _import_chunk(rows, update_fields):
+    """
+    Upsert one chunk of (line number, fields, initial stock); returns
+    (created, updated, units, [(line number, error), ...]).
+    """
+    # A key repeated within the chunk keeps its last row, stock adds up
+    medicines = {}
+    stock = {}
+    lines = {}
+    for line, fields, initial_stock in rows:
+        key = tuple(fields[field] for field in KEY_FIELDS)
+        medicines[key] = Medicine(**fields)
+        stock[key] = stock.get(key, 0) + initial_stock
+        lines.setdefault(key, []).append(line)
+
+    matches = {}
+    for row in Medicine.objects.filter(name__in={key[0] for key in medicines}).values_list('id', *KEY_FIELDS):
+        if tuple(row[1:]) in medicines:
+            matches.setdefault(tuple(row[1:]), []).append(row[0])
+
+    errors = []
+    existing = {}
+    rejected = set()
+    for key, medicine in medicines.items():
+        ids = matches.get(key, [])
+        if len(ids) > 1:
+            # Only possible without a batch number
+            message = f"{len(ids)} medicines named {key[0]} from {key[1]} have no batch number; give one"
+        elif ids:
+            existing[key] = medicine.pk = ids[0]
+            continue
+        elif not medicine.rack_number:
+            message = "rack_number is required for a new medicine"
+        else:
+            continue
+        rejected.add(key)
+        errors += [(line, message) for line in lines[key]]
+    for key in rejected:
+        del medicines[key], stock[key]
+
+    # New medicines are inserted with their opening stock and purchase
+    # statistics; existing ones keep theirs, as these fields are not in
+    # update_fields, and are brought up to date by PurchaseRecord.apply
+    now = timezone.now()
+    for key, medicine in medicines.items():
+        if stock[key] and key not in existing:
+            unit_price = medicine.purchase_per_unit_price
+            medicine.stock = medicine.total_purchased = stock[key]
+            medicine.total_purchase_amount = unit_price * stock[key]
+            medicine.last_purchase_date = now
+            medicine.last_purchase_price = unit_price
+
+    Medicine.objects.bulk_create(
+        medicines.values(),
+        update_conflicts=True,
+        unique_fields=['id'],
+        update_fields=update_fields,
+    )
+    if existing and 'price' not in update_fields and {'packet_price', 'units_per_box'} & set(update_fields):
+        # Only one side of the price changed; derive it from the stored other side
+        Medicine.objects.filter(pk__in=existing.values()).update(price=pricing.SELLING_PER_UNIT_PRICE)
+
+    composition.index(medicine.composition for medicine in medicines.values())
+
+    # Existing medicines are received at their stored purchase price, as
+    # the file may not carry one
+    unit_prices = {key: medicine.purchase_per_unit_price for key, medicine in medicines.items()}
+    stocked = [medicine_id for key, medicine_id in existing.items() if stock[key]]
+    if stocked:
+        stored = dict(
+            Medicine.objects.with_pricing().filter(pk__in=stocked).values_list('pk', 'purchase_per_unit_price')
+        )
+        unit_prices.update({key: stored[medicine_id] for key, medicine_id in existing.items() if stock[key]})
+
+    records = PurchaseRecord.objects.bulk_create([
+        PurchaseRecord(
+            medicine_id=medicine.pk,
+            quantity=stock[key],
+            unit_price=unit_prices[key],
+            total_amount=unit_prices[key] * stock[key],
+            notes=PURCHASE_NOTE,
+        )
+        for key, medicine in medicines.items() if stock[key]
+    ])
+    PurchaseRecord.apply(records, counted={
+        medicine.pk for key, medicine in medicines.items() if key not in existing
+    })
+    return len(medicines) - len(existing), len(existing), sum(stock.values()), errors
+
+
+def import_catalog(lines, chunk_size=CHUNK_SIZE):
+    """
+    Import an iterable of CSV text lines (an open file or uploaded file
+    wrapper). Returns {'rows', 'created', 'updated', 'units', 'error_count',
+    'errors': [(line number, message), ...]}.
+    """
+    reader = csv.DictReader(lines)
+    header = [column.strip() for column in reader.fieldnames or []]
+    reader.fieldnames = header
+    missing = [column for column in REQUIRED_COLUMNS if column not in header]
+    if missing:
+        raise CatalogImportError(f"Missing column(s): {', '.join(missing)}")
+
+    update_fields = _update_fields(header)
+    today = timezone.localdate()
+    result = {'rows': 0, 'created': 0, 'updated': 0, 'units': 0, 'error_count': 0, 'errors': []}
+
+    def report(line, message):
+        result['error_count'] += 1
+        if len(result['errors']) < MAX_REPORTED_ERRORS:
+            result['errors'].append((line, message))
+
+    def flush(chunk):
+        created, updated, units, errors = _import_chunk(chunk, update_fields)
+        result['created'] += created
+        result['updated'] += updated
+        result['units'] += units
+        for line, message in errors:
+            report(line, message)
+
+    chunk = []
+    for row in reader:
+        result['rows'] += 1
+        try:
+            fields, initial_stock = parse_row(row, today)
+        except ValueError as e:
+            report(reader.line_num, str(e))
+            continue
+        chunk.append((reader.line_num, fields, initial_stock))
+        if len(chunk) >= chunk_size:
+            flush(chunk)
+            chunk = []
+    if chunk:
+        flush(chunk)
+
+    # bulk_create bypasses the Medicine signals that keep these current
+    if result['created'] or result['updated']:
+        barcode_index.invalidate()
+        fuzzy_index.rebuild()
+        expiry.invalidate()
+        pricing.bump_catalog_version()
+    # Rows rejected while upserting are reported after their chunk
+    result['errors'].sort()
+    return result
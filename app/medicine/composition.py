@@ -0,0 +1,130 @@
+"""
+Normalized medicine composition, for formula search and substitutes.
+
+A free-text formula such as "Amoxicillin 500 mg + Clavulanic Acid 0.125g
+Tab" is split into components, each a salt name and its strengths, and
+reduced to a canonical composition key:
+
+    "amoxicillin 500mg+clavulanic acid 125mg"
+
+Casing, spacing, unit spelling (g/mg, ug/mcg), dosage form words and
+component order no longer matter, so brands with the same composition
+share one key. Medicine.composition stores it (indexed) and
+substitutes are an equality lookup on it.
+
+Every composition is also broken into salt word and strength tokens
+stored in CompositionToken, so a formula search resolves tokens to
+compositions with index range scans instead of scanning every formula
+with icontains.
+"""
+import re
+
+from django.db.models import Q
+
+# Words that name a dosage form, not an ingredient
+FORM_WORDS = {
+    'tab', 'tabs', 'tablet', 'tablets', 'cap', 'caps', 'capsule', 'capsules',
+    'syp', 'syrup', 'susp', 'suspension', 'inj', 'injection', 'cream', 'gel',
+    'oint', 'ointment', 'drop', 'drops', 'sachet', 'sachets',
+}
+# Spellings of a unit to (canonical unit, factor)
+UNITS = {
+    'g': ('mg', 1000), 'gm': ('mg', 1000), 'mg': ('mg', 1),
+    'mcg': ('mcg', 1), 'ug': ('mcg', 1), 'µg': ('mcg', 1),
+    'ml': ('ml', 1), 'iu': ('iu', 1), '%': ('%', 1),
+}
+KEY_SEPARATOR = '+'
+MAX_KEY_LENGTH = 255
+
+_COMPONENT_SEPARATORS = re.compile(r'\s*(?:\+|,|;|&|\band\b|\bwith\b)\s*')
+# "500mg", "0.125 g", "250mg/5ml"; a bare number counts as mg
+_STRENGTH = re.compile(
+    r'(?<![a-z0-9.])(\d+(?:\.\d+)?)\s*(mcg|ug|µg|mg|gm|g|ml|iu|%)?'
+    r'(?:\s*/\s*(\d+(?:\.\d+)?)?\s*(ml|g|gm))?(?![a-z0-9])'
+)
+_WORD = re.compile(r'[a-zµ][a-zµ0-9-]*')
+
+
+def _number(value):
+    """Decimal string without trailing zeros ("0.50" -> "0.5", "1000.0" -> "1000")"""
+    text = f'{float(value):.4f}'.rstrip('0').rstrip('.')
+    return text or '0'
+
+
+def _strength(amount, unit, per_amount, per_unit):
+    unit, factor = UNITS.get(unit or 'mg')
+    strength = _number(float(amount) * factor) + unit
+    if per_unit:
+        per_unit, per_factor = UNITS[per_unit]
+        strength += '/' + _number(float(per_amount or 1) * per_factor) + per_unit
+    return strength
+
+
+def components(formula):
+    """Sorted, de-duplicated [(salt, (strength, ...)), ...] of a formula"""
+    result = set()
+    for part in _COMPONENT_SEPARATORS.split((formula or '').lower()):
+        strengths = tuple(_strength(*match.groups()) for match in _STRENGTH.finditer(part))
+        salt = ' '.join(
+            word for word in _WORD.findall(_STRENGTH.sub(' ', part))
+            if word not in FORM_WORDS
+        )
+        if salt or strengths:
+            result.add((salt, strengths))
+    return sorted(result)
+
+
+def composition_key(formula):
+    """Canonical composition of a formula, '' when it has none"""
+    key = KEY_SEPARATOR.join(
+        ' '.join((salt,) + strengths).strip() for salt, strengths in components(formula)
+    )
+    return key[:MAX_KEY_LENGTH]
+
+
+def tokens(key):
+    """Salt word and strength tokens of a composition key"""
+    result = set()
+    for component in key.split(KEY_SEPARATOR) if key else ():
+        result.update(component.split())
+    return result
+
+
+def index(keys):
+    """Make sure the tokens of every given composition key are stored"""
+    from .models import CompositionToken
+
+    CompositionToken.objects.bulk_create(
+        [CompositionToken(composition=key, token=token) for key in set(keys) for token in tokens(key)],
+        ignore_conflicts=True,
+    )
+
+
+def _prefix(token):
+    # A range on the unique (token, composition) index; LIKE would not use it
+    return Q(token__gte=token, token__lt=token + '\uffff')
+
+
+def search(query):
+    """
+    Queryset of the compositions containing every salt word of query as
+    a token prefix and every strength of query exactly, or None when
+    query has neither. Meant to be used as a subquery
+    (composition__in=...), so the whole search runs as one statement.
+    """
+    from .models import CompositionToken
+
+    requirements = []
+    for salt, strengths in components(query):
+        requirements += [_prefix(word) for word in salt.split()]
+        requirements += [Q(token=strength) for strength in strengths]
+    if not requirements:
+        return None
+
+    keys = None
+    for requirement in requirements:
+        found = CompositionToken.objects.filter(requirement)
+        if keys is not None:
+            found = found.filter(composition__in=keys)
+        keys = found.values('composition')
+    return keys
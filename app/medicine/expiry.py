@@ -0,0 +1,125 @@
+"""
+Expiry buckets for in-stock medicines, evaluated in SQL on the indexed
+expiry_date column.
+
+summary() returns per-bucket counts, units and purchase value from one
+grouped query and caches the result until local midnight; it is dropped
+early by invalidate(), which runs on every medicine save/delete and every
+recorded stock movement.
+"""
+from datetime import datetime, time, timedelta
+
+from django.core.cache import cache
+from django.db.models import (
+    BooleanField, Case, CharField, Count, ExpressionWrapper, F, Q, Sum, Value, When,
+)
+from django.utils import timezone
+
+from app.money import Money, MoneyField
+from . import pricing
+
+EXPIRING_SOON_DAYS = 120
+
+# (key, label, first day, last day) counted from today; expired has no range
+BUCKETS = [
+    ('expired', 'Expired', None, None),
+    ('0-30', '0-30 days', 0, 30),
+    ('31-90', '31-90 days', 31, 90),
+    ('91-120', '91-120 days', 91, EXPIRING_SOON_DAYS),
+]
+BUCKET_KEYS = [key for key, label, start, end in BUCKETS]
+
+CACHE_KEY = 'medicine:expiry-summary'
+
+
+def bucket_q(key, today=None):
+    """Q() selecting in-stock medicines in the given bucket"""
+    today = today or timezone.localdate()
+    for bucket_key, label, start, end in BUCKETS:
+        if bucket_key != key:
+            continue
+        if start is None:
+            return Q(stock__gt=0, expiry_date__lt=today)
+        return Q(
+            stock__gt=0,
+            expiry_date__gte=today + timedelta(days=start),
+            expiry_date__lte=today + timedelta(days=end),
+        )
+    raise ValueError(f"Unknown expiry bucket: {key}")
+
+
+def bucket_expression(today=None):
+    """CASE expression naming each row's bucket (NULL when in none)"""
+    today = today or timezone.localdate()
+    return Case(
+        *[When(bucket_q(key, today), then=Value(key)) for key in BUCKET_KEYS],
+        default=Value(None),
+        output_field=CharField(),
+    )
+
+
+def flag_expressions(today=None):
+    """is_expired / is_expiring_soon, matching the Medicine properties"""
+    today = today or timezone.localdate()
+    return {
+        'is_expired': ExpressionWrapper(Q(expiry_date__lt=today), output_field=BooleanField()),
+        'is_expiring_soon': ExpressionWrapper(
+            Q(stock__gt=0, expiry_date__gte=today, expiry_date__lte=today + timedelta(days=EXPIRING_SOON_DAYS)),
+            output_field=BooleanField(),
+        ),
+    }
+
+
+def _seconds_until_midnight():
+    now = timezone.localtime()
+    midnight = timezone.make_aware(datetime.combine(now.date() + timedelta(days=1), time.min))
+    return max(int((midnight - now).total_seconds()), 1)
+
+
+def compute_summary(today=None):
+    from .models import Medicine
+
+    today = today or timezone.localdate()
+    rows = (
+        Medicine.objects
+        .filter(stock__gt=0, expiry_date__lte=today + timedelta(days=EXPIRING_SOON_DAYS))
+        .annotate(expiry_bucket=bucket_expression(today))
+        .values('expiry_bucket')
+        .annotate(
+            count=Count('id'),
+            units=Sum('stock'),
+            value=Sum(ExpressionWrapper(
+                pricing.PURCHASE_PER_UNIT_PRICE * F('stock'), output_field=MoneyField()
+            )),
+        )
+        .order_by()
+    )
+    by_key = {row['expiry_bucket']: row for row in rows}
+
+    return {
+        'date': today,
+        'buckets': [
+            {
+                'key': key,
+                'label': label,
+                'count': by_key.get(key, {}).get('count', 0),
+                'units': by_key.get(key, {}).get('units', 0),
+                'value': by_key.get(key, {}).get('value') or Money.ZERO,
+            }
+            for key, label, start, end in BUCKETS
+        ],
+    }
+
+
+def summary():
+    """Cached bucket summary for today"""
+    today = timezone.localdate()
+    result = cache.get(CACHE_KEY)
+    if result is None or result['date'] != today:
+        result = compute_summary(today)
+        cache.set(CACHE_KEY, result, timeout=_seconds_until_midnight())
+    return result
+
+
+def invalidate():
+    cache.delete(CACHE_KEY)
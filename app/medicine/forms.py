@@ -2,6 +2,7 @@ from django import forms
 from .models import Medicine, PurchaseRecord
 from django.core.exceptions import ValidationError
 from django.utils import timezone
+from django.db import transaction
 
 class MedicineAddForm(forms.ModelForm):
     initial_stock = forms.IntegerField(
@@ -29,7 +30,7 @@ class MedicineAddForm(forms.ModelForm):
         fields = [
             'name', 'company', 'formula', 'retailers_price', 
             'packet_price', 'units_per_box', 'rack_number', 
-            'expiry_date', 'discount_type', 'discount', 'batch_no'
+            'expiry_date', 'discount_type', 'discount', 'batch_no', 'barcode'
         ]
         widgets = {
             'name': forms.TextInput(attrs={
@@ -55,6 +56,10 @@ class MedicineAddForm(forms.ModelForm):
                 'class': 'form-control',
                 'placeholder': 'Enter batch number'
             }),
+            'barcode': forms.TextInput(attrs={
+                'class': 'form-control',
+                'placeholder': 'Scan or enter barcode'
+            }),
             'company': forms.TextInput(attrs={
                 'class': 'form-control',
                 'placeholder': 'Manufacturer name'
@@ -83,6 +88,7 @@ class MedicineAddForm(forms.ModelForm):
             
         return cleaned_data
 
+    @transaction.atomic
     def save(self, commit=True):
         instance = super().save(commit=False)
         
@@ -100,10 +106,7 @@ class MedicineAddForm(forms.ModelForm):
                 total_amount=initial_stock * unit_price,
                 notes=self.cleaned_data.get('purchase_note', 'Initial stock purchase')
             )
-            
-            # Update stock
-            instance.stock = initial_stock
-            instance.save()
+            # The purchase record adds the stock and refreshes instance
         
         return instance
 
@@ -152,7 +155,7 @@ class MedicineUpdateForm(forms.ModelForm):
         fields = [
             'name', 'company', 'formula', 'retailers_price', 
             'packet_price', 'units_per_box', 'rack_number', 
-            'expiry_date', 'discount_type', 'discount', 'batch_no'
+            'expiry_date', 'discount_type', 'discount', 'batch_no', 'barcode'
         ]
 
     def __init__(self, *args, **kwargs):
@@ -172,6 +175,7 @@ class MedicineUpdateForm(forms.ModelForm):
         
         return cleaned_data
 
+    @transaction.atomic
     def save(self, commit=True):
         instance = super().save(commit=False)
         additional_stock = self.cleaned_data.get('additional_stock', 0)
@@ -190,9 +194,6 @@ class MedicineUpdateForm(forms.ModelForm):
                     total_amount=additional_stock * unit_price,
                     notes=self.cleaned_data.get('purchase_note', 'Additional stock purchase')
                 )
-                
-                # Update stock
-                instance.stock += additional_stock
-                instance.save()
+                # The purchase record adds the stock and refreshes instance
         
         return instance
@@ -0,0 +1,339 @@
+import heapq
+import re
+import threading
+from bisect import bisect_left, insort
+
+# Only the first PREFIX_LENGTH characters of a word get delete variants,
+# which bounds the index size; candidates are verified on the full word
+PREFIX_LENGTH = 7
+# Matches beyond this many medicines are dropped, closest (then best stocked) first
+MAX_CANDIDATES = 500
+
+_WORD = re.compile(r'[a-z0-9]+')
+
+
+def words(text):
+    """Lower-cased alphanumeric words of a name or formula"""
+    return _WORD.findall((text or '').lower())
+
+
+def max_distance(word):
+    """Typos tolerated in a query word; short words must match a prefix exactly"""
+    if len(word) <= 3:
+        return 0
+    if len(word) <= 7:
+        return 1
+    return 2
+
+
+def _deletes(word, distance):
+    """[{word}, {word with one character deleted}, ...] up to distance deletions"""
+    levels = [{word}]
+    for _ in range(distance):
+        levels.append({w[:i] + w[i + 1:] for w in levels[-1] for i in range(len(w))} - levels[-1])
+    return levels
+
+
+def prefix_distance(query, word, limit):
+    """
+    Edit distance (with adjacent transpositions) from query to the closest
+    prefix of word, or limit + 1 once it is known to exceed limit. Only
+    the diagonal band of width 2 * limit + 1 is computed.
+    """
+    word = word[:len(query) + limit]
+    if len(word) < len(query) - limit:
+        return limit + 1
+    over = limit + 1
+    previous = None
+    row = [j if j < over else over for j in range(len(word) + 1)]
+    for i in range(1, len(query) + 1):
+        current = [over] * (len(word) + 1)
+        if i <= limit:
+            current[0] = i
+        best = current[0]
+        char = query[i - 1]
+        for j in range(max(1, i - limit), min(len(word), i + limit) + 1):
+            value = row[j - 1] + (char != word[j - 1])
+            if row[j] + 1 < value:
+                value = row[j] + 1
+            if current[j - 1] + 1 < value:
+                value = current[j - 1] + 1
+            if (
+                i > 1 and j > 1 and char == word[j - 2] and query[i - 2] == word[j - 1]
+                and previous[j - 2] + 1 < value
+            ):
+                value = previous[j - 2] + 1
+            if value > over:
+                value = over
+            current[j] = value
+            if value < best:
+                best = value
+        if best > limit:
+            return over
+        previous, row = row, current
+    return min(row)
+
+
+# Most delete variants belong to a single word, which is then stored as a
+# plain string rather than a set of one to keep the index small
+
+def _link(deletes, variant, word):
+    words = deletes.get(variant)
+    if words is None:
+        deletes[variant] = word
+    elif isinstance(words, str):
+        if words != word:
+            deletes[variant] = {words, word}
+    else:
+        words.add(word)
+
+
+def _unlink(deletes, variant, word):
+    words = deletes.get(variant)
+    if words == word:
+        del deletes[variant]
+    elif isinstance(words, set):
+        words.discard(word)
+        if len(words) == 1:
+            deletes[variant] = words.pop()
+
+
+def _words(deletes, variant):
+    words = deletes.get(variant, ())
+    return (words,) if isinstance(words, str) else words
+
+
+class FuzzyIndex:
+    """
+    In-memory typo-tolerant index over medicine name and formula words.
+
+    Words are looked up by exact prefix (a sorted vocabulary) and, for
+    typos, with symmetric deletes: every word's prefix is stored under
+    all its variants with up to two characters deleted, so a query word
+    only generates its own few variants and probes a dict, instead of
+    comparing against the whole vocabulary.
+
+    Like the barcode index it is built lazily with a single query and
+    kept in sync by the Medicine post_save / post_delete signals. Builds
+    run outside the lock and are swapped in, so searches only wait for
+    the very first one. Stock is kept too, adjusted after every committed
+    stock UPDATE, to choose which of many equally close matches to keep.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        # Bumped by every change, so a build that raced one is not kept
+        self._generation = 0
+        self._reset(None)
+
+    def _reset(self, postings):
+        self._postings = postings
+        self._vocabulary = []
+        # Word prefixes, then their variants with one and two characters deleted
+        self._deletes = ({}, {}, {})
+        self._words_by_id = {}
+        self._stock = {}
+
+    def _load(self):
+        """A fully built index, read from the database without holding the lock"""
+        from .models import Medicine
+
+        fresh = FuzzyIndex()
+        fresh._reset({})
+        for medicine_id, name, formula, stock in Medicine.objects.values_list('id', 'name', 'formula', 'stock'):
+            fresh._add(medicine_id, name, formula, sort=False)
+            fresh._stock[medicine_id] = stock
+        fresh._vocabulary.sort()
+        return fresh
+
+    def _install(self, fresh, generation):
+        """Swap in a loaded index; returns False if the catalog changed meanwhile"""
+        with self._lock:
+            if self._generation != generation:
+                return False
+            self._postings = fresh._postings
+            self._vocabulary = fresh._vocabulary
+            self._deletes = fresh._deletes
+            self._words_by_id = fresh._words_by_id
+            self._stock = fresh._stock
+            return True
+
+    def _ensure_built(self):
+        with self._build_lock:
+            while self._postings is None:
+                generation = self._generation
+                self._install(self._load(), generation)
+
+    def rebuild(self):
+        """
+        Reload the index after bulk writes that bypass signals; searches
+        keep using the previous one until the new one is swapped in.
+        """
+        with self._build_lock:
+            generation = self._generation
+            if not self._install(self._load(), generation):
+                self.invalidate()
+
+    def _add(self, medicine_id, name, formula, sort=True):
+        medicine_words = set(words(name)) | set(words(formula))
+        for word in medicine_words:
+            ids = self._postings.get(word)
+            if ids is None:
+                ids = self._postings[word] = set()
+                if sort:
+                    insort(self._vocabulary, word)
+                else:
+                    self._vocabulary.append(word)
+                for deletes, variants in self._variants(word):
+                    for variant in variants:
+                        _link(deletes, variant, word)
+            ids.add(medicine_id)
+        self._words_by_id[medicine_id] = medicine_words
+
+    def _variants(self, word):
+        """(delete map, variants of word to store in it) pairs"""
+        return zip(self._deletes, _deletes(word[:PREFIX_LENGTH], 2))
+
+    def _remove(self, medicine_id):
+        for word in self._words_by_id.pop(medicine_id, ()):
+            ids = self._postings[word]
+            ids.discard(medicine_id)
+            if ids:
+                continue
+            del self._postings[word]
+            del self._vocabulary[bisect_left(self._vocabulary, word)]
+            for deletes, variants in self._variants(word):
+                for variant in variants:
+                    _unlink(deletes, variant, word)
+
+    def _matches(self, query_word):
+        """{vocabulary word: distance} for one query word"""
+        matches = {}
+        position = bisect_left(self._vocabulary, query_word)
+        while position < len(self._vocabulary) and self._vocabulary[position].startswith(query_word):
+            matches[self._vocabulary[position]] = 0
+            position += 1
+
+        limit = max_distance(query_word)
+        if not limit:
+            return matches
+        levels = _deletes(query_word[:PREFIX_LENGTH], limit)
+        candidates = set()
+        if limit == 1 and len(query_word) <= PREFIX_LENGTH:
+            # A deletion on one side only is exactly one typo away, and
+            # never a prefix match (those were found above)
+            for variant in levels[1]:
+                for word in _words(self._deletes[0], variant):
+                    matches.setdefault(word, 1)
+            for word in _words(self._deletes[1], query_word):
+                matches.setdefault(word, 1)
+            for variant in levels[1]:
+                candidates.update(_words(self._deletes[1], variant))
+        else:
+            for variants in levels:
+                for deletes in self._deletes[:limit + 1]:
+                    for variant in variants:
+                        candidates.update(_words(deletes, variant))
+
+        # Words sharing the compared prefix share the distance
+        distances = {}
+        for word in candidates - matches.keys():
+            prefix = word[:len(query_word) + limit]
+            if prefix not in distances:
+                distances[prefix] = prefix_distance(query_word, prefix, limit)
+            if distances[prefix] <= limit:
+                matches[word] = distances[prefix]
+        return matches
+
+    def search(self, query):
+        """
+        {medicine id: distance} of the medicines matching every word of
+        query, distance being the summed typos. At most MAX_CANDIDATES,
+        closest first and, among equally close ones, best stocked first.
+        """
+        query_words = words(query)
+        if not query_words:
+            return {}
+        if self._postings is None:
+            self._ensure_built()
+        with self._lock:
+            result = None
+            for query_word in query_words:
+                distances = {}
+                # Farthest first, so closer words overwrite with their distance
+                for word, distance in sorted(self._matches(query_word).items(), key=lambda item: -item[1]):
+                    distances.update(dict.fromkeys(self._postings[word], distance))
+                if result is None:
+                    result = distances
+                else:
+                    result = {
+                        medicine_id: distance + distances[medicine_id]
+                        for medicine_id, distance in result.items() if medicine_id in distances
+                    }
+                if not result:
+                    return {}
+            if len(result) > MAX_CANDIDATES:
+                result = self._closest(result)
+        return result
+
+    def _closest(self, result):
+        """The MAX_CANDIDATES closest of result; stock decides within the last distance kept"""
+        by_distance = {}
+        for medicine_id, distance in result.items():
+            by_distance.setdefault(distance, []).append(medicine_id)
+        kept = {}
+        for distance in sorted(by_distance):
+            ids = by_distance[distance]
+            room = MAX_CANDIDATES - len(kept)
+            if len(ids) > room:
+                ids = heapq.nlargest(room, ids, key=lambda medicine_id: self._stock.get(medicine_id, 0))
+            kept.update(dict.fromkeys(ids, distance))
+            if len(kept) >= MAX_CANDIDATES:
+                break
+        return kept
+
+    def update(self, medicine, reindex=True, restock=True):
+        """Take a saved medicine's name and formula words and its stock"""
+        with self._lock:
+            self._generation += 1
+            if self._postings is None:
+                return  # Not built yet; the next search will see fresh data
+            if restock:
+                self._stock[medicine.pk] = medicine.stock
+            if reindex:
+                self._remove(medicine.pk)
+                self._add(medicine.pk, medicine.name, medicine.formula)
+
+    def discard(self, medicine_id):
+        with self._lock:
+            self._generation += 1
+            if self._postings is not None:
+                self._remove(medicine_id)
+                self._stock.pop(medicine_id, None)
+
+    def stock_changed(self, deltas):
+        """
+        Adjust stock by {medicine id: delta} once the current transaction
+        commits, for stock UPDATEs that bypass Medicine.save()
+        """
+        from django.db import transaction
+
+        def adjust():
+            with self._lock:
+                if self._postings is None:
+                    return
+                for medicine_id, delta in deltas.items():
+                    if medicine_id in self._stock:
+                        self._stock[medicine_id] += delta
+
+        transaction.on_commit(adjust)
+
+    def invalidate(self):
+        """Drop the whole index; the next search builds it again"""
+        with self._lock:
+            self._generation += 1
+            self._reset(None)
+
+
+fuzzy_index = FuzzyIndex()
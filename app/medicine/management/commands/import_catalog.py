@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app.medicine import catalog_import
+
+
+class Command(BaseCommand):
+    help = "Create or update medicines from a CSV catalog, upserting on name, company and batch_no"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV file with a header row; see catalog_import.COLUMNS')
+        parser.add_argument('--chunk-size', type=int, default=catalog_import.CHUNK_SIZE,
+                            help='Rows validated and written per transaction')
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['path'], newline='', encoding='utf-8-sig') as f:
+                result = catalog_import.import_catalog(f, chunk_size=options['chunk_size'])
+        except (OSError, catalog_import.CatalogImportError) as e:
+            raise CommandError(str(e))
+
+        for line, error in result['errors']:
+            self.stderr.write(f"Line {line}: {error}")
+        if result['error_count'] > len(result['errors']):
+            self.stderr.write(f"... and {result['error_count'] - len(result['errors'])} more error(s)")
+        self.stdout.write(self.style.SUCCESS(
+            f"Read {result['rows']} row(s): created {result['created']}, updated {result['updated']}, "
+            f"received {result['units']} unit(s), skipped {result['error_count']} invalid row(s)"
+        ))
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+
+from app.medicine.models import Medicine, StockMovement, StockSnapshot
+
+
+class Command(BaseCommand):
+    help = "Compare Medicine.stock with the stock movement ledger"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Record adjustment movements for any difference')
+        parser.add_argument('--snapshot', action='store_true', help='Snapshot every medicine with new movements')
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        mismatches = list(
+            Medicine.objects.with_ledger_stock()
+            .exclude(stock=F('ledger_stock'))
+            .values_list('id', 'name', 'stock', 'ledger_stock')
+        )
+
+        for medicine_id, name, stock, ledger_stock in mismatches:
+            self.stdout.write(f"#{medicine_id} {name}: stock {stock}, ledger {ledger_stock} ({stock - ledger_stock:+d})")
+
+        if mismatches and options['fix']:
+            StockMovement.record([
+                StockMovement(
+                    medicine_id=medicine_id,
+                    kind=StockMovement.ADJUSTMENT,
+                    quantity=stock - ledger_stock,
+                    reference="Reconciliation",
+                )
+                for medicine_id, name, stock, ledger_stock in mismatches
+            ])
+            self.stdout.write(self.style.SUCCESS(f"Recorded {len(mismatches)} adjustment(s)"))
+        elif not mismatches:
+            self.stdout.write(self.style.SUCCESS("Ledger matches current stock"))
+
+        if options['snapshot']:
+            snapshots = StockSnapshot.take(Medicine.objects.values_list('id', flat=True))
+            self.stdout.write(f"Took {len(snapshots)} snapshot(s)")
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.3 on 2026-10-19 07:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medicine', '0006_rename_purchasehistory_purchaserecord_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medicine',
+            name='barcode',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=64, verbose_name='Barcode'),
+        ),
+        migrations.AlterField(
+            model_name='medicine',
+            name='batch_no',
+            field=models.CharField(blank=True, db_index=True, default='', verbose_name='Batch No'),
+        ),
+    ]
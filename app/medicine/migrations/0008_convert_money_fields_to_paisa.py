@@ -0,0 +1,71 @@
+# Converts rupee DecimalFields to integer paisa MoneyFields.
+#
+# Each column is converted by adding a temporary paisa column, copying
+# ROUND(value * 100) into it in one UPDATE, dropping the old column and
+# renaming the new one into place. All steps are reversible.
+
+import app.money
+import django.core.validators
+from django.db import migrations, models
+from django.db.models import BigIntegerField, ExpressionWrapper, F, FloatField, Value
+from django.db.models.functions import Cast, Round
+
+
+def convert_to_paisa(model_name, field_name, decimal_field, money_field):
+    tmp_name = f'{field_name}_paisa'
+
+    def forwards(apps, schema_editor):
+        model = apps.get_model('medicine', model_name)
+        model.objects.update(**{
+            tmp_name: Cast(Round(F(field_name) * 100), BigIntegerField())
+        })
+
+    def backwards(apps, schema_editor):
+        model = apps.get_model('medicine', model_name)
+        model.objects.update(**{
+            field_name: ExpressionWrapper(F(tmp_name) / Value(100.0), output_field=FloatField())
+        })
+
+    return [
+        migrations.AddField(model_name, tmp_name, app.money.MoneyField(default=0)),
+        migrations.RunPython(forwards, backwards),
+        migrations.AlterField(model_name, field_name, decimal_field),
+        migrations.RemoveField(model_name, field_name),
+        migrations.RenameField(model_name, tmp_name, field_name),
+        migrations.AlterField(model_name, field_name, money_field),
+    ]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medicine', '0007_medicine_barcode_alter_medicine_batch_no'),
+    ]
+
+    operations = [
+        *convert_to_paisa(
+            'medicine', 'price',
+            models.DecimalField(decimal_places=2, default=0, max_digits=10, validators=[django.core.validators.MinValueValidator(0)]),
+            app.money.MoneyField(default=0, validators=[django.core.validators.MinValueValidator(0)]),
+        ),
+        *convert_to_paisa(
+            'medicine', 'retailers_price',
+            models.DecimalField(decimal_places=2, default=0, max_digits=10, validators=[django.core.validators.MinValueValidator(0)], verbose_name='Purchase Price (Rs)'),
+            app.money.MoneyField(default=0, validators=[django.core.validators.MinValueValidator(0)], verbose_name='Purchase Price (Rs)'),
+        ),
+        *convert_to_paisa(
+            'medicine', 'packet_price',
+            models.DecimalField(decimal_places=2, default=0, max_digits=10, validators=[django.core.validators.MinValueValidator(0)], verbose_name='Selling Price per Packet (Rs)'),
+            app.money.MoneyField(default=0, validators=[django.core.validators.MinValueValidator(0)], verbose_name='Selling Price per Packet (Rs)'),
+        ),
+        *convert_to_paisa(
+            'purchaserecord', 'unit_price',
+            models.DecimalField(decimal_places=2, default=0, max_digits=10),
+            app.money.MoneyField(),
+        ),
+        *convert_to_paisa(
+            'purchaserecord', 'total_amount',
+            models.DecimalField(decimal_places=2, default=0, max_digits=12),
+            app.money.MoneyField(),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.3 on 2026-10-19 07:25
+
+import app.money
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_purchase_stats(apps, schema_editor):
+    Medicine = apps.get_model('medicine', 'Medicine')
+    PurchaseRecord = apps.get_model('medicine', 'PurchaseRecord')
+
+    purchases = PurchaseRecord.objects.filter(medicine=OuterRef('pk'))
+    totals = purchases.order_by().values('medicine')
+    latest = purchases.order_by('-purchase_date')
+
+    Medicine.objects.update(
+        total_purchased=Coalesce(Subquery(totals.annotate(total=Sum('quantity')).values('total')), 0),
+        total_purchase_amount=Coalesce(Subquery(totals.annotate(total=Sum('total_amount')).values('total')), 0),
+        last_purchase_date=Subquery(latest.values('purchase_date')[:1]),
+        last_purchase_price=Coalesce(Subquery(latest.values('unit_price')[:1]), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medicine', '0008_convert_money_fields_to_paisa'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medicine',
+            name='last_purchase_date',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='medicine',
+            name='last_purchase_price',
+            field=app.money.MoneyField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='medicine',
+            name='total_purchase_amount',
+            field=app.money.MoneyField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='medicine',
+            name='total_purchased',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_purchase_stats, migrations.RunPython.noop),
+    ]
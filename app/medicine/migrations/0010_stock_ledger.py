@@ -0,0 +1,102 @@
+# Generated by Django 5.2.3 on 2026-10-19 07:27
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_ledger(apps, schema_editor):
+    """
+    Rebuild the ledger from purchases, sales and restocked returns, then add
+    one adjustment per medicine so the ledger agrees with the current stock
+    (the old code never recorded deletions or manual edits).
+    """
+    Medicine = apps.get_model('medicine', 'Medicine')
+    PurchaseRecord = apps.get_model('medicine', 'PurchaseRecord')
+    StockMovement = apps.get_model('medicine', 'StockMovement')
+    StockSnapshot = apps.get_model('medicine', 'StockSnapshot')
+    SaleItem = apps.get_model('sales', 'SaleItem')
+    ReturnItem = apps.get_model('sales', 'ReturnItem')
+
+    history = []
+    for medicine_id, quantity, at, pk in PurchaseRecord.objects.values_list(
+        'medicine_id', 'quantity', 'purchase_date', 'pk'
+    ):
+        history.append((at, medicine_id, 'purchase', quantity, f"Purchase #{pk}"))
+    for medicine_id, quantity, at, sale_id in SaleItem.objects.filter(medicine__isnull=False).values_list(
+        'medicine_id', 'quantity', 'sale__sale_date', 'sale_id'
+    ):
+        history.append((at, medicine_id, 'sale', -quantity, f"Sale #{sale_id}"))
+    for medicine_id, quantity, at, return_id in ReturnItem.objects.filter(
+        restocked=True, sale_item__medicine__isnull=False
+    ).values_list('sale_item__medicine_id', 'quantity', 'return_entry__returned_at', 'return_entry_id'):
+        history.append((at, medicine_id, 'return_restock', quantity, f"Return #{return_id}"))
+    history.sort(key=lambda entry: entry[0])
+
+    balances = {}
+    for at, medicine_id, kind, quantity, reference in history:
+        balances[medicine_id] = balances.get(medicine_id, 0) + quantity
+
+    now = timezone.now()
+    for medicine_id, stock in Medicine.objects.values_list('id', 'stock'):
+        difference = stock - balances.get(medicine_id, 0)
+        if difference:
+            history.append((now, medicine_id, 'adjustment', difference, "Opening balance"))
+
+    StockMovement.objects.bulk_create([
+        StockMovement(medicine_id=medicine_id, kind=kind, quantity=quantity, created_at=at, reference=reference)
+        for at, medicine_id, kind, quantity, reference in history
+    ], batch_size=500)
+
+    # One snapshot per medicine at the end of the rebuilt history
+    latest = {}
+    for movement_id, medicine_id, created_at in StockMovement.objects.values_list('id', 'medicine_id', 'created_at'):
+        latest[medicine_id] = (movement_id, created_at)
+    StockSnapshot.objects.bulk_create([
+        StockSnapshot(medicine_id=medicine_id, stock=stock, last_movement_id=latest[medicine_id][0], taken_at=latest[medicine_id][1])
+        for medicine_id, stock in Medicine.objects.values_list('id', 'stock')
+        if medicine_id in latest
+    ], batch_size=500)
+
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medicine', '0009_medicine_purchase_stats'),
+        ('sales', '0023_convert_money_fields_to_paisa'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('purchase', 'Purchase'), ('sale', 'Sale'), ('return_restock', 'Return Restock'), ('sale_deletion', 'Sale Deletion'), ('adjustment', 'Adjustment')], max_length=20)),
+                ('quantity', models.IntegerField()),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('reference', models.CharField(blank=True, default='', max_length=100)),
+                ('medicine', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_movements', to='medicine.medicine')),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['medicine', 'created_at'], name='medicine_st_medicin_d4fce9_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stock', models.IntegerField()),
+                ('last_movement_id', models.BigIntegerField()),
+                ('taken_at', models.DateTimeField()),
+                ('medicine', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_snapshots', to='medicine.medicine')),
+            ],
+            options={
+                'ordering': ['-last_movement_id'],
+                'indexes': [models.Index(fields=['medicine', '-last_movement_id'], name='medicine_st_medicin_729f25_idx'), models.Index(fields=['medicine', '-taken_at'], name='medicine_st_medicin_aec71d_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_ledger, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.3 on 2026-10-19 07:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medicine', '0010_stock_ledger'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='purchaserecord',
+            index=models.Index(fields=['medicine', '-purchase_date'], name='medicine_pu_medicin_47cbe1_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-19 07:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medicine', '0011_purchaserecord_medicine_pu_medicin_47cbe1_idx'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='medicine',
+            name='expiry_date',
+            field=models.DateField(db_index=True),
+        ),
+    ]
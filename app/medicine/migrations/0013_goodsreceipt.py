@@ -0,0 +1,37 @@
+# Generated by Django 5.2.3 on 2026-10-19 08:07
+
+import app.money
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medicine', '0012_alter_medicine_expiry_date'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GoodsReceipt',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('supplier', models.CharField(max_length=100)),
+                ('invoice_number', models.CharField(blank=True, default='', max_length=50)),
+                ('received_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('notes', models.TextField(blank=True)),
+                ('line_count', models.PositiveIntegerField(default=0, editable=False)),
+                ('total_quantity', models.PositiveIntegerField(default=0, editable=False)),
+                ('total_amount', app.money.MoneyField(default=0, editable=False)),
+            ],
+            options={
+                'ordering': ['-received_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='purchaserecord',
+            name='receipt',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='purchases', to='medicine.goodsreceipt'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.3 on 2026-10-19 08:11
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def check_duplicate_batches(apps, schema_editor):
+    """
+    Stop before adding the constraint if medicines already share a name,
+    company and batch number: they are left for the user to merge or
+    correct rather than rewritten here.
+    """
+    Medicine = apps.get_model('medicine', 'Medicine')
+
+    duplicates = (
+        Medicine.objects.exclude(batch_no='')
+        .values('name', 'company', 'batch_no')
+        .annotate(count=Count('id'))
+        .filter(count__gt=1)
+        .order_by('name', 'company', 'batch_no')
+    )
+    conflicts = []
+    for group in duplicates:
+        ids = Medicine.objects.filter(
+            name=group['name'], company=group['company'], batch_no=group['batch_no'],
+        ).order_by('id').values_list('id', flat=True)
+        conflicts.append(
+            f"  {group['name']} / {group['company']} / batch {group['batch_no']}: "
+            f"ids {', '.join(str(pk) for pk in ids)}"
+        )
+    if conflicts:
+        raise RuntimeError(
+            "These medicines share a name, company and batch number. Merge them or "
+            "correct their batch numbers, then run migrate again:\n" + "\n".join(conflicts)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medicine', '0013_goodsreceipt'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicate_batches, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='medicine',
+            constraint=models.UniqueConstraint(condition=models.Q(('batch_no', ''), _negated=True), fields=('name', 'company', 'batch_no'), name='unique_medicine_batch'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.3 on 2026-10-19 08:21
+
+from django.db import migrations, models
+
+from app.medicine.composition import composition_key, tokens
+
+
+def index_compositions(apps, schema_editor):
+    """Derive the composition of every existing medicine and store its tokens"""
+    Medicine = apps.get_model('medicine', 'Medicine')
+    CompositionToken = apps.get_model('medicine', 'CompositionToken')
+
+    medicines = list(Medicine.objects.only('id', 'formula'))
+    for medicine in medicines:
+        medicine.composition = composition_key(medicine.formula)
+    Medicine.objects.bulk_update(medicines, ['composition'], batch_size=500)
+    CompositionToken.objects.bulk_create(
+        [
+            CompositionToken(composition=key, token=token)
+            for key in {medicine.composition for medicine in medicines}
+            for token in tokens(key)
+        ],
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medicine', '0014_medicine_unique_batch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medicine',
+            name='composition',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.CreateModel(
+            name='CompositionToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('composition', models.CharField(max_length=255)),
+                ('token', models.CharField(max_length=255)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('token', 'composition'), name='unique_composition_token')],
+            },
+        ),
+        migrations.RunPython(index_compositions, migrations.RunPython.noop),
+    ]
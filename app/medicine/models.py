@@ -1,10 +1,112 @@
 from django.db import models
+from django.db.models import Case, ExpressionWrapper, F, IntegerField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
 from django.core.validators import MinValueValidator
 from django.core.exceptions import ValidationError
 from django.utils.timezone import now
-from datetime import timedelta
+from datetime import datetime, time, timedelta
 from django.utils import timezone
 from decimal import Decimal
+from app.money import Money, MoneyField
+from . import expiry, pricing
+from .composition import MAX_KEY_LENGTH, composition_key
+from .fuzzy import fuzzy_index
+
+
+class MedicineQuerySet(models.QuerySet):
+    def with_pricing(self):
+        """
+        Annotate the pricing properties in SQL so they can be used in
+        order_by()/filter() and are not recomputed per row in Python.
+        """
+        return self.annotate(
+            purchase_per_unit_price=pricing.PURCHASE_PER_UNIT_PRICE,
+            selling_per_unit_price=pricing.SELLING_PER_UNIT_PRICE,
+            calculated_discount=pricing.CALCULATED_DISCOUNT,
+        ).annotate(
+            selling_price=pricing.SELLING_PRICE,
+        )
+
+    def inventory_value(self):
+        """Stock valued at the current purchase price per unit, summed in SQL"""
+        return self.aggregate(
+            total=Coalesce(
+                Sum(ExpressionWrapper(pricing.PURCHASE_PER_UNIT_PRICE * F('stock'), output_field=MoneyField())),
+                Value(0, output_field=MoneyField()),
+            )
+        )['total']
+
+    def fuzzy_search(self, query):
+        """
+        Medicines whose name/formula words match every word of query as a
+        prefix or within a few typos (see fuzzy), annotated with
+        match_distance and ordered by it, then by stock.
+        """
+        by_distance = {}
+        for medicine_id, distance in fuzzy_index.search(query).items():
+            by_distance.setdefault(distance, []).append(medicine_id)
+        if not by_distance:
+            return self.none()
+        return self.filter(
+            pk__in=[medicine_id for ids in by_distance.values() for medicine_id in ids],
+        ).annotate(
+            match_distance=Case(
+                *[When(pk__in=ids, then=Value(distance)) for distance, ids in sorted(by_distance.items())],
+                output_field=IntegerField(),
+            ),
+        ).order_by('match_distance', '-stock', 'name')
+
+    def with_expiry(self):
+        """Annotate expiry_bucket, is_expired and is_expiring_soon in SQL"""
+        today = timezone.localdate()
+        return self.annotate(expiry_bucket=expiry.bucket_expression(today), **expiry.flag_expressions(today))
+
+    def in_expiry_bucket(self, key):
+        """In-stock medicines in one of expiry.BUCKET_KEYS"""
+        return self.filter(expiry.bucket_q(key))
+
+    def with_ledger_stock(self, as_of=None):
+        """
+        Annotate ledger_stock: stock according to the movement ledger, as of
+        a moment in time (default: now). Reads the latest snapshot at or
+        before that moment plus the movements recorded after it.
+        """
+        snapshots = StockSnapshot.objects.filter(medicine=OuterRef('pk')).order_by('-last_movement_id')
+        movements = StockMovement.objects.filter(medicine=OuterRef('pk'))
+        if as_of is not None:
+            snapshots = snapshots.filter(taken_at__lte=as_of)
+            movements = movements.filter(created_at__lte=as_of)
+
+        return self.annotate(
+            snapshot_stock=Coalesce(Subquery(snapshots.values('stock')[:1]), 0),
+            snapshot_movement_id=Coalesce(Subquery(snapshots.values('last_movement_id')[:1]), 0),
+        ).annotate(
+            ledger_stock=ExpressionWrapper(
+                F('snapshot_stock') + Coalesce(Subquery(
+                    movements.filter(id__gt=OuterRef('snapshot_movement_id'))
+                    .order_by().values('medicine')
+                    .annotate(total=Sum('quantity')).values('total')
+                ), 0),
+                output_field=IntegerField(),
+            ),
+        )
+
+    def as_of(self, when):
+        """
+        Point-in-time inventory: ledger_stock at `when`, the unit_cost paid
+        in the latest purchase up to then (falling back to the current
+        purchase price) and stock_value = ledger_stock * unit_cost.
+        """
+        last_cost = PurchaseRecord.objects.filter(
+            medicine=OuterRef('pk'), purchase_date__lte=when
+        ).order_by('-purchase_date').values('unit_price')[:1]
+
+        return self.filter(created_at__lte=when).with_ledger_stock(when).annotate(
+            unit_cost=Coalesce(Subquery(last_cost), pricing.PURCHASE_PER_UNIT_PRICE, output_field=MoneyField()),
+        ).annotate(
+            stock_value=ExpressionWrapper(F('ledger_stock') * F('unit_cost'), output_field=MoneyField()),
+        )
+
 
 class Medicine(models.Model):
     DISCOUNT_CHOICES = [
@@ -21,28 +123,39 @@ class Medicine(models.Model):
         default='',
         verbose_name="Chemical Formula"
     )
+    # Canonical form of formula (see composition), kept by save()
+    composition = models.CharField(
+        max_length=MAX_KEY_LENGTH,
+        blank=True,
+        default='',
+        db_index=True,
+        editable=False,
+    )
     batch_no = models.CharField(
         blank=True,
         null=False,
         default='',
+        db_index=True,
         verbose_name="Batch No",
     )
-    price = models.DecimalField(
-        max_digits=10,
-        decimal_places=2,
+    barcode = models.CharField(
+        max_length=64,
+        blank=True,
+        null=False,
+        default='',
+        db_index=True,
+        verbose_name="Barcode",
+    )
+    price = MoneyField(
         validators=[MinValueValidator(0)],
         default=0
     )
-    retailers_price = models.DecimalField(
-        max_digits=10,
-        decimal_places=2,
+    retailers_price = MoneyField(
         validators=[MinValueValidator(0)],
         default=0,
         verbose_name="Purchase Price (Rs)"
     )
-    packet_price = models.DecimalField(
-        max_digits=10,
-        decimal_places=2,
+    packet_price = MoneyField(
         validators=[MinValueValidator(0)],
         default=0,
         verbose_name="Selling Price per Packet (Rs)"
@@ -53,7 +166,7 @@ class Medicine(models.Model):
         verbose_name="Units per Packet"
     )
     rack_number = models.CharField(max_length=20)
-    expiry_date = models.DateField()
+    expiry_date = models.DateField(db_index=True)
 
     discount_type = models.CharField(
         max_length=10,
@@ -68,23 +181,73 @@ class Medicine(models.Model):
     )
 
     stock = models.PositiveIntegerField(default=0, verbose_name="Current Stock")
+
+    # Purchase statistics, kept up to date by PurchaseRecord.save() so the
+    # purchases dashboard never has to aggregate the purchase history.
+    total_purchased = models.PositiveIntegerField(default=0, editable=False)
+    total_purchase_amount = MoneyField(default=0, editable=False)
+    last_purchase_date = models.DateTimeField(null=True, blank=True, editable=False)
+    last_purchase_price = MoneyField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = MedicineQuerySet.as_manager()
+
+    # Fields feeding the composition and search indexes
+    SEARCH_FIELDS = ('name', 'formula')
+
+    class Meta:
+        constraints = [
+            # Catalog import key; medicines without a batch number may repeat
+            models.UniqueConstraint(
+                fields=['name', 'company', 'batch_no'],
+                condition=~models.Q(batch_no=''),
+                name='unique_medicine_batch',
+            ),
+        ]
+
     def __str__(self):
         return self.name
 
-    @property
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_search_fields = {
+            field: value for field, value in zip(field_names, values) if field in cls.SEARCH_FIELDS
+        }
+        return instance
+
+    def save(self, *args, **kwargs):
+        deferred = self.get_deferred_fields()
+        if 'formula' not in deferred:
+            self.composition = composition_key(self.formula)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'formula' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'composition'}
+
+        # Which search fields differ from the database, for the signals
+        # that reindex them; stock-only saves change none
+        loaded = getattr(self, '_loaded_search_fields', {})
+        self.changed_search_fields = {
+            field for field in self.SEARCH_FIELDS
+            if field not in deferred and (self._state.adding or loaded.get(field) != getattr(self, field))
+        }
+        super().save(*args, **kwargs)
+        self._loaded_search_fields = {
+            field: getattr(self, field) for field in self.SEARCH_FIELDS if field not in deferred
+        }
+
+    @pricing.annotated_property
     def purchase_per_unit_price(self):
         if self.units_per_box:
-            return round(self.retailers_price / self.units_per_box, 2)
-        return 0
+            return self.retailers_price / self.units_per_box
+        return Money.ZERO
 
-    @property
+    @pricing.annotated_property
     def selling_per_unit_price(self):
         if self.units_per_box:
-            return round(self.packet_price / self.units_per_box, 2)
-        return 0
+            return self.packet_price / self.units_per_box
+        return Money.ZERO
 
     def clean(self):
         if self.discount_type == 'flat' and self.discount > self.packet_price:
@@ -96,62 +259,336 @@ class Medicine(models.Model):
         if self.units_per_box and self.packet_price:
             self.price = self.packet_price / self.units_per_box
 
-    @property
+    @pricing.annotated_property
     def calculated_discount(self):
-        return (self.price * self.discount) / 100 if self.discount_type == 'percent' else self.discount
+        return self.price.percent(self.discount) if self.discount_type == 'percent' else Money.coerce(self.discount)
 
-    @property
+    @pricing.annotated_property
     def selling_price(self):
         return self.price - self.calculated_discount
 
     def get_discount_display(self):
         return f"{self.discount}%" if self.discount_type == 'percent' else f"₹{self.discount}"
 
-    @property
+    @pricing.annotated_property
     def is_expired(self):
-        return self.expiry_date < now().date()
+        return self.expiry_date < timezone.localdate()
 
-    @property
+    @pricing.annotated_property
     def is_expiring_soon(self):
         if self.stock <= 0 or self.is_expired:  # Explicitly exclude expired and out-of-stock
             return False
-        threshold = now().date() + timedelta(days=120)
+        threshold = timezone.localdate() + timedelta(days=expiry.EXPIRING_SOON_DAYS)
         return self.expiry_date <= threshold
 
-    @property
-    def total_purchased(self):
-        return sum(purchase.quantity for purchase in self.purchases.all())
-
-    @property
-    def total_purchase_amount(self):
-        return sum(purchase.total_amount for purchase in self.purchases.all())
-
     @property
     def last_purchase(self):
         return self.purchases.order_by('-purchase_date').first()
 
 
+class CompositionToken(models.Model):
+    """A salt word or strength token of a composition key, for formula search"""
+    composition = models.CharField(max_length=MAX_KEY_LENGTH)
+    token = models.CharField(max_length=MAX_KEY_LENGTH)
+
+    class Meta:
+        constraints = [
+            # Also the index token searches range over
+            models.UniqueConstraint(fields=['token', 'composition'], name='unique_composition_token'),
+        ]
+
+    def __str__(self):
+        return f"{self.token} ({self.composition})"
+
+
+class GoodsReceipt(models.Model):
+    """One supplier delivery, received as a batch of PurchaseRecords"""
+    supplier = models.CharField(max_length=100)
+    invoice_number = models.CharField(max_length=50, blank=True, default='')
+    received_at = models.DateTimeField(default=timezone.now, db_index=True)
+    notes = models.TextField(blank=True)
+
+    # Totals over the receipt's purchase records
+    line_count = models.PositiveIntegerField(default=0, editable=False)
+    total_quantity = models.PositiveIntegerField(default=0, editable=False)
+    total_amount = MoneyField(default=0, editable=False)
+
+    class Meta:
+        ordering = ['-received_at']
+
+    def __str__(self):
+        return f"{self.supplier} {self.invoice_number}".strip()
+
+    @classmethod
+    def receive(cls, supplier, lines, invoice_number='', notes=''):
+        """
+        Receive a delivery of (medicine_id, quantity, unit_price) lines in one
+        transaction: one INSERT for the receipt, one bulk INSERT for the
+        purchase records and one UPDATE raising the stock and purchase
+        statistics of every medicine, however many lines there are.
+        Raises ValueError for unknown medicines or non-positive quantities.
+        """
+        from django.db import transaction
+
+        lines = [(medicine_id, quantity, Money.coerce(unit_price)) for medicine_id, quantity, unit_price in lines]
+        if not lines:
+            raise ValueError("A goods receipt needs at least one line")
+        if any(quantity <= 0 for _, quantity, _ in lines):
+            raise ValueError("Received quantities must be positive")
+
+        with transaction.atomic():
+            medicine_ids = {medicine_id for medicine_id, _, _ in lines}
+            found = set(Medicine.objects.select_for_update().filter(pk__in=medicine_ids).values_list('pk', flat=True))
+            if found != medicine_ids:
+                missing = ', '.join(str(medicine_id) for medicine_id in sorted(medicine_ids - found))
+                raise ValueError(f"Unknown medicine ids: {missing}")
+
+            receipt = cls.objects.create(
+                supplier=supplier,
+                invoice_number=invoice_number,
+                notes=notes,
+                line_count=len(lines),
+                total_quantity=sum(quantity for _, quantity, _ in lines),
+                total_amount=sum((unit_price * quantity for _, quantity, unit_price in lines), Money.ZERO),
+            )
+            note = f"{supplier} invoice {invoice_number}" if invoice_number else supplier
+            records = PurchaseRecord.objects.bulk_create([
+                PurchaseRecord(
+                    medicine_id=medicine_id,
+                    receipt=receipt,
+                    quantity=quantity,
+                    unit_price=unit_price,
+                    total_amount=unit_price * quantity,
+                    notes=note,
+                )
+                for medicine_id, quantity, unit_price in lines
+            ])
+            PurchaseRecord.apply(records)
+        return receipt
+
+
 class PurchaseRecord(models.Model):
     medicine = models.ForeignKey(
         Medicine,
         on_delete=models.CASCADE,
         related_name='purchases'
     )
+    receipt = models.ForeignKey(
+        GoodsReceipt,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='purchases'
+    )
     quantity = models.PositiveIntegerField()
-    unit_price = models.DecimalField(max_digits=10, decimal_places=2)
-    total_amount = models.DecimalField(max_digits=12, decimal_places=2)
+    unit_price = MoneyField()
+    total_amount = MoneyField()
     purchase_date = models.DateTimeField(auto_now_add=True)
     notes = models.TextField(blank=True)
 
+    PURCHASE_STAT_FIELDS = ['total_purchased', 'total_purchase_amount', 'last_purchase_date', 'last_purchase_price']
+
     class Meta:
         ordering = ['-purchase_date']
         verbose_name_plural = "Purchase Records"
+        indexes = [
+            models.Index(fields=['medicine', '-purchase_date']),
+        ]
 
     def save(self, *args, **kwargs):
-        self.total_amount = self.quantity * self.unit_price
+        self.total_amount = self.unit_price * self.quantity
+        adding = self._state.adding
         super().save(*args, **kwargs)
-        
-        # Update medicine stock when purchase is created
-        if not self.pk:  # Only on creation
-            self.medicine.stock += self.quantity
-            self.medicine.save()
\ No newline at end of file
+
+        if adding:
+            self.apply([self])
+            # Callers keep using the loaded medicine, so keep it in step
+            # with the row we just updated.
+            self.medicine.refresh_from_db(fields=['stock', 'updated_at', *self.PURCHASE_STAT_FIELDS])
+
+    @classmethod
+    def apply(cls, records, counted=()):
+        """
+        Add saved purchase records to their medicines' stock and running
+        statistics in one F()-based UPDATE and record the stock movements.
+        The batch's latest purchase date and, per medicine, the last
+        record's unit price become the last purchase date and price.
+        Medicines whose ids are in `counted` already include their records
+        (e.g. they were inserted with them) and only get the movements.
+        """
+        totals = {}
+        for record in records:
+            if record.medicine_id in counted:
+                continue
+            quantity, amount, _ = totals.get(record.medicine_id, (0, 0, 0))
+            totals[record.medicine_id] = (
+                quantity + record.quantity, amount + record.total_amount.paisa, record.unit_price.paisa,
+            )
+
+        def per_medicine(position):
+            # One When per distinct value; every updated row has one, so
+            # no default is needed. Money goes in as raw paisa.
+            ids_by_value = {}
+            for medicine_id, values in totals.items():
+                ids_by_value.setdefault(values[position], []).append(medicine_id)
+            return Case(*[When(pk__in=ids, then=Value(value)) for value, ids in ids_by_value.items()])
+
+        if totals:
+            Medicine.objects.filter(pk__in=totals).update(
+                stock=F('stock') + per_medicine(0),
+                total_purchased=F('total_purchased') + per_medicine(0),
+                total_purchase_amount=F('total_purchase_amount') + per_medicine(1),
+                last_purchase_date=max(record.purchase_date for record in records),
+                last_purchase_price=per_medicine(2),
+                updated_at=timezone.now(),
+            )
+            fuzzy_index.stock_changed({medicine_id: values[0] for medicine_id, values in totals.items()})
+        return StockMovement.record([
+            StockMovement(
+                medicine_id=record.medicine_id,
+                kind=StockMovement.PURCHASE,
+                quantity=record.quantity,
+                created_at=record.purchase_date,
+                reference=f"Purchase #{record.pk}",
+            )
+            for record in records
+        ])
+
+
+class StockMovement(models.Model):
+    """
+    Append-only ledger of every change to Medicine.stock.
+
+    quantity is signed: positive for stock coming in, negative for stock
+    going out. Rows are written with StockMovement.record() alongside the
+    stock update they describe and are never edited afterwards.
+    """
+    PURCHASE = 'purchase'
+    SALE = 'sale'
+    RETURN_RESTOCK = 'return_restock'
+    SALE_DELETION = 'sale_deletion'
+    ADJUSTMENT = 'adjustment'
+    KIND_CHOICES = [
+        (PURCHASE, 'Purchase'),
+        (SALE, 'Sale'),
+        (RETURN_RESTOCK, 'Return Restock'),
+        (SALE_DELETION, 'Sale Deletion'),
+        (ADJUSTMENT, 'Adjustment'),
+    ]
+
+    # Take a new snapshot once a medicine has this many movements after its
+    # latest one, or on its first movement of a new day, so balance queries
+    # only ever sum a day's worth of rows (at most this many).
+    SNAPSHOT_INTERVAL = 50
+
+    medicine = models.ForeignKey(Medicine, on_delete=models.CASCADE, related_name='stock_movements')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    quantity = models.IntegerField()
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+    reference = models.CharField(max_length=100, blank=True, default='')
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['medicine', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} {self.quantity:+d} ({self.medicine_id})"
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("Stock movements are append-only")
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def record(cls, movements):
+        """
+        Bulk insert movements (unsaved instances) and snapshot any medicine
+        that has gone SNAPSHOT_INTERVAL movements without one. Call inside
+        the transaction that changes the stock itself.
+        """
+        movements = [movement for movement in movements if movement.quantity]
+        if not movements:
+            return []
+        created = cls.objects.bulk_create(movements)
+        StockSnapshot.take_due({movement.medicine_id for movement in movements})
+        expiry.invalidate()
+        return created
+
+    @classmethod
+    def apply(cls, movements):
+        """
+        Change the stock of every medicine by the sum of its movements in one
+        UPDATE, then record() them. For stock-only changes that need no
+        Medicine.save(); in-memory Medicine instances are not refreshed.
+        """
+        deltas = {}
+        for movement in movements:
+            deltas[movement.medicine_id] = deltas.get(movement.medicine_id, 0) + movement.quantity
+        deltas = {medicine_id: delta for medicine_id, delta in deltas.items() if delta}
+        if deltas:
+            Medicine.objects.filter(pk__in=deltas).update(
+                stock=F('stock') + Case(
+                    *[When(pk=medicine_id, then=Value(delta)) for medicine_id, delta in deltas.items()],
+                    default=Value(0),
+                ),
+                updated_at=timezone.now(),
+            )
+            fuzzy_index.stock_changed(deltas)
+        return cls.record(movements)
+
+
+class StockSnapshot(models.Model):
+    """Ledger balance of one medicine after a given movement"""
+    medicine = models.ForeignKey(Medicine, on_delete=models.CASCADE, related_name='stock_snapshots')
+    stock = models.IntegerField()
+    last_movement_id = models.BigIntegerField()
+    taken_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['-last_movement_id']
+        indexes = [
+            models.Index(fields=['medicine', '-last_movement_id']),
+            models.Index(fields=['medicine', '-taken_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.medicine_id}: {self.stock} @ {self.taken_at:%Y-%m-%d %H:%M}"
+
+    @classmethod
+    def take(cls, medicine_ids, only_due=False):
+        """Snapshot the current ledger balance of the given medicines"""
+        latest_movements = StockMovement.objects.filter(medicine=OuterRef('pk')).order_by('-id')
+        medicines = Medicine.objects.filter(pk__in=medicine_ids).with_ledger_stock().annotate(
+            latest_movement_id=Subquery(latest_movements.values('id')[:1]),
+            latest_movement_at=Subquery(latest_movements.values('created_at')[:1]),
+        ).filter(latest_movement_id__gt=F('snapshot_movement_id'))
+        if only_due:
+            pending = StockMovement.objects.filter(
+                medicine=OuterRef('pk'), id__gt=OuterRef('snapshot_movement_id')
+            ).order_by().values('medicine').annotate(count=models.Count('id')).values('count')
+            today_start = timezone.make_aware(datetime.combine(timezone.localdate(), time.min))
+            snapshots = cls.objects.filter(medicine=OuterRef('pk')).order_by('-last_movement_id')
+            medicines = medicines.annotate(
+                pending=Subquery(pending),
+                snapshot_taken_at=Subquery(snapshots.values('taken_at')[:1]),
+            ).filter(
+                models.Q(pending__gte=StockMovement.SNAPSHOT_INTERVAL)
+                | models.Q(snapshot_taken_at__lt=today_start)
+                | models.Q(snapshot_taken_at__isnull=True)
+            )
+
+        return cls.objects.bulk_create([
+            cls(
+                medicine_id=row['id'],
+                stock=row['ledger_stock'],
+                last_movement_id=row['latest_movement_id'],
+                taken_at=row['latest_movement_at'],
+            )
+            for row in medicines.values('id', 'ledger_stock', 'latest_movement_id', 'latest_movement_at')
+        ])
+
+    @classmethod
+    def take_due(cls, medicine_ids):
+        return cls.take(medicine_ids, only_due=True)
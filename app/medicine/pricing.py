@@ -0,0 +1,96 @@
+"""
+Database-side versions of the Medicine pricing properties.
+
+Each expression mirrors the Python property of the same name on Medicine,
+including the half-even rounding to whole paisa that Money uses, so a row
+priced in SQL and the same row priced in Python always agree. Use them
+through Medicine.objects.with_pricing(), which lets listings sort and
+filter on selling price or discount without per-row Python work.
+"""
+from django.core.cache import cache
+from django.db.models import BigIntegerField, Case, ExpressionWrapper, F, Value, When
+from django.db.models.functions import Cast, Round
+from django.db.models.lookups import Exact, GreaterThan
+
+from app.money import MoneyField
+
+
+def round_div(numerator, denominator):
+    """SQL integer division rounded half-even (non-negative operands)"""
+    quotient = Cast(numerator / denominator, BigIntegerField())
+    twice_remainder = (numerator - quotient * denominator) * 2
+    return Case(
+        When(GreaterThan(twice_remainder, denominator), then=quotient + 1),
+        When(
+            Exact(twice_remainder, denominator) & Exact(quotient - quotient / 2 * 2, 1),
+            then=quotient + 1,
+        ),
+        default=quotient,
+        output_field=MoneyField(),
+    )
+
+
+def per_unit(amount):
+    """Packet amount (expression, in paisa) divided over units_per_box"""
+    return Case(
+        When(units_per_box__gt=0, then=round_div(amount, F('units_per_box'))),
+        default=Value(0),
+        output_field=MoneyField(),
+    )
+
+
+# discount has two decimal places, so x100 is exact: basis points or paisa
+DISCOUNT_HUNDREDTHS = Cast(Round(F('discount') * 100), BigIntegerField())
+
+PURCHASE_PER_UNIT_PRICE = per_unit(F('retailers_price'))
+
+SELLING_PER_UNIT_PRICE = per_unit(F('packet_price'))
+
+CALCULATED_DISCOUNT = Case(
+    When(discount_type='percent', then=round_div(F('price') * DISCOUNT_HUNDREDTHS, Value(10000))),
+    default=DISCOUNT_HUNDREDTHS,
+    output_field=MoneyField(),
+)
+
+SELLING_PRICE = ExpressionWrapper(F('price') - F('calculated_discount'), output_field=MoneyField())
+
+
+# Bumped by bulk price changes (repricing, catalog imports) so clients that
+# hold the whole catalog know to fetch it again. Single edits are already
+# covered by updated_at, which keys the lookup cache.
+CATALOG_VERSION_KEY = 'medicine:catalog-version'
+
+
+def catalog_version():
+    return cache.get_or_set(CATALOG_VERSION_KEY, 0, timeout=None)
+
+
+def bump_catalog_version():
+    try:
+        return cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        cache.set(CATALOG_VERSION_KEY, 1, timeout=None)
+        return 1
+
+
+class annotated_property:
+    """
+    A computed property that yields to a queryset annotation of the same
+    name when one was loaded, and computes the value in Python otherwise.
+    """
+
+    def __init__(self, func):
+        self.func = func
+        self.name = func.__name__
+        self.__doc__ = func.__doc__
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        try:
+            return instance.__dict__[self.name]
+        except KeyError:
+            return self.func(instance)
+
+    def __set__(self, instance, value):
+        instance.__dict__[self.name] = value
@@ -0,0 +1,149 @@
+"""
+Bulk repricing of medicines.
+
+A repricing applies a percentage or flat (rupee) change to packet_price,
+retailers_price and/or discount of every medicine matching a company,
+formula or rack filter. The new values are SQL expressions over the
+current row, so preview() (one SELECT annotating them) and apply() (one
+UPDATE setting them) always agree, and price is derived from the new
+packet price in the same statement, as Medicine.clean() would.
+
+Money is changed in whole paisa and discounts in hundredths, both with
+the half-even rounding Money uses.
+"""
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Case, DecimalField, ExpressionWrapper, F, FloatField, Value, When
+from django.db.models.functions import Cast, Greatest, Least
+from django.utils import timezone
+
+from app.money import Money, MoneyField
+from . import expiry, pricing
+from .models import Medicine
+
+FIELDS = ('packet_price', 'retailers_price', 'discount')
+MODES = ('percent', 'flat')
+FILTERS = ('company', 'formula', 'rack_number')
+PREVIEW_LIMIT = 200
+
+
+def parse_change(mode, amount):
+    """(mode, Decimal amount) for one field, or None when amount is blank; raises ValueError"""
+    amount = (amount or '').strip()
+    if not amount:
+        return None
+    if mode not in MODES:
+        raise ValueError("Change must be a percent or a flat amount")
+    try:
+        amount = Decimal(amount).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        raise ValueError(f"{amount} is not a number")
+    if mode == 'percent' and amount < -100:
+        raise ValueError("A percentage change cannot go below -100%")
+    return mode, amount
+
+
+def matching(company='', formula='', rack_number=''):
+    """Medicines matching every given filter, case-insensitively"""
+    filters = {
+        f'{name}__iexact': value.strip()
+        for name, value in (('company', company), ('formula', formula), ('rack_number', rack_number))
+        if value and value.strip()
+    }
+    if not filters:
+        raise ValueError("Choose a company, formula or rack to reprice")
+    return Medicine.objects.filter(**filters)
+
+
+def _scaled(amount, percent):
+    """Non-negative integer amount scaled by percent, rounded half-even"""
+    return pricing.round_div(amount * Value(10000 + int(percent * 100)), Value(10000))
+
+
+def _money(field, mode, amount):
+    if mode == 'percent':
+        return _scaled(F(field), amount)
+    return Greatest(
+        ExpressionWrapper(F(field) + Value(Money.coerce(amount).paisa), output_field=MoneyField()),
+        Value(0),
+        output_field=MoneyField(),
+    )
+
+
+def _discount(mode, amount, packet_price):
+    hundredths = pricing.DISCOUNT_HUNDREDTHS
+    if mode is None:
+        pass
+    elif mode == 'percent':
+        hundredths = _scaled(hundredths, amount)
+    else:
+        hundredths = Greatest(
+            ExpressionWrapper(hundredths + Value(int(amount * 100)), output_field=MoneyField()),
+            Value(0),
+            output_field=MoneyField(),
+        )
+    # Flat discounts stay within the packet price (paisa are hundredths
+    # of a rupee too), percentages within 100%
+    hundredths = Case(
+        When(discount_type='flat', then=Least(hundredths, packet_price, output_field=MoneyField())),
+        default=Least(hundredths, Value(10000), output_field=MoneyField()),
+        output_field=MoneyField(),
+    )
+    return ExpressionWrapper(
+        Cast(hundredths, FloatField()) / Value(100.0),
+        output_field=DecimalField(max_digits=10, decimal_places=2),
+    )
+
+
+def new_values(changes):
+    """
+    {field: expression} for the changed fields plus price, from changes
+    {field: (mode, amount)} as returned by parse_change().
+    """
+    values = {
+        field: _money(field, *changes[field])
+        for field in ('packet_price', 'retailers_price') if changes.get(field)
+    }
+    packet_price = values.get('packet_price', F('packet_price'))
+    if changes.get('discount') or 'packet_price' in values:
+        # A lower packet price also caps the flat discounts
+        values['discount'] = _discount(*(changes.get('discount') or (None, None)), packet_price)
+    if 'packet_price' in values:
+        values['price'] = pricing.per_unit(packet_price)
+    return values
+
+
+def preview(queryset, changes, limit=PREVIEW_LIMIT):
+    """
+    (rows, count): old and new values of the first `limit` matching
+    medicines by name, and how many medicines match in total.
+    """
+    values = new_values(changes)
+    fields = [field for field in FIELDS + ('price',) if field in values]
+    rows = (
+        queryset
+        .annotate(**{f'new_{field}': expression for field, expression in values.items()})
+        .order_by('name', 'id')
+        .values('id', 'name', 'company', 'batch_no', *fields, *[f'new_{field}' for field in fields])
+        [:limit]
+    )
+    return [
+        dict(row, changes=[
+            (field, row[field], row[f'new_{field}'])
+            for field in fields if row[field] != row[f'new_{field}']
+        ])
+        for row in rows
+    ], queryset.count()
+
+
+def apply(queryset, changes):
+    """Reprice every matching medicine in one UPDATE; returns how many changed"""
+    values = new_values(changes)
+    if not values:
+        return 0
+    updated = queryset.update(**values, updated_at=timezone.now())
+    if updated:
+        # Stock value uses the purchase price, and clients hold the old prices
+        expiry.invalidate()
+        pricing.bump_catalog_version()
+    return updated
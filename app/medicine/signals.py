@@ -0,0 +1,41 @@
+# medicine/signals.py
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import Medicine
+from .barcodes import barcode_index
+from .fuzzy import fuzzy_index
+from . import composition, expiry
+
+@receiver(post_save, sender=Medicine)
+def update_barcode_index_on_save(sender, instance, **kwargs):
+    """Keep the in-memory scan index in sync with medicine codes"""
+    barcode_index.update(instance)
+
+@receiver(post_delete, sender=Medicine)
+def update_barcode_index_on_delete(sender, instance, **kwargs):
+    """Drop deleted medicines from the in-memory scan index"""
+    barcode_index.discard(instance.pk)
+
+@receiver([post_save, post_delete], sender=Medicine)
+def invalidate_expiry_summary(sender, instance, **kwargs):
+    """Stock or expiry date may have changed, recompute the buckets lazily"""
+    expiry.invalidate()
+
+@receiver(post_save, sender=Medicine)
+def index_composition_on_save(sender, instance, **kwargs):
+    """Store the search tokens of a new or changed composition"""
+    if 'formula' in getattr(instance, 'changed_search_fields', Medicine.SEARCH_FIELDS):
+        composition.index([instance.composition])
+
+@receiver(post_save, sender=Medicine)
+def update_fuzzy_index_on_save(sender, instance, update_fields=None, **kwargs):
+    """Keep the in-memory search index in sync with names, formulas and stock"""
+    reindex = bool(getattr(instance, 'changed_search_fields', Medicine.SEARCH_FIELDS))
+    restock = update_fields is None or 'stock' in update_fields
+    if reindex or restock:
+        fuzzy_index.update(instance, reindex=reindex, restock=restock)
+
+@receiver(post_delete, sender=Medicine)
+def update_fuzzy_index_on_delete(sender, instance, **kwargs):
+    """Drop deleted medicines from the in-memory search index"""
+    fuzzy_index.discard(instance.pk)
@@ -1,3 +1,734 @@
+import json
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Sum
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from app.money import Money
+
+from . import catalog_import, composition, fuzzy, repricing
+from .composition import components, composition_key
+from .expiry import BUCKET_KEYS
+from .fuzzy import FuzzyIndex, prefix_distance
+from .models import CompositionToken, GoodsReceipt, Medicine, PurchaseRecord, StockMovement, StockSnapshot
+
+
+def make_medicine(name='Panadol', formula='', stock=10, **fields):
+    values = {
+        'company': 'Acme', 'rack_number': 'A1', 'units_per_box': 10,
+        'packet_price': Money.coerce(100), 'retailers_price': Money.coerce(90),
+        'price': Money.coerce(10), 'expiry_date': '2030-01-01',
+    }
+    values.update(fields)
+    return Medicine.objects.create(name=name, formula=formula, stock=stock, **values)
+
+
+def as_money(value):
+    """Money from a JSON amount"""
+    return Money.coerce(str(value))
+
+
+class MedicineLookupTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.panadol = make_medicine('Panadol', stock=5)
+        self.brufen = make_medicine('Brufen', rack_number='B2', batch_no='BR-1')
+
+    def lookup(self, ids):
+        return self.client.get(reverse('medicine_lookup'), {'ids': ids})
+
+    def test_results_follow_the_requested_order(self):
+        data = self.lookup(f'{self.brufen.pk},999999,{self.panadol.pk}').json()
+        self.assertEqual([result['id'] for result in data['results']], [self.brufen.pk, self.panadol.pk])
+        brufen = data['results'][0]
+        self.assertEqual((brufen['rack_number'], brufen['batch_no']), ('B2', 'BR-1'))
+        self.assertEqual(as_money(brufen['packet_price']), Money.coerce(100))
+        self.assertEqual(as_money(brufen['purchase_per_unit_price']), Money.coerce(9))
+
+    def test_rejects_non_integer_ids(self):
+        self.assertEqual(self.lookup('1,x').status_code, 400)
+
+    def test_saving_a_medicine_refreshes_its_entry(self):
+        self.lookup(str(self.panadol.pk))
+        self.panadol.stock = 7
+        self.panadol.save()
+        self.assertEqual(self.lookup(str(self.panadol.pk)).json()['results'][0]['stock'], 7)
+
+    def test_expiry_flags_follow_the_date(self):
+        self.panadol.expiry_date = timezone.localdate() + timedelta(days=1)
+        self.panadol.save()
+        self.assertFalse(self.lookup(str(self.panadol.pk)).json()['results'][0]['is_expired'])
+
+        later = timezone.localdate() + timedelta(days=2)
+        with mock.patch('django.utils.timezone.localdate', return_value=later):
+            self.assertTrue(self.lookup(str(self.panadol.pk)).json()['results'][0]['is_expired'])
+
+
+class PricingAnnotationTests(TestCase):
+    PRICED = ('purchase_per_unit_price', 'selling_per_unit_price', 'calculated_discount', 'selling_price')
+
+    def test_sql_matches_python_including_half_even_rounding(self):
+        cases = [
+            # retailers, packet price (paisa), units, discount type, discount
+            (Money(1000), Money(1250), 4, 'percent', Decimal('12.5')),
+            (Money(999), Money(1001), 2, 'percent', Decimal('50')),
+            (Money(1500), Money(3000), 4, 'percent', Decimal('0.5')),
+            (Money(700), Money(700), 3, 'flat', Decimal('1.25')),
+            (Money(0), Money(0), 1, 'percent', Decimal('0')),
+        ]
+        for index, (retailers, packet, units, discount_type, discount) in enumerate(cases):
+            make_medicine(
+                f'Case {index}', retailers_price=retailers, packet_price=packet, units_per_box=units,
+                price=packet / units, discount_type=discount_type, discount=discount,
+            )
+
+        for annotated in Medicine.objects.with_pricing():
+            plain = Medicine.objects.get(pk=annotated.pk)
+            for name in self.PRICED:
+                self.assertIn(name, annotated.__dict__)
+                self.assertEqual(annotated.__dict__[name], getattr(plain, name), f'{plain.name} {name}')
+                self.assertIs(type(annotated.__dict__[name]), Money)
+
+    def test_sort_and_filter_on_selling_price(self):
+        make_medicine('Cheap', price=Money.coerce(5))
+        make_medicine('Discounted', price=Money.coerce(20), discount=Decimal('80'))
+        make_medicine('Dear', price=Money.coerce(30))
+        names = list(Medicine.objects.with_pricing().order_by('selling_price').values_list('name', flat=True))
+        self.assertEqual(names, ['Discounted', 'Cheap', 'Dear'])
+        self.assertEqual(
+            list(Medicine.objects.with_pricing().filter(selling_price__gt=Money.coerce(10)).values_list('name', flat=True)),
+            ['Dear'],
+        )
+
+
+class PurchaseStatisticsTests(TestCase):
+    def setUp(self):
+        self.panadol = make_medicine('Panadol', stock=0)
+        self.brufen = make_medicine('Brufen', stock=0)
+        make_medicine('Calpol', stock=0)
+        PurchaseRecord.objects.create(medicine=self.panadol, quantity=10, unit_price=Money.coerce(2))
+        PurchaseRecord.objects.create(medicine=self.panadol, quantity=5, unit_price=Money.coerce(3))
+        PurchaseRecord.objects.create(medicine=self.brufen, quantity=1, unit_price=Money.coerce(50))
+
+    def search(self, **params):
+        return self.client.get(reverse('search_purchases'), params).json()
+
+    def test_purchases_keep_statistics_on_medicine(self):
+        self.panadol.refresh_from_db()
+        self.assertEqual(self.panadol.stock, 15)
+        self.assertEqual(self.panadol.total_purchased, 15)
+        self.assertEqual(self.panadol.total_purchase_amount, Money.coerce(35))
+        self.assertEqual(self.panadol.last_purchase_price, Money.coerce(3))
+        self.assertIsNotNone(self.panadol.last_purchase_date)
+
+    def test_pages_and_sorting(self):
+        data = self.search(sort='-total_purchase_amount', page_size=2)
+        self.assertEqual([row['name'] for row in data['data']], ['Brufen', 'Panadol'])
+        self.assertEqual((data['total'], data['num_pages']), (3, 2))
+        self.assertEqual(as_money(data['data'][1]['total_purchase_amount']), Money.coerce(35))
+
+        data = self.search(sort='-total_purchase_amount', page_size=2, page=2)
+        self.assertEqual([row['name'] for row in data['data']], ['Calpol'])
+
+    def test_query_filters_rows(self):
+        data = self.search(query='pana')
+        self.assertEqual([row['name'] for row in data['data']], ['Panadol'])
+        self.assertEqual(data['total'], 1)
+
+    def test_page_past_the_end_still_counts_matches(self):
+        data = self.search(page_size=2, page=5)
+        self.assertEqual(data['data'], [])
+        self.assertEqual((data['total'], data['num_pages']), (3, 2))
+
+    def test_bad_paging(self):
+        self.assertEqual(self.client.get(reverse('search_purchases'), {'page': 'x'}).status_code, 400)
+
+
+class StockLedgerTests(TestCase):
+    def setUp(self):
+        self.panadol = make_medicine('Panadol', stock=0)
+        PurchaseRecord.objects.create(medicine=self.panadol, quantity=20, unit_price=Money.coerce(2))
+
+    def ledger_stock(self, medicine=None, as_of=None):
+        medicine = medicine or self.panadol
+        return Medicine.objects.with_ledger_stock(as_of).get(pk=medicine.pk).ledger_stock
+
+    def move(self, quantity, kind=StockMovement.SALE):
+        StockMovement.apply([StockMovement(medicine=self.panadol, kind=kind, quantity=quantity)])
+
+    def test_movements_change_stock_and_ledger_together(self):
+        self.move(-3)
+        self.move(-4)
+        self.move(2, StockMovement.RETURN_RESTOCK)
+        self.panadol.refresh_from_db()
+        self.assertEqual(self.panadol.stock, 15)
+        self.assertEqual(self.ledger_stock(), 15)
+        self.assertEqual(
+            list(self.panadol.stock_movements.values_list('kind', 'quantity')),
+            [('purchase', 20), ('sale', -3), ('sale', -4), ('return_restock', 2)],
+        )
+
+    def test_movements_are_append_only(self):
+        movement = self.panadol.stock_movements.get()
+        movement.quantity = 1
+        with self.assertRaises(ValueError):
+            movement.save()
+
+    def test_snapshots_keep_the_balance(self):
+        with mock.patch.object(StockMovement, 'SNAPSHOT_INTERVAL', 3):
+            for _ in range(7):
+                self.move(-1)
+        self.assertTrue(self.panadol.stock_snapshots.exists())
+        latest = self.panadol.stock_snapshots.first()
+        self.assertEqual(
+            latest.stock,
+            self.panadol.stock_movements.filter(id__lte=latest.last_movement_id).aggregate(total=Sum('quantity'))['total'],
+        )
+        self.assertEqual(self.ledger_stock(), 13)
+
+    def test_reconcile_stock_records_adjustments(self):
+        Medicine.objects.filter(pk=self.panadol.pk).update(stock=25)
+        out = StringIO()
+        call_command('reconcile_stock', stdout=out)
+        self.assertIn('stock 25, ledger 20', out.getvalue())
+        self.assertEqual(self.ledger_stock(), 20)
+
+        call_command('reconcile_stock', '--fix', stdout=StringIO())
+        self.assertEqual(self.ledger_stock(), 25)
+        self.assertEqual(self.panadol.stock_movements.last().kind, StockMovement.ADJUSTMENT)
+
+
+class InventoryAsOfTests(TestCase):
+    def setUp(self):
+        self.today = timezone.localdate()
+        self.panadol = make_medicine('Panadol', stock=0)
+        self.backdate(Medicine.objects.filter(pk=self.panadol.pk), 'created_at', 10)
+        self.purchase(30, Money.coerce(2), days_ago=9)
+        StockMovement.apply([StockMovement(
+            medicine=self.panadol, kind=StockMovement.SALE, quantity=-10, created_at=self.at(5),
+        )])
+        self.purchase(5, Money.coerce(3), days_ago=2)
+
+        self.newer = make_medicine('Brufen', stock=0)
+        self.backdate(Medicine.objects.filter(pk=self.newer.pk), 'created_at', 1)
+
+    def at(self, days_ago):
+        return timezone.make_aware(datetime.combine(self.today - timedelta(days=days_ago), time(12)))
+
+    def backdate(self, queryset, field, days_ago):
+        queryset.update(**{field: self.at(days_ago)})
+
+    def purchase(self, quantity, unit_price, days_ago):
+        record = PurchaseRecord.objects.create(medicine=self.panadol, quantity=quantity, unit_price=unit_price)
+        self.backdate(PurchaseRecord.objects.filter(pk=record.pk), 'purchase_date', days_ago)
+        self.backdate(StockMovement.objects.filter(medicine=self.panadol, quantity=quantity), 'created_at', days_ago)
+
+    def as_of(self, days_ago):
+        return self.client.get(
+            reverse('inventory_as_of_data'), {'date': (self.today - timedelta(days=days_ago)).isoformat()},
+        ).json()
+
+    def test_stock_and_value_at_past_dates(self):
+        data = self.as_of(7)
+        self.assertEqual([(row['name'], row['stock']) for row in data['results']], [('Panadol', 30)])
+        self.assertEqual(as_money(data['results'][0]['unit_cost']), Money.coerce(2))
+        self.assertEqual(as_money(data['total_value']), Money.coerce(60))
+
+        self.assertEqual(self.as_of(3)['total_stock'], 20)
+
+        data = self.as_of(0)
+        self.assertEqual(data['total_stock'], 25)
+        self.assertEqual(as_money(data['total_value']), Money.coerce(75))
+
+    def test_before_the_first_movement(self):
+        self.assertEqual(self.as_of(12)['results'], [])
+
+    def test_snapshots_do_not_leak_into_the_past(self):
+        StockSnapshot.take([self.panadol.pk])
+        self.assertEqual(self.as_of(7)['total_stock'], 30)
+        self.assertEqual(self.as_of(3)['total_stock'], 20)
+        self.assertEqual(Medicine.objects.with_ledger_stock().get(pk=self.panadol.pk).ledger_stock, 25)
+
+    def test_medicines_created_later_are_left_out(self):
+        StockMovement.apply([StockMovement(medicine=self.newer, kind=StockMovement.ADJUSTMENT, quantity=4)])
+        self.assertEqual([row['name'] for row in self.as_of(3)['results']], ['Panadol'])
+        self.assertEqual([row['name'] for row in self.as_of(0)['results']], ['Brufen', 'Panadol'])
+
+
+class ExpiryBucketTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.today = timezone.localdate()
+        self.medicines = {}
+        for name, days, stock in [
+            ('Expired', -1, 2), ('Today', 0, 3), ('Month', 30, 4), ('Next month', 31, 5),
+            ('Quarter', 90, 6), ('Soon', 120, 7), ('Later', 121, 8), ('Empty', 10, 0),
+        ]:
+            self.medicines[name] = make_medicine(
+                name, stock=stock, expiry_date=self.today + timedelta(days=days),
+                retailers_price=Money.coerce(20), units_per_box=10,
+            )
+
+    def buckets(self):
+        return {bucket['key']: bucket for bucket in self.client.get(reverse('expiry_summary')).json()['buckets']}
+
+    def names_in(self, key):
+        return set(Medicine.objects.in_expiry_bucket(key).values_list('name', flat=True))
+
+    def test_bucket_edges(self):
+        self.assertEqual(self.names_in('expired'), {'Expired'})
+        self.assertEqual(self.names_in('0-30'), {'Today', 'Month'})
+        self.assertEqual(self.names_in('31-90'), {'Next month', 'Quarter'})
+        self.assertEqual(self.names_in('91-120'), {'Soon'})
+        with self.assertRaises(ValueError):
+            self.names_in('someday')
+
+    def test_summary_counts_units_and_value(self):
+        buckets = self.buckets()
+        self.assertEqual(list(buckets), BUCKET_KEYS)
+        self.assertEqual((buckets['0-30']['count'], buckets['0-30']['units']), (2, 7))
+        self.assertEqual(as_money(buckets['0-30']['value']), Money.coerce(14))
+        self.assertEqual(buckets['91-120']['units'], 7)
+
+    def test_flags_match_the_properties(self):
+        for medicine in Medicine.objects.with_expiry():
+            plain = Medicine.objects.get(pk=medicine.pk)
+            self.assertEqual(medicine.__dict__['is_expired'], plain.is_expired, plain.name)
+            self.assertEqual(medicine.__dict__['is_expiring_soon'], plain.is_expiring_soon, plain.name)
+
+    def test_summary_is_invalidated_by_stock_changes(self):
+        self.assertEqual(self.buckets()['expired']['units'], 2)
+        StockMovement.apply([StockMovement(
+            medicine=self.medicines['Expired'], kind=StockMovement.ADJUSTMENT, quantity=-2,
+        )])
+        self.assertEqual(self.buckets()['expired']['count'], 0)
+
+        self.medicines['Later'].expiry_date = self.today + timedelta(days=100)
+        self.medicines['Later'].save()
+        self.assertEqual(self.buckets()['91-120']['units'], 15)
+
+
+class GoodsReceiptTests(TestCase):
+    def setUp(self):
+        self.panadol = make_medicine('Panadol')
+        self.brufen = make_medicine('Brufen', stock=0)
+
+    def receive(self, payload):
+        response = self.client.post(reverse('receive_goods'), json.dumps(payload), content_type='application/json')
+        return response.status_code, response.json()
+
+    def test_receipt_raises_stock_and_purchase_statistics(self):
+        status, data = self.receive({
+            'supplier': ' Zen Pharma ', 'invoice_number': 'INV-9',
+            'lines': [
+                {'medicine_id': self.panadol.pk, 'quantity': 5, 'unit_price': '8.50'},
+                {'medicine_id': self.brufen.pk, 'quantity': 20},
+                {'medicine_id': self.panadol.pk, 'quantity': 1, 'unit_price': '8'},
+            ],
+        })
+        self.assertEqual(status, 200)
+        self.assertEqual((data['supplier'], data['line_count'], data['total_quantity']), ('Zen Pharma', 3, 26))
+        # Brufen defaults to its purchase price of Rs 9 a unit
+        self.assertEqual(as_money(data['total_amount']), Money.coerce('230.50'))
+
+        self.panadol.refresh_from_db()
+        self.brufen.refresh_from_db()
+        self.assertEqual((self.panadol.stock, self.brufen.stock), (16, 20))
+        self.assertEqual(self.panadol.total_purchased, 6)
+        self.assertEqual(self.panadol.total_purchase_amount, Money.coerce('50.50'))
+        self.assertEqual(self.panadol.last_purchase_price, Money.coerce(8))
+        self.assertEqual(self.brufen.last_purchase_price, Money.coerce(9))
+
+        receipt = GoodsReceipt.objects.get(pk=data['id'])
+        self.assertEqual(receipt.purchases.count(), 3)
+        self.assertEqual(
+            StockMovement.objects.filter(kind=StockMovement.PURCHASE).aggregate(total=Sum('quantity'))['total'], 26,
+        )
+
+    def test_queries_do_not_grow_with_lines(self):
+        def receipt_queries(count):
+            with CaptureQueriesContext(connection) as queries:
+                GoodsReceipt.receive('Zen', [(self.panadol.pk, 1, 9)] * count)
+            return len(queries)
+
+        # The first receipt also takes the medicine's first stock snapshot
+        receipt_queries(1)
+        self.assertEqual(receipt_queries(1), receipt_queries(10))
+
+    def test_invalid_lines_are_reported_together(self):
+        status, data = self.receive({
+            'supplier': '',
+            'lines': [
+                {'medicine_id': self.panadol.pk, 'quantity': 0},
+                {'medicine_id': 999999, 'quantity': 1},
+                {'medicine_id': self.brufen.pk, 'quantity': 'many'},
+            ],
+        })
+        self.assertEqual(status, 400)
+        self.assertFalse(data['success'])
+        self.assertEqual(data['errors'], [
+            "Supplier is required",
+            "Line 1: quantity must be positive",
+            "Line 2: unknown medicine 999999",
+            "Line 3: medicine, quantity and unit price must be numbers",
+        ])
+        self.assertFalse(GoodsReceipt.objects.exists())
+
+    def test_medicine_deleted_before_receipt_is_a_400(self):
+        with mock.patch.object(GoodsReceipt, 'receive', side_effect=ValueError("Unknown medicine ids: 7")):
+            status, data = self.receive({'supplier': 'Zen', 'lines': [{'medicine_id': self.panadol.pk, 'quantity': 1}]})
+        self.assertEqual((status, data), (400, {'success': False, 'errors': ["Unknown medicine ids: 7"]}))
+
+    def test_receive_is_all_or_nothing(self):
+        with self.assertRaisesMessage(ValueError, "Unknown medicine ids: 999999"):
+            GoodsReceipt.receive('Zen', [(self.panadol.pk, 5, 9), (999999, 1, 9)])
+        self.panadol.refresh_from_db()
+        self.assertEqual(self.panadol.stock, 10)
+        self.assertFalse(GoodsReceipt.objects.exists())
+
+
+class CatalogImportTests(TestCase):
+    HEADER = 'name,company,batch_no,expiry_date,rack_number,packet_price,retailers_price,units_per_box,initial_stock\n'
+
+    def run_import(self, text, chunk_size=catalog_import.CHUNK_SIZE):
+        return catalog_import.import_catalog(StringIO(text), chunk_size=chunk_size)
+
+    def test_new_medicines_are_created_with_opening_stock(self):
+        result = self.run_import(
+            self.HEADER
+            + 'Panadol,Acme,PN-1,2030-01-01,A1,100,80,10,25\n'
+            + 'Brufen,Zen,,2030-06-01,B2,50,40,5,\n'
+        )
+        self.assertEqual((result['created'], result['updated'], result['units']), (2, 0, 25))
+        panadol = Medicine.objects.get(name='Panadol')
+        self.assertEqual((panadol.stock, panadol.total_purchased), (25, 25))
+        self.assertEqual((panadol.price, panadol.last_purchase_price), (Money.coerce(10), Money.coerce(8)))
+        record = panadol.purchases.get()
+        self.assertEqual((record.unit_price, record.total_amount), (Money.coerce(8), Money.coerce(200)))
+        self.assertEqual(Medicine.objects.get(name='Brufen').stock, 0)
+
+    def test_existing_medicines_are_updated_by_key(self):
+        panadol = make_medicine('Panadol', batch_no='PN-1', stock=5, rack_number='C3')
+        other_batch = make_medicine('Panadol', batch_no='PN-2')
+        result = self.run_import(
+            'name,company,batch_no,expiry_date,packet_price\n'
+            'Panadol,Acme,PN-1,2031-01-01,120\n'
+        )
+        self.assertEqual((result['created'], result['updated']), (0, 1))
+        panadol.refresh_from_db()
+        self.assertEqual((panadol.packet_price, panadol.price), (Money.coerce(120), Money.coerce(12)))
+        self.assertEqual((panadol.rack_number, panadol.batch_no, panadol.stock), ('C3', 'PN-1', 5))
+        other_batch.refresh_from_db()
+        self.assertEqual(other_batch.packet_price, Money.coerce(100))
+
+    def test_opening_stock_for_existing_medicines_uses_the_stored_price(self):
+        panadol = make_medicine('Panadol', batch_no='PN-1', stock=5)
+        result = self.run_import('name,company,batch_no,expiry_date,initial_stock\nPanadol,Acme,PN-1,2031-01-01,10\n')
+        self.assertEqual((result['updated'], result['units']), (1, 10))
+        panadol.refresh_from_db()
+        self.assertEqual((panadol.stock, panadol.total_purchase_amount), (15, Money.coerce(90)))
+        self.assertEqual(panadol.purchases.get().unit_price, Money.coerce(9))
+
+    def test_blank_batch_numbers(self):
+        first = self.run_import(self.HEADER + 'Calpol,Acme,,2030-01-01,A1,60,50,10,4\n')
+        again = self.run_import(self.HEADER + 'Calpol,Acme,,2030-01-01,A2,70,50,10,6\n')
+        self.assertEqual((first['created'], again['updated']), (1, 1))
+        calpol = Medicine.objects.get(name='Calpol')
+        self.assertEqual((calpol.batch_no, calpol.rack_number, calpol.stock), ('', 'A2', 10))
+
+        make_medicine('Calpol', rack_number='A3')
+        result = self.run_import(self.HEADER + 'Calpol,Acme,,2030-01-01,A1,80,50,10,3\n')
+        self.assertEqual(result['updated'], 0)
+        self.assertEqual(result['errors'], [(2, "2 medicines named Calpol from Acme have no batch number; give one")])
+        self.assertEqual(Medicine.objects.filter(name='Calpol', packet_price=Money.coerce(80)).count(), 0)
+
+    def test_rack_number_is_required(self):
+        make_medicine('Panadol', batch_no='PN-1')
+        result = self.run_import(self.HEADER + 'Brufen,Zen,B-1,2030-01-01, ,50,40,5,1\n')
+        self.assertEqual(result['errors'], [(2, "rack_number is required")])
+
+        result = self.run_import(
+            'name,company,batch_no,expiry_date\n'
+            'Panadol,Acme,PN-1,2031-01-01\n'
+            'Brufen,Zen,B-1,2031-01-01\n'
+        )
+        self.assertEqual(result['updated'], 1)
+        self.assertEqual(result['errors'], [(3, "rack_number is required for a new medicine")])
+        self.assertFalse(Medicine.objects.filter(name='Brufen').exists())
+
+    def test_errors_are_reported_in_line_order_across_chunks(self):
+        make_medicine('Panadol', batch_no='PN-1', stock=10)
+        result = self.run_import(
+            'name,company,batch_no,expiry_date,initial_stock\n'
+            'Brufen,Zen,B-1,2031-01-01,1\n'
+            'Calpol,Acme,C-1,yesterday,3\n'
+            'Panadol,Acme,PN-1,2031-01-01,2\n'
+            'Panadol,Acme,PN-1,2031-01-01,3\n',
+            chunk_size=2,
+        )
+        self.assertEqual((result['rows'], result['created'], result['updated'], result['units']), (4, 0, 2, 5))
+        self.assertEqual([line for line, error in result['errors']], [2, 3])
+        self.assertEqual(result['error_count'], 2)
+        self.assertEqual(Medicine.objects.get(name='Panadol').stock, 15)
+
+    def test_batch_numbers_are_unique_only_when_set(self):
+        make_medicine('Panadol')
+        make_medicine('Panadol')
+        make_medicine('Panadol', batch_no='PN-1')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            make_medicine('Panadol', batch_no='PN-1')
+
+    def test_missing_columns(self):
+        with self.assertRaisesMessage(catalog_import.CatalogImportError, "expiry_date"):
+            self.run_import('name,company\nPanadol,Acme\n')
+
+
+class RepricingTests(TestCase):
+    def setUp(self):
+        self.panadol = make_medicine('Panadol', rack_number='A1')
+        self.brufen = make_medicine('Brufen', rack_number='a1', packet_price=Money.coerce('1.15'), units_per_box=1)
+        self.calpol = make_medicine('Calpol', rack_number='B2', discount_type='flat', discount=Decimal('90'))
+        self.other = make_medicine('Disprin', company='Zen', rack_number='A1')
+
+    def changes(self, **fields):
+        return {field: repricing.parse_change(*change) for field, change in fields.items()}
+
+    def test_percent_change_rounds_half_even_and_derives_price(self):
+        updated = repricing.apply(repricing.matching(rack_number='A1 ', company='acme'), self.changes(packet_price=('percent', '10')))
+        self.assertEqual(updated, 2)
+        self.panadol.refresh_from_db()
+        self.brufen.refresh_from_db()
+        self.other.refresh_from_db()
+        self.assertEqual((self.panadol.packet_price, self.panadol.price), (Money.coerce(110), Money.coerce(11)))
+        # 126.5 paisa rounds to the even 126
+        self.assertEqual((self.brufen.packet_price, self.brufen.price), (Money(126), Money(126)))
+        self.assertEqual(self.other.packet_price, Money.coerce(100))
+
+    def test_flat_changes_floor_at_zero_and_cap_discounts(self):
+        repricing.apply(repricing.matching(company='Acme'), self.changes(
+            retailers_price=('flat', '-95'), packet_price=('flat', '-20'), discount=('percent', '50'),
+        ))
+        self.calpol.refresh_from_db()
+        self.panadol.refresh_from_db()
+        self.assertEqual(self.calpol.retailers_price, Money.ZERO)
+        # 50% more than Rs 90 flat would exceed the new Rs 80 packet price
+        self.assertEqual((self.calpol.packet_price, self.calpol.discount), (Money.coerce(80), Decimal('80.00')))
+
+        repricing.apply(repricing.matching(company='Acme'), self.changes(discount=('flat', '150')))
+        self.panadol.refresh_from_db()
+        self.assertEqual(self.panadol.discount, Decimal('100.00'))
+
+    def test_preview_matches_apply_in_one_update(self):
+        changes = self.changes(packet_price=('percent', '-12.5'), discount=('flat', '3'))
+        queryset = repricing.matching(company='Acme')
+        rows, count = repricing.preview(queryset, changes)
+        self.assertEqual(count, 3)
+        self.assertEqual([row['name'] for row in rows], ['Brufen', 'Calpol', 'Panadol'])
+        expected = {row['id']: {field: new for field, old, new in row['changes']} for row in rows}
+
+        with self.assertNumQueries(1):
+            repricing.apply(queryset, changes)
+        for medicine in Medicine.objects.filter(pk__in=expected):
+            for field, new in expected[medicine.pk].items():
+                self.assertEqual(getattr(medicine, field), new, field)
+
+    def test_parse_change_and_filters(self):
+        self.assertIsNone(repricing.parse_change('percent', ' '))
+        self.assertEqual(repricing.parse_change('flat', '2.5'), ('flat', Decimal('2.50')))
+        for mode, amount in (('double', '2'), ('percent', 'ten'), ('percent', '-101')):
+            with self.assertRaises(ValueError):
+                repricing.parse_change(mode, amount)
+        with self.assertRaises(ValueError):
+            repricing.matching(company=' ')
+
+    def test_view_previews_then_applies(self):
+        form = {'company': 'Acme', 'packet_price_mode': 'percent', 'packet_price_amount': '10'}
+        response = self.client.post(reverse('reprice'), form)
+        self.assertEqual(response.context['count'], 3)
+        self.panadol.refresh_from_db()
+        self.assertEqual(self.panadol.packet_price, Money.coerce(100))
+
+        self.client.post(reverse('reprice'), dict(form, action='apply'))
+        self.panadol.refresh_from_db()
+        self.assertEqual(self.panadol.packet_price, Money.coerce(110))
+
+        response = self.client.post(reverse('reprice'), {'company': 'Acme'})
+        self.assertNotIn('rows', response.context)
+
+
+class CompositionKeyTests(TestCase):
+    def test_normalizes_units_spacing_and_form_words(self):
+        self.assertEqual(
+            composition_key('Amoxicillin 500 mg + Clavulanic Acid 0.125g Tab'),
+            'amoxicillin 500mg+clavulanic acid 125mg',
+        )
+        self.assertEqual(composition_key('Vitamin B12 500 ug'), composition_key('vitamin b12 500mcg'))
+
+    def test_component_order_does_not_matter(self):
+        self.assertEqual(
+            composition_key('Clavulanic acid 125mg, AMOXICILLIN 0.5 g'),
+            composition_key('Amoxicillin 500mg and Clavulanic Acid 125mg'),
+        )
+
+    def test_concentrations(self):
+        self.assertEqual(composition_key('Paracetamol 120mg/5ml Syrup'), 'paracetamol 120mg/5ml')
+        self.assertEqual(components('Paracetamol 120mg/5ml'), [('paracetamol', ('120mg/5ml',))])
+
+    def test_empty_formula(self):
+        self.assertEqual(composition_key(''), '')
+        self.assertEqual(composition_key(None), '')
+        self.assertEqual(composition_key('Tablets'), '')
+
+    def test_stored_on_save(self):
+        medicine = make_medicine('Augmentin', 'Amoxicillin 500mg + Clavulanic acid 125mg')
+        self.assertEqual(
+            Medicine.objects.values_list('composition', flat=True).get(pk=medicine.pk),
+            'amoxicillin 500mg+clavulanic acid 125mg',
+        )
+
+
+class SubstituteTests(TestCase):
+    def setUp(self):
+        self.augmentin = make_medicine('Augmentin', 'Amoxicillin 500mg + Clavulanic acid 125mg')
+        self.cheap = make_medicine('Amoclan', 'clavulanic acid 0.125 g, amoxicillin 500 mg tab', price=Money.coerce(6))
+        self.dear = make_medicine('Calamox', 'Amoxicillin 500mg + Clavulanic acid 125mg', price=Money.coerce(12))
+        make_medicine('Empty', 'Amoxicillin 500mg + Clavulanic acid 125mg', stock=0)
+        make_medicine('Expired', 'Amoxicillin 500mg + Clavulanic acid 125mg', expiry_date='2020-01-01')
+        make_medicine('Stronger', 'Amoxicillin 875mg + Clavulanic acid 125mg')
+
+    def test_same_composition_in_stock_cheapest_first(self):
+        data = self.client.get(reverse('medicine_substitutes', args=[self.augmentin.pk])).json()
+        self.assertEqual(data['medicine']['composition'], 'amoxicillin 500mg+clavulanic acid 125mg')
+        self.assertEqual([row['id'] for row in data['results']], [self.cheap.pk, self.dear.pk])
+
+        data = self.client.get(reverse('medicine_substitutes', args=[self.augmentin.pk]), {'limit': 1}).json()
+        self.assertEqual(len(data['results']), 1)
+
+    def test_without_composition_or_medicine(self):
+        plain = make_medicine('Plain')
+        self.assertEqual(self.client.get(reverse('medicine_substitutes', args=[plain.pk])).json()['results'], [])
+        self.assertEqual(self.client.get(reverse('medicine_substitutes', args=[999999])).status_code, 404)
+        self.assertEqual(
+            self.client.get(reverse('medicine_substitutes', args=[plain.pk]), {'limit': 'x'}).status_code, 400,
+        )
+
+    def test_formula_search_uses_salt_prefixes_and_exact_strengths(self):
+        def search(query):
+            return {row['name'] for row in self.client.get(reverse('search_by_formula'), {'q': query}).json()}
+
+        self.assertEqual(search('amoxi 875'), {'Stronger'})
+        self.assertEqual(len(search('clavul amoxicillin')), 6)
+        self.assertEqual(search('amoxicillin 0.5g'), {'Augmentin', 'Amoclan', 'Calamox', 'Empty', 'Expired'})
+        self.assertEqual(search('tablet'), set())
+
+    def test_tokens_are_indexed_only_when_the_formula_changes(self):
+        with mock.patch.object(composition, 'index') as index:
+            self.augmentin.stock = 3
+            self.augmentin.save()
+            index.assert_not_called()
+
+            self.augmentin.formula = 'Amoxicillin 250mg'
+            self.augmentin.save()
+            index.assert_called_once_with(['amoxicillin 250mg'])
+        self.assertEqual(
+            Medicine.objects.values_list('composition', flat=True).get(pk=self.augmentin.pk), 'amoxicillin 250mg',
+        )
+
+        self.augmentin.formula = 'Amoxicillin 0.25 g Caps'
+        self.augmentin.save()
+        self.assertEqual(
+            set(CompositionToken.objects.filter(composition='amoxicillin 250mg').values_list('token', flat=True)),
+            {'amoxicillin', '250mg'},
+        )
+
+
+class PrefixDistanceTests(TestCase):
+    def test_prefix_is_free(self):
+        self.assertEqual(prefix_distance('panadol', 'panadol extra', 2), 0)
+        self.assertEqual(prefix_distance('pan', 'panadol', 0), 0)
+
+    def test_edits(self):
+        self.assertEqual(prefix_distance('pandol', 'panadol', 1), 1)
+        self.assertEqual(prefix_distance('panadool', 'panadol', 2), 1)
+        self.assertEqual(prefix_distance('panodol', 'panadol', 1), 1)
+        self.assertEqual(prefix_distance('pnodol', 'panadol', 2), 2)
+
+    def test_transposition_is_one_edit(self):
+        self.assertEqual(prefix_distance('apnadol', 'panadol', 1), 1)
+
+    def test_beyond_limit(self):
+        self.assertEqual(prefix_distance('xyzabc', 'panadol', 1), 2)
+        self.assertEqual(prefix_distance('panadol', 'pa', 2), 3)
+
+
+class FuzzyIndexTests(TestCase):
+    def setUp(self):
+        self.panadol = make_medicine('Panadol', 'Paracetamol 500mg', stock=3)
+        self.extra = make_medicine('Panadol Extra', 'Paracetamol 500mg + Caffeine', stock=30)
+        self.augmentin = make_medicine('Augmentin 625', 'Amoxicillin 500mg + Clavulanic acid')
+        self.index = FuzzyIndex()
+
+    def test_prefix_and_typo_matches(self):
+        self.assertEqual(self.index.search('pana'), {self.panadol.pk: 0, self.extra.pk: 0})
+        self.assertEqual(self.index.search('panadool'), {self.panadol.pk: 1, self.extra.pk: 1})
+        self.assertEqual(self.index.search('augmantin'), {self.augmentin.pk: 1})
+        self.assertEqual(self.index.search('paracetmol'), {self.panadol.pk: 1, self.extra.pk: 1})
+
+    def test_every_word_must_match(self):
+        self.assertEqual(self.index.search('panadol xtra'), {self.extra.pk: 1})
+        self.assertEqual(self.index.search('panadol zzzz'), {})
+        self.assertEqual(self.index.search(''), {})
+
+    def test_short_words_need_an_exact_prefix(self):
+        self.assertEqual(self.index.search('pqn'), {})
+
+    def test_update_and_discard(self):
+        self.index.search('pana')
+        self.augmentin.name = 'Augmentin Duo'
+        self.augmentin.save()
+        self.index.update(self.augmentin)
+        self.assertEqual(self.index.search('duo'), {self.augmentin.pk: 0})
+        self.assertEqual(self.index.search('625'), {})
+
+        self.index.discard(self.panadol.pk)
+        self.assertEqual(self.index.search('panadol'), {self.extra.pk: 0})
+
+    def test_cut_keeps_closest_then_best_stocked(self):
+        exact = make_medicine('Pandol', stock=0)
+        best_stocked = make_medicine('Panadol CF', stock=50)
+        make_medicine('Panadol Syrup', stock=1)
+        with mock.patch.object(fuzzy, 'MAX_CANDIDATES', 2):
+            self.assertEqual(FuzzyIndex().search('pandol'), {exact.pk: 0, best_stocked.pk: 1})
+
+    def test_fuzzy_search_orders_by_distance_then_stock(self):
+        fuzzy.fuzzy_index.invalidate()
+        self.addCleanup(fuzzy.fuzzy_index.invalidate)
+        names = list(Medicine.objects.fuzzy_search('panadool').values_list('name', flat=True))
+        self.assertEqual(names, ['Panadol Extra', 'Panadol'])
+
+    def test_suggestions_follow_saves_and_stock_changes(self):
+        fuzzy.fuzzy_index.invalidate()
+        self.addCleanup(fuzzy.fuzzy_index.invalidate)
+
+        def suggestions(query):
+            response = self.client.get(reverse('medicine_suggestions'), {'q': query})
+            return [row['name'] for row in response.json()['results']]
+
+        self.assertEqual(suggestions('panadool'), ['Panadol Extra', 'Panadol'])
+        GoodsReceipt.receive('Zen', [(self.panadol.pk, 100, 9)])
+        self.assertEqual(suggestions('panadool'), ['Panadol', 'Panadol Extra'])
+
+        self.extra.delete()
+        self.augmentin.name = 'Panadoll Kids'
+        self.augmentin.save()
+        self.assertEqual(suggestions('panadool'), ['Panadol', 'Panadoll Kids'])
 
-# Create your tests here.
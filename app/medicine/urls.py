@@ -1,9 +1,10 @@
 from django.urls import path
 from .views import (
     MedicineInventoryView, 
-    MedicineUpdateView, MedicineDeleteView , MedicineDetailView , MedicineDashboardView
+    MedicineUpdateView, MedicineDeleteView , MedicineDetailView , MedicineDashboardView ,
+    InventoryAsOfView, GoodsReceiptView, CatalogImportView, RepricingView
 )
-from .views import medicine_suggestions , search_purchases
+from .views import medicine_suggestions , search_purchases , medicine_lookup , inventory_as_of , expiry_summary , receive_goods , medicine_substitutes
 
 
 urlpatterns = [
@@ -12,6 +13,15 @@ urlpatterns = [
     path('delete/<int:pk>/', MedicineDeleteView.as_view(), name='delete_medicine'),
     path('suggestions/', medicine_suggestions, name='medicine_suggestions'),
     path('detail/<int:pk>/', MedicineDetailView.as_view(), name='medicine_detail'),
+    path('lookup/', medicine_lookup, name='medicine_lookup'),
+    path('substitutes/<int:pk>/', medicine_substitutes, name='medicine_substitutes'),
     path('medicine-dashboard/', MedicineDashboardView.as_view(), name='medicine_dashboard'),
     path('search-purchases/', search_purchases, name='search_purchases'),
+    path('inventory-as-of/', InventoryAsOfView.as_view(), name='inventory_as_of'),
+    path('inventory-as-of/data/', inventory_as_of, name='inventory_as_of_data'),
+    path('expiry-summary/', expiry_summary, name='expiry_summary'),
+    path('receive/', GoodsReceiptView.as_view(), name='goods_receipt'),
+    path('receive/api/', receive_goods, name='receive_goods'),
+    path('import/', CatalogImportView.as_view(), name='catalog_import'),
+    path('reprice/', RepricingView.as_view(), name='reprice'),
 ]
\ No newline at end of file
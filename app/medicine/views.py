@@ -1,15 +1,21 @@
 from django.views.generic import UpdateView, DeleteView, ListView , DetailView , TemplateView
 from django.urls import reverse_lazy
 from django.contrib import messages
+from django.views.decorators.http import require_POST
 from django.http import JsonResponse
-from .models import Medicine , PurchaseRecord
+from django.core.cache import cache
+from app.money import Money, MoneyField, MoneyJSONEncoder
+from .models import GoodsReceipt, Medicine , PurchaseRecord
+from . import catalog_import, expiry, pricing, repricing
 from .forms import MedicineAddForm , MedicineUpdateForm
 from django.views.generic.edit import FormMixin
 from django.utils import timezone
 from datetime import datetime
-from django.db.models import Sum, ExpressionWrapper, DecimalField , Value , Sum , Q , DateField
+from django.db.models import Sum, ExpressionWrapper, DecimalField , Value , Sum , Q , DateField , F , Count , Window
 from django.db.models.functions import Coalesce , TruncDate
 from decimal import Decimal
+import io
+import json
 import pytz
 from datetime import timedelta
 from datetime import time
@@ -22,9 +28,11 @@ class MedicineInventoryView(FormMixin, ListView):
     context_object_name = 'medicines'
     ordering = ['-created_at']
     success_url = reverse_lazy('medicine')
+    # ?sort= values accepted by the list, prefix with '-' for descending
+    sortable_fields = ('name', 'stock', 'expiry_date', 'price', 'selling_price', 'calculated_discount', 'created_at')
 
     def get_queryset(self):
-        queryset = super().get_queryset()
+        queryset = Medicine.objects.with_pricing().with_expiry()
         self.search_query = self.request.GET.get('search', '')
         
         if self.search_query:
@@ -33,8 +41,21 @@ class MedicineInventoryView(FormMixin, ListView):
                 queryset = queryset.filter(id=medicine_id)
             except ValueError:
                 queryset = queryset.filter(name__icontains=self.search_query)
-        
-        return queryset
+
+        if self.request.GET.get('discounted'):
+            queryset = queryset.filter(calculated_discount__gt=0)
+
+        expiry_bucket = self.request.GET.get('expiry')
+        if expiry_bucket in expiry.BUCKET_KEYS:
+            queryset = queryset.in_expiry_bucket(expiry_bucket)
+
+        return queryset.order_by(*self.get_ordering())
+
+    def get_ordering(self):
+        sort = self.request.GET.get('sort', '')
+        if sort.lstrip('-') in self.sortable_fields:
+            return [sort, 'id']
+        return self.ordering
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -87,9 +108,14 @@ class MedicineDeleteView(DeleteView):
         messages.success(request, 'Medicine deleted successfully!')
         return super().delete(request, *args, **kwargs)
 
+SUBSTITUTES_LIMIT = 20
+
 def medicine_suggestions(request):
     query = request.GET.get('q', '')
-    medicines = Medicine.objects.filter(name__icontains=query).order_by('name')[:10]
+    if query.strip():
+        medicines = Medicine.objects.with_pricing().fuzzy_search(query)[:10]
+    else:
+        medicines = Medicine.objects.with_pricing().order_by('name')[:10]
     
     results = []
     for med in medicines:
@@ -100,20 +126,111 @@ def medicine_suggestions(request):
             'formula': med.formula,
             'batch_no': med.batch_no if med.batch_no else None,  # Added batch_no field
             'highlighted_name': med.name.replace(query, f'<span class="font-bold">{query}</span>'),
-            'price': float(med.price),
-            'selling_price': float(med.selling_price),
+            'price': med.price,
+            'selling_price': med.selling_price,
             'stock': med.stock,
             'rack_number': med.rack_number if med.rack_number else None,
             'discount_display': med.get_discount_display(),
-            'calculated_discount': float(med.calculated_discount)
+            'calculated_discount': med.calculated_discount
         })
     
-    return JsonResponse({'results': results})
+    return JsonResponse({'results': results, 'catalog_version': pricing.catalog_version()}, encoder=MoneyJSONEncoder)
+
+def _medicine_lookup_payload(med):
+    return {
+        'id': med.id,
+        'name': med.name,
+        'company': med.company,
+        'formula': med.formula,
+        'batch_no': med.batch_no or None,
+        'rack_number': med.rack_number or None,
+        'stock': med.stock,
+        'units_per_box': med.units_per_box,
+        'expiry_date': med.expiry_date.strftime('%Y-%m-%d'),
+        'is_expired': med.is_expired,
+        'is_expiring_soon': med.is_expiring_soon,
+        'retailers_price': med.retailers_price,
+        'packet_price': med.packet_price,
+        'purchase_per_unit_price': med.purchase_per_unit_price,
+        'selling_per_unit_price': med.selling_per_unit_price,
+        'price': med.price,
+        'selling_price': med.selling_price,
+        'calculated_discount': med.calculated_discount,
+        'discount_display': med.get_discount_display(),
+    }
+
+
+def medicine_lookup(request):
+    """Compact JSON pricing/stock/rack lookup for many ids (?ids=1,2,3)"""
+    try:
+        ids = [int(i) for i in request.GET.get('ids', '').split(',') if i.strip()]
+    except ValueError:
+        return JsonResponse({'error': 'ids must be a comma separated list of integers'}, status=400)
+
+    # Cache entries are keyed on updated_at, so any save of a medicine
+    # naturally invalidates its entry without explicit bookkeeping, and on
+    # the local date, as is_expired/is_expiring_soon change at midnight.
+    today = timezone.localdate().isoformat()
+    versions = Medicine.objects.filter(id__in=ids).values_list('id', 'updated_at')
+    keys = {
+        med_id: f"medicine:lookup:{med_id}:{updated_at.timestamp()}:{today}"
+        for med_id, updated_at in versions
+    }
+    cached = cache.get_many(keys.values())
+
+    results = {}
+    missing = []
+    for med_id, key in keys.items():
+        if key in cached:
+            results[med_id] = cached[key]
+        else:
+            missing.append(med_id)
+
+    if missing:
+        fresh = {}
+        for med in Medicine.objects.with_pricing().filter(id__in=missing):
+            payload = _medicine_lookup_payload(med)
+            results[med.id] = payload
+            fresh[keys[med.id]] = payload
+        cache.set_many(fresh, timeout=60 * 60)
+
+    return JsonResponse({
+        'results': [results[i] for i in ids if i in results],
+        'catalog_version': pricing.catalog_version(),
+    }, encoder=MoneyJSONEncoder)
+
+def medicine_substitutes(request, pk):
+    """
+    In-stock, unexpired medicines with the same composition as medicine
+    pk, cheapest first and then best stocked (?limit=, default 20).
+    """
+    try:
+        limit = min(max(int(request.GET.get('limit', SUBSTITUTES_LIMIT)), 1), SUBSTITUTES_LIMIT)
+    except ValueError:
+        return JsonResponse({'error': 'limit must be an integer'}, status=400)
+    medicine = Medicine.objects.filter(pk=pk).values('id', 'name', 'formula', 'composition').first()
+    if medicine is None:
+        return JsonResponse({'error': 'Medicine not found'}, status=404)
+
+    substitutes = []
+    if medicine['composition']:
+        substitutes = (
+            Medicine.objects.with_pricing()
+            .filter(composition=medicine['composition'], stock__gt=0, expiry_date__gte=timezone.localdate())
+            .exclude(pk=pk)
+            .order_by('selling_price', '-stock', 'name')[:limit]
+        )
+    return JsonResponse({
+        'medicine': medicine,
+        'results': [_medicine_lookup_payload(med) for med in substitutes],
+        'catalog_version': pricing.catalog_version(),
+    }, encoder=MoneyJSONEncoder)
 
 class MedicineDetailView(DetailView):
     model = Medicine
     template_name = 'medicines/medicine_detail.html'
     context_object_name = 'medicine'  # This name will be used in your template
+    queryset = Medicine.objects.with_pricing()
     
     # Optional: Add extra context
     def get_context_data(self, **kwargs):
@@ -148,8 +265,8 @@ class MedicineDashboardView(TemplateView):
         if start_date and end_date and end_date < start_date:
             end_date = start_date
 
-        # Base querysets
-        medicines = Medicine.objects.all()
+        # Base querysets; the table itself is paged through search_purchases
+        medicines = Medicine.objects.order_by('name', 'id')[:PURCHASES_PAGE_SIZE]
         
         # Get purchases with timezone awareness
         purchases = PurchaseRecord.objects.all().annotate(
@@ -175,20 +292,20 @@ class MedicineDashboardView(TemplateView):
         today_total = today_purchases.aggregate(
             total=Coalesce(
                 Sum('total_amount'),
-                Value(Decimal('0.00'), output_field=DecimalField())
+                Value(0, output_field=MoneyField())
             )
-        )['total'] or Decimal('0.00')
+        )['total'] or Money.ZERO
 
         # All-time total
         all_time_total = purchases.aggregate(
             total=Coalesce(
                 Sum('total_amount'),
-                Value(Decimal('0.00'), output_field=DecimalField())
+                Value(0, output_field=MoneyField())
             )
-        )['total'] or Decimal('0.00')
+        )['total'] or Money.ZERO
 
         # Date range total - using the local_purchase_date annotation for proper filtering
-        date_range_total = Decimal('0.00')
+        date_range_total = Money.ZERO
         date_filtered_purchases = PurchaseRecord.objects.none()
         
         if start_date and end_date:
@@ -200,17 +317,12 @@ class MedicineDashboardView(TemplateView):
             date_range_total = date_filtered_purchases.aggregate(
                 total=Coalesce(
                     Sum('total_amount'),
-                    Value(Decimal('0.00'), output_field=DecimalField())
+                    Value(0, output_field=MoneyField())
                 )
-            )['total'] or Decimal('0.00')
+            )['total'] or Money.ZERO
 
-        # Current inventory value
-        current_inventory_value = Decimal('0.00')
-        for medicine in medicines:
-            # Calculate based on current stock and current purchase price
-            stock = Decimal(medicine.stock or 0)
-            price = Decimal(medicine.purchase_per_unit_price or 0)
-            current_inventory_value += stock * price
+        # Current inventory value, based on current stock and current purchase price
+        current_inventory_value = Medicine.objects.inventory_value()
 
         context.update({
             'medicines': medicines,
@@ -223,38 +335,301 @@ class MedicineDashboardView(TemplateView):
             'start_date': start_date.strftime('%Y-%m-%d') if start_date else '',
             'end_date': end_date.strftime('%Y-%m-%d') if end_date else '',
             'today_date': today_pk.strftime('%Y-%m-%d'),
-            'has_date_range': bool(start_date and end_date)
+            'has_date_range': bool(start_date and end_date),
+            'expiry_buckets': expiry.summary()['buckets'],
         })
 
         return context
 
 
+def expiry_summary(request):
+    """Counts, units and value of in-stock medicines per expiry bucket"""
+    result = expiry.summary()
+    return JsonResponse({
+        'date': result['date'].strftime('%Y-%m-%d'),
+        'buckets': result['buckets'],
+    }, encoder=MoneyJSONEncoder)
+
+
+def _inventory_as_of(as_of_date):
+    """Per-medicine stock and valuation at the end of as_of_date (local time)"""
+    as_of = timezone.make_aware(datetime.combine(as_of_date, time.max))
+    rows = list(
+        Medicine.objects.as_of(as_of)
+        .exclude(ledger_stock=0)
+        .order_by('name', 'id')
+        .values('id', 'name', 'company', 'batch_no', 'ledger_stock', 'unit_cost', 'stock_value')
+    )
+    totals = {
+        'stock': sum(row['ledger_stock'] for row in rows),
+        'value': sum((row['stock_value'] for row in rows), Money.ZERO),
+    }
+    return rows, totals
+
+
+def _parse_as_of_date(request):
+    try:
+        return datetime.strptime(request.GET.get('date', ''), '%Y-%m-%d').date()
+    except ValueError:
+        return timezone.localdate()
+
+
+class InventoryAsOfView(TemplateView):
+    template_name = 'medicines/inventory_as_of.html'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        as_of_date = _parse_as_of_date(self.request)
+        rows, totals = _inventory_as_of(as_of_date)
+        context.update({
+            'rows': rows,
+            'totals': totals,
+            'as_of_date': as_of_date.strftime('%Y-%m-%d'),
+        })
+        return context
+
+
+def inventory_as_of(request):
+    """JSON point-in-time inventory: ?date=YYYY-MM-DD (default today)"""
+    as_of_date = _parse_as_of_date(request)
+    rows, totals = _inventory_as_of(as_of_date)
+    return JsonResponse({
+        'date': as_of_date.strftime('%Y-%m-%d'),
+        'results': [
+            {
+                'id': row['id'],
+                'name': row['name'],
+                'company': row['company'],
+                'batch_no': row['batch_no'] or None,
+                'stock': row['ledger_stock'],
+                'unit_cost': row['unit_cost'],
+                'value': row['stock_value'],
+            }
+            for row in rows
+        ],
+        'total_stock': totals['stock'],
+        'total_value': totals['value'],
+    }, encoder=MoneyJSONEncoder)
+
+
+# ?sort= keys accepted by search_purchases and the columns they order by
+PURCHASE_SORT_FIELDS = {
+    'name': 'name',
+    'company': 'company',
+    'stock': 'stock',
+    'retailers_price': 'retailers_price',
+    'total_purchased': 'total_purchased',
+    'total_purchase_amount': 'total_purchase_amount',
+    'last_purchased': 'last_purchase_date',
+}
+PURCHASES_PAGE_SIZE = 50
+
+
 def search_purchases(request):
     query = request.GET.get('query', '').strip()
-    
-    if not query:
-        medicines = Medicine.objects.all()
-    else:
-        medicines = Medicine.objects.filter(
+    sort = request.GET.get('sort', 'name')
+    try:
+        page = max(int(request.GET.get('page', 1)), 1)
+        page_size = min(max(int(request.GET.get('page_size', PURCHASES_PAGE_SIZE)), 1), 200)
+    except ValueError:
+        return JsonResponse({'error': 'page and page_size must be integers'}, status=400)
+
+    column = PURCHASE_SORT_FIELDS.get(sort.lstrip('-'), 'name')
+    ordering = F(column).desc(nulls_last=True) if sort.startswith('-') else F(column).asc(nulls_first=True)
+
+    medicines = Medicine.objects.all()
+    if query:
+        medicines = medicines.filter(
             Q(name__icontains=query) | Q(company__icontains=query) | Q(formula__icontains=query)
         )
-    
+
+    # The window count rides along with the page rows, so paging needs no
+    # separate COUNT(*) query.
+    offset = (page - 1) * page_size
+    rows = medicines.annotate(total_count=Window(Count('id'))).order_by(ordering, 'id').values(
+        'id', 'name', 'company', 'formula', 'stock', 'units_per_box', 'retailers_price',
+        'total_purchased', 'total_purchase_amount', 'last_purchase_date', 'last_purchase_price',
+        'total_count',
+    )[offset:offset + page_size]
+
+    total = 0
     data = []
-    for med in medicines:
-        retailers_price = float(med.retailers_price or 0)
+    for row in rows:
+        total = row.pop('total_count')
+        last_purchase_date = row.pop('last_purchase_date')
+        row['last_purchased'] = timezone.localdate(last_purchase_date).strftime('%Y-%m-%d') if last_purchase_date else None
+        row['batch_number'] = "N/A"  # You can replace this if you have real batch data
+        data.append(row)
+    if not data and page > 1:
+        # Past the last page no row carries the window count
+        total = medicines.count()
 
-        data.append({
-            'id': med.id,
-            'name': med.name,
-            'company': med.company,
-            'formula': med.formula,
-            'stock': med.stock,
-            'units_per_box': med.units_per_box,
-            'retailers_price': retailers_price,
-            'total_purchased': med.total_purchased,
-            'total_purchase_amount': float(med.total_purchase_amount or 0),
-            'last_purchased': med.updated_at.strftime('%Y-%m-%d'),
-            'batch_number': "N/A",  # You can replace this if you have real batch data
-        })
+    return JsonResponse({
+        'data': data,
+        'page': page,
+        'page_size': page_size,
+        'total': total,
+        'num_pages': -(-total // page_size),
+        'sort': sort,
+    }, encoder=MoneyJSONEncoder)
+
+
+def _receipt_lines(rows):
+    """
+    Validate goods receipt rows of (medicine_id, quantity, unit_price) as
+    submitted. A blank unit price falls back to the medicine's purchase
+    price per unit. Returns (lines, errors) with one error per bad row.
+    """
+    parsed = []
+    errors = {}
+    for number, (medicine_id, quantity, unit_price) in enumerate(rows, start=1):
+        try:
+            medicine_id = int(medicine_id)
+            quantity = int(quantity)
+            unit_price = Money.coerce(unit_price) if unit_price not in (None, '') else None
+        except (ArithmeticError, TypeError, ValueError):
+            errors[number] = "medicine, quantity and unit price must be numbers"
+            continue
+        if quantity <= 0:
+            errors[number] = "quantity must be positive"
+        elif unit_price is not None and unit_price < Money.ZERO:
+            errors[number] = "unit price cannot be negative"
+        else:
+            parsed.append((number, medicine_id, quantity, unit_price))
+
+    # Existence and default prices for every line in one query
+    prices = dict(
+        Medicine.objects.with_pricing()
+        .filter(pk__in={medicine_id for _, medicine_id, _, _ in parsed})
+        .values_list('pk', 'purchase_per_unit_price')
+    )
+    lines = []
+    for number, medicine_id, quantity, unit_price in parsed:
+        if medicine_id not in prices:
+            errors[number] = f"unknown medicine {medicine_id}"
+        else:
+            lines.append((medicine_id, quantity, prices[medicine_id] if unit_price is None else unit_price))
+    return lines, [f"Line {number}: {error}" for number, error in sorted(errors.items())]
+
+
+class GoodsReceiptView(TemplateView):
+    """Enter a whole supplier invoice; the page posts it to receive_goods in one request"""
+    template_name = 'medicines/goods_receipt.html'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['recent_receipts'] = GoodsReceipt.objects.all()[:10]
+        return context
+
+
+@require_POST
+def receive_goods(request):
+    """
+    JSON goods receipt API. Body:
+    {"supplier": ..., "invoice_number": ..., "notes": ...,
+     "lines": [{"medicine_id": 1, "quantity": 10, "unit_price": "12.50"}, ...]}
+    unit_price is optional and defaults to the medicine's purchase price per unit.
+    """
+    try:
+        payload = json.loads(request.body)
+        rows = [
+            (line.get('medicine_id'), line.get('quantity'), line.get('unit_price'))
+            for line in payload.get('lines') or []
+        ]
+    except (ValueError, AttributeError):
+        return JsonResponse({'error': 'Body must be a JSON object with a list of lines'}, status=400)
+
+    supplier = str(payload.get('supplier') or '').strip()
+    lines, errors = _receipt_lines(rows)
+    if not supplier:
+        errors.insert(0, "Supplier is required")
+    if not rows:
+        errors.append("Add at least one line")
+    if errors:
+        return JsonResponse({'success': False, 'errors': errors}, status=400)
+
+    try:
+        receipt = GoodsReceipt.receive(
+            supplier, lines,
+            invoice_number=str(payload.get('invoice_number') or '').strip(),
+            notes=str(payload.get('notes') or ''),
+        )
+    except ValueError as e:
+        # e.g. a medicine deleted since the lines were checked
+        return JsonResponse({'success': False, 'errors': [str(e)]}, status=400)
+    return JsonResponse({
+        'id': receipt.id,
+        'supplier': receipt.supplier,
+        'invoice_number': receipt.invoice_number,
+        'received_at': timezone.localtime(receipt.received_at).strftime('%Y-%m-%d %H:%M:%S'),
+        'line_count': receipt.line_count,
+        'total_quantity': receipt.total_quantity,
+        'total_amount': receipt.total_amount,
+    }, encoder=MoneyJSONEncoder)
+
+
+class CatalogImportView(TemplateView):
+    """Upload a CSV catalog or distributor price list (see catalog_import)"""
+    template_name = 'medicines/catalog_import.html'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['columns'] = catalog_import.COLUMNS
+        context['required_columns'] = catalog_import.REQUIRED_COLUMNS
+        return context
+
+    def post(self, request, *args, **kwargs):
+        upload = request.FILES.get('file')
+        if upload is None:
+            messages.error(request, "Choose a CSV file to import")
+            return self.render_to_response(self.get_context_data())
+
+        try:
+            result = catalog_import.import_catalog(io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline=''))
+        except (UnicodeDecodeError, catalog_import.CatalogImportError) as e:
+            messages.error(request, f"Import failed: {e}")
+            return self.render_to_response(self.get_context_data())
+
+        messages.success(
+            request,
+            f"Created {result['created']} and updated {result['updated']} medicine(s), "
+            f"received {result['units']} unit(s)",
+        )
+        return self.render_to_response(self.get_context_data(result=result))
+
+
+class RepricingView(TemplateView):
+    """Preview and apply a bulk price change to a company, formula or rack (see repricing)"""
+    template_name = 'medicines/reprice.html'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        form = context.setdefault('form', {})
+        context['changes'] = [
+            (field, field.replace('_', ' ').capitalize(), form.get(f'{field}_mode', 'percent'), form.get(f'{field}_amount', ''))
+            for field in repricing.FIELDS
+        ]
+        return context
+
+    def post(self, request, *args, **kwargs):
+        form = request.POST
+        try:
+            queryset = repricing.matching(**{name: form.get(name, '') for name in repricing.FILTERS})
+            changes = {
+                field: repricing.parse_change(form.get(f'{field}_mode'), form.get(f'{field}_amount'))
+                for field in repricing.FIELDS
+            }
+        except ValueError as e:
+            messages.error(request, str(e))
+            return self.render_to_response(self.get_context_data(form=form))
+        if not any(changes.values()):
+            messages.error(request, "Enter a change for at least one of packet price, retailers price or discount")
+            return self.render_to_response(self.get_context_data(form=form))
+
+        if form.get('action') == 'apply':
+            updated = repricing.apply(queryset, changes)
+            messages.success(request, f"Repriced {updated} medicine(s)")
+            return self.render_to_response(self.get_context_data(form=form))
 
-    return JsonResponse({'data': data})
\ No newline at end of file
+        rows, count = repricing.preview(queryset, changes)
+        return self.render_to_response(self.get_context_data(form=form, rows=rows, count=count))
@@ -0,0 +1,279 @@
+from decimal import Decimal, InvalidOperation, ROUND_HALF_EVEN
+from fractions import Fraction
+from functools import lru_cache
+
+from django import forms
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+from django.db.models.query_utils import DeferredAttribute
+from django.utils.functional import cached_property
+
+
+def _round_div(numerator, denominator):
+    """Integer division rounded half-even, matching Decimal.quantize defaults"""
+    if denominator < 0:
+        numerator, denominator = -numerator, -denominator
+    quotient, remainder = divmod(numerator, denominator)
+    if remainder:
+        twice = remainder * 2
+        if twice > denominator or (twice == denominator and quotient & 1):
+            quotient += 1
+    return quotient
+
+
+@lru_cache(maxsize=256)
+def _rate_ratio(rate):
+    """(numerator, denominator) of a percentage rate; shops only use a handful"""
+    numerator, denominator = Decimal(rate).as_integer_ratio()
+    return numerator, denominator * 100
+
+
+class Money:
+    """
+    An amount of Pakistani rupees held as an integer number of paisa.
+
+    Money(1234) is Rs 12.34. Use Money.coerce() to build one from rupee
+    values (Decimal, int, str or float). Arithmetic between Money values is
+    plain integer math, so summing cart lines or sale items never allocates
+    or quantizes a Decimal.
+    """
+
+    __slots__ = ('paisa',)
+
+    def __init__(self, paisa=0):
+        self.paisa = paisa
+
+    @classmethod
+    def coerce(cls, value):
+        """Convert a rupee amount (Decimal, int, str, float or Money) to Money"""
+        if type(value) is cls:
+            return value
+        if isinstance(value, int):
+            return cls(value * 100)
+        if isinstance(value, Decimal):
+            return cls(int((value * 100).to_integral_value(ROUND_HALF_EVEN)))
+        if isinstance(value, (float, str)):
+            return cls.coerce(Decimal(str(value).strip()))
+        raise TypeError(f"Cannot convert {type(value).__name__} to Money")
+
+    def to_decimal(self):
+        return Decimal(self.paisa).scaleb(-2)
+
+    def percent(self, rate):
+        """rate percent of this amount, rounded to the nearest paisa"""
+        if type(rate) is int:
+            return Money(_round_div(self.paisa * rate, 100))
+        numerator, denominator = _rate_ratio(rate)
+        return Money(_round_div(self.paisa * numerator, denominator))
+
+    def round_to_rupee(self):
+        return Money(_round_div(self.paisa, 100) * 100)
+
+    # Representation
+
+    def __str__(self):
+        rupees, paisa = divmod(abs(self.paisa), 100)
+        sign = '-' if self.paisa < 0 else ''
+        return f"{sign}{rupees}.{paisa:02d}"
+
+    def __repr__(self):
+        return f"Money('{self}')"
+
+    def __format__(self, spec):
+        if not spec:
+            return str(self)
+        return format(self.to_decimal(), spec)
+
+    def __float__(self):
+        return self.paisa / 100
+
+    def __round__(self, ndigits=None):
+        if ndigits is None:
+            return _round_div(self.paisa, 100)
+        if ndigits >= 2:
+            return self
+        step = 10 ** (2 - ndigits)
+        return Money(_round_div(self.paisa, step) * step)
+
+    def __bool__(self):
+        return self.paisa != 0
+
+    def __hash__(self):
+        # Hash like the equal Decimal/int so mixed-type dict keys behave
+        return hash(Fraction(self.paisa, 100))
+
+    def __reduce__(self):
+        return (Money, (self.paisa,))
+
+    # Comparison
+
+    def __eq__(self, other):
+        if type(other) is Money:
+            return self.paisa == other.paisa
+        other = _as_money(other)
+        if other is NotImplemented:
+            return other
+        return self.paisa == other.paisa
+
+    def __lt__(self, other):
+        other = _as_money(other)
+        if other is NotImplemented:
+            return other
+        return self.paisa < other.paisa
+
+    def __le__(self, other):
+        other = _as_money(other)
+        if other is NotImplemented:
+            return other
+        return self.paisa <= other.paisa
+
+    def __gt__(self, other):
+        other = _as_money(other)
+        if other is NotImplemented:
+            return other
+        return self.paisa > other.paisa
+
+    def __ge__(self, other):
+        other = _as_money(other)
+        if other is NotImplemented:
+            return other
+        return self.paisa >= other.paisa
+
+    # Arithmetic
+
+    def __add__(self, other):
+        if type(other) is Money:
+            return Money(self.paisa + other.paisa)
+        other = _as_money(other)
+        if other is NotImplemented:
+            return other
+        return Money(self.paisa + other.paisa)
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        if type(other) is Money:
+            return Money(self.paisa - other.paisa)
+        other = _as_money(other)
+        if other is NotImplemented:
+            return other
+        return Money(self.paisa - other.paisa)
+
+    def __rsub__(self, other):
+        other = _as_money(other)
+        if other is NotImplemented:
+            return other
+        return Money(other.paisa - self.paisa)
+
+    def __mul__(self, other):
+        if type(other) is int:
+            return Money(self.paisa * other)
+        if isinstance(other, int):
+            return Money(self.paisa * other)
+        if isinstance(other, (Decimal, float)):
+            exact = Decimal(self.paisa) * Decimal(str(other))
+            return Money(int(exact.to_integral_value(ROUND_HALF_EVEN)))
+        return NotImplemented
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, other):
+        if type(other) is int:
+            return Money(_round_div(self.paisa, other))
+        if type(other) is Money:
+            return Decimal(self.paisa) / Decimal(other.paisa)
+        if isinstance(other, int):
+            return Money(_round_div(self.paisa, other))
+        if isinstance(other, (Decimal, float)):
+            exact = Decimal(self.paisa) / Decimal(str(other))
+            return Money(int(exact.to_integral_value(ROUND_HALF_EVEN)))
+        return NotImplemented
+
+    def __neg__(self):
+        return Money(-self.paisa)
+
+    def __pos__(self):
+        return self
+
+    def __abs__(self):
+        return Money(abs(self.paisa))
+
+
+Money.ZERO = Money(0)
+
+
+def _as_money(value):
+    if type(value) is Money:
+        return value
+    if isinstance(value, (int, Decimal, float)):
+        return Money.coerce(value)
+    return NotImplemented
+
+
+class MoneyAttribute(DeferredAttribute):
+    """Model attribute that always holds Money, whatever type is assigned"""
+
+    def __set__(self, instance, value):
+        if value is not None and type(value) is not Money and not hasattr(value, 'resolve_expression'):
+            value = Money.coerce(value)
+        instance.__dict__[self.field.attname] = value
+
+
+class MoneyField(models.BigIntegerField):
+    """
+    Money stored as an integer number of paisa.
+
+    Values come back from the database (including Sum() aggregates over the
+    column) as Money. Forms and assignments accept rupee amounts.
+    """
+
+    description = "Amount of money stored as integer paisa"
+    descriptor_class = MoneyAttribute
+
+    @cached_property
+    def validators(self):
+        # Skip the integer range validators, they are expressed in paisa
+        return [*self.default_validators, *self._validators]
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return value
+        return Money(int(value))
+
+    def to_python(self, value):
+        if value is None or type(value) is Money:
+            return value
+        try:
+            return Money.coerce(value)
+        except (InvalidOperation, TypeError, ValueError):
+            raise ValidationError(
+                self.error_messages['invalid'],
+                code='invalid',
+                params={'value': value},
+            )
+
+    def get_prep_value(self, value):
+        value = models.Field.get_prep_value(self, value)
+        if value is None:
+            return None
+        if type(value) is Money:
+            return value.paisa
+        return Money.coerce(value).paisa
+
+    def formfield(self, **kwargs):
+        return models.Field.formfield(self, **{
+            'form_class': forms.DecimalField,
+            'max_digits': 17,
+            'decimal_places': 2,
+            **kwargs,
+        })
+
+
+class MoneyJSONEncoder(DjangoJSONEncoder):
+    """JSON encoder that writes Money as a decimal string ("12.50"), like Decimal"""
+
+    def default(self, o):
+        if type(o) is Money:
+            return str(o)
+        return super().default(o)
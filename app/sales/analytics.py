@@ -0,0 +1,65 @@
+"""
+Sales analytics over the DailySalesFact roll-up.
+
+Every query here is a single grouped query over (day, medicine) facts
+for the requested range, so answers do not depend on the size of the
+SaleItem / ReturnItem history.
+"""
+from datetime import timedelta
+
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import DailySalesFact
+
+# ?metric= values and the aggregate each one ranks by
+METRICS = {
+    'quantity': 'net_quantity',
+    'revenue': 'revenue',
+    'profit': 'profit',
+    'returns': 'quantity_returned',
+}
+
+TOTALS = {
+    'quantity_sold': Sum('quantity_sold'),
+    'quantity_returned': Sum('quantity_returned'),
+    'revenue': Sum('revenue'),
+    'cost': Sum('cost'),
+    'discount': Sum('discount'),
+    'profit': Sum('profit'),
+}
+
+
+def default_range(days=30):
+    end = timezone.localdate()
+    return end - timedelta(days=days - 1), end
+
+
+def _facts(start, end):
+    return DailySalesFact.objects.filter(day__gte=start, day__lte=end)
+
+
+def top_medicines(start, end, metric='revenue', limit=10):
+    """Top `limit` medicines by metric (quantity, revenue, profit or returns)"""
+    return list(
+        _facts(start, end)
+        .values('medicine', 'medicine__name', 'medicine__company')
+        .annotate(**TOTALS)
+        .annotate(net_quantity=F('quantity_sold') - F('quantity_returned'))
+        .order_by(f'-{METRICS[metric]}', 'medicine')
+        [:limit]
+    )
+
+
+def by_company(start, end):
+    """Totals and margin per company, highest revenue first"""
+    rows = list(
+        _facts(start, end)
+        .values('medicine__company')
+        .annotate(**TOTALS)
+        .order_by('-revenue')
+    )
+    for row in rows:
+        row['company'] = row.pop('medicine__company')
+        row['margin'] = round(float(row['profit'] / row['revenue']) * 100, 2) if row['revenue'] else None
+    return rows
@@ -12,6 +12,8 @@ from django.db import connection
 from django.utils import timezone
 from django.db.models import Sum
 
+from app.money import Money
+
 logger = logging.getLogger(__name__)
 
 class BackupManager:
@@ -141,17 +143,10 @@ class BackupManager:
                 'Total Quantity Sold', 'Total Quantity Returned'
             ]
             
-            sales = Sale.objects.all().prefetch_related('items', 'returns__items')
+            sales = Sale.objects.all()
             data_rows = []
             
             for sale in sales:
-                item_count = sale.items.count()
-                total_quantity = sale.items.aggregate(total=Sum('quantity'))['total'] or 0
-                returned_quantity = sum(
-                    item.returned_quantity 
-                    for item in sale.items.all()
-                )
-                
                 data_rows.append([
                     sale.id,
                     timezone.localtime(sale.sale_date).strftime('%Y-%m-%d %H:%M:%S'),
@@ -164,9 +159,9 @@ class BackupManager:
                     float(sale.total_profit),
                     float(sale.returned_amount),
                     sale.is_fully_returned,
-                    item_count,
-                    total_quantity,
-                    returned_quantity
+                    sale.item_count,
+                    sale.total_quantity,
+                    sale.returned_quantity
                 ])
             
             return self._generate_csv_data(headers, data_rows, "sales_records")
@@ -222,12 +217,10 @@ class BackupManager:
                 'Last Purchase Date', 'Last Purchase Price'
             ]
             
-            medicines = Medicine.objects.prefetch_related('purchases')
+            medicines = Medicine.objects.with_pricing().with_expiry()
             data_rows = []
             
             for med in medicines:
-                last_purchase = med.last_purchase
-                
                 data_rows.append([
                     med.id,
                     med.name,
@@ -246,8 +239,8 @@ class BackupManager:
                     med.rack_number,
                     med.total_purchased,
                     float(med.total_purchase_amount),
-                    last_purchase.purchase_date.strftime('%Y-%m-%d') if last_purchase else '',
-                    float(last_purchase.unit_price) if last_purchase else 0
+                    med.last_purchase_date.strftime('%Y-%m-%d') if med.last_purchase_date else '',
+                    float(med.last_purchase_price)
                 ])
             
             return self._generate_csv_data(headers, data_rows, "medicine_inventory")
@@ -293,13 +286,10 @@ class BackupManager:
             
             # Calculate all financial metrics
             sales_summary = Sale.get_aggregated_data()
-            total_medicine_value = sum(
-                med.stock * med.purchase_per_unit_price 
-                for med in Medicine.objects.all()
-            )
+            total_medicine_value = Medicine.objects.inventory_value()
             total_purchase_amount = PurchaseRecord.objects.aggregate(
                 total=Sum('total_amount')
-            )['total'] or Decimal('0.00')
+            )['total'] or Money.ZERO
             
             data_rows = [
                 ['Total Sales Count', sales_summary['total_sales'], 'Number of completed sales'],
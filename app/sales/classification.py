@@ -0,0 +1,198 @@
+"""
+ABC/XYZ classification of medicines from sales history.
+
+ABC ranks medicines by their share of sale-line revenue: A covers the first
+80% of cumulative revenue, B the next 15% and C the rest. XYZ grades demand
+variability by the coefficient of variation of weekly units sold: X up to
+0.5, Y up to 1.0 and Z above that.
+
+Units and revenue are read as columns from the sale line store, plus one
+grouped query for lines not exported yet, and the shares and coefficients
+are computed with NumPy over the whole history at once, without a Python
+loop per medicine. The result is cached until local midnight.
+"""
+from datetime import datetime, time, timedelta
+
+import numpy as np
+from django.core.cache import cache
+from django.db.models import BigIntegerField, Sum
+from django.utils import timezone
+
+from . import linestore
+
+# Classes and the cumulative revenue share each one extends to
+ABC_THRESHOLDS = (('A', 0.80), ('B', 0.95))
+ABC_DEFAULT = 'C'
+# Classes and the largest coefficient of variation each one allows
+XYZ_THRESHOLDS = (('X', 0.5), ('Y', 1.0))
+XYZ_DEFAULT = 'Z'
+
+# Two years of weekly demand
+HISTORY_DAYS = 728
+PERIOD_DAYS = 7
+
+CACHE_KEY = 'sales:abc-xyz'
+
+
+def _seconds_until_midnight():
+    now = timezone.localtime()
+    midnight = timezone.make_aware(datetime.combine(now.date() + timedelta(days=1), time.min))
+    return max(int((midnight - now).total_seconds()), 1)
+
+
+def _stored_lines(start, end):
+    """
+    (medicine ids, day ordinals, units, revenue) of the sale lines from
+    local day start to end that are already in the columnar line store,
+    and the last SaleItem id exported to it.
+    """
+    last_item_id = linestore.read_meta()['last_item_id']
+    columns = linestore.open_columns(names=['day', 'medicine', 'quantity', 'price', 'discount'])
+    days = columns['day']
+    selected = (days >= start.toordinal()) & (days <= end.toordinal()) & (columns['medicine'] != 0)
+    units = columns['quantity'][selected].astype(np.int64)
+    return (
+        columns['medicine'][selected].astype(np.int64),
+        days[selected].astype(np.int64),
+        units,
+        units * (columns['price'][selected] - columns['discount'][selected]),
+    ), last_item_id
+
+
+def _queried_lines(start, end, after):
+    """
+    The same columns for sale lines with an id above `after`, one entry
+    per medicine per sale.
+
+    Lines are grouped per (sale, medicine) in SQL and mapped to their
+    sale's local day with NumPy, which avoids a per-row timezone
+    conversion in the database.
+    """
+    from .models import Sale, SaleItem
+
+    since = timezone.make_aware(datetime.combine(start, time.min))
+    until = timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min))
+
+    lines = list(
+        SaleItem.objects
+        .filter(id__gt=after, medicine__isnull=False, sale__sale_date__gte=since, sale__sale_date__lt=until)
+        .values_list('sale', 'medicine')
+        .annotate(
+            units=Sum('quantity'),
+            revenue=Sum('total_price', output_field=BigIntegerField()),
+        )
+        .order_by()
+    )
+    if not lines:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, empty, empty
+    sales = list(Sale.objects.filter(id__in={line[0] for line in lines}).values_list('id', 'sale_date'))
+
+    sale_ids, sale_dates = zip(*sales)
+    sale_ids = np.array(sale_ids, dtype=np.int64)
+    sale_days = np.fromiter(
+        (timezone.localtime(sale_date).toordinal() for sale_date in sale_dates),
+        dtype=np.int64, count=len(sale_dates),
+    )
+    order = np.argsort(sale_ids)
+    sale_ids, sale_days = sale_ids[order], sale_days[order]
+
+    line_sales, medicines, units, revenue = (np.array(column, dtype=np.int64) for column in zip(*lines))
+    return medicines, sale_days[np.searchsorted(sale_ids, line_sales)], units, revenue
+
+
+def load_daily(start, end):
+    """
+    Columns (medicine ids, day ordinals, units, revenue in paisa) of sale
+    lines from local day start to end inclusive.
+
+    Lines already exported to the line store (manage.py export_sales_store)
+    are read from its memory-mapped columns, so only lines sold since the
+    last export are queried. A sale deleted since then is still counted
+    until the next export clears it.
+    """
+    stored, last_item_id = _stored_lines(start, end)
+    queried = _queried_lines(start, end, after=last_item_id)
+    return tuple(np.concatenate(pair) for pair in zip(stored, queried))
+
+
+def classify_arrays(medicines, days, units, revenue, start, periods):
+    """
+    Classify from columnar per-day sales.
+
+    Returns (medicine ids, ABC classes, XYZ classes, revenue share,
+    cumulative share, coefficient of variation) as parallel arrays.
+    """
+    medicine_ids, rows = np.unique(medicines, return_inverse=True)
+    count = len(medicine_ids)
+
+    demand = np.zeros((count, periods), dtype=np.float64)
+    np.add.at(demand, (rows, (days - start.toordinal()) // PERIOD_DAYS), units)
+
+    # Pareto shares, highest revenue first; a medicine is placed by the
+    # share accumulated before it so the top seller is always A
+    totals = np.bincount(rows, weights=revenue, minlength=count)
+    grand_total = totals.sum()
+    share = totals / grand_total if grand_total > 0 else np.zeros(count)
+    order = np.argsort(-share, kind='stable')
+    cumulative = np.empty(count)
+    cumulative[order] = np.cumsum(share[order])
+    preceding = cumulative - share
+    abc = np.select(
+        [preceding < limit for name, limit in ABC_THRESHOLDS],
+        [name for name, limit in ABC_THRESHOLDS],
+        ABC_DEFAULT,
+    )
+
+    mean = demand.mean(axis=1)
+    cv = np.divide(demand.std(axis=1), mean, out=np.full(count, np.inf), where=mean > 0)
+    xyz = np.select(
+        [cv <= limit for name, limit in XYZ_THRESHOLDS],
+        [name for name, limit in XYZ_THRESHOLDS],
+        XYZ_DEFAULT,
+    )
+
+    return medicine_ids, abc, xyz, share, cumulative, cv
+
+
+def compute_classification(today=None):
+    today = today or timezone.localdate()
+    periods = -(-HISTORY_DAYS // PERIOD_DAYS)
+    start = today - timedelta(days=periods * PERIOD_DAYS - 1)
+
+    medicine_ids, abc, xyz, share, cumulative, cv = classify_arrays(
+        *load_daily(start, today), start=start, periods=periods
+    )
+    return {
+        'date': today,
+        'start': start,
+        'classes': {
+            medicine_id: {
+                'abc': abc_class,
+                'xyz': xyz_class,
+                'revenue_share': round(revenue_share, 4),
+                'cumulative_share': round(cumulative_share, 4),
+                'cv': round(variation, 3) if np.isfinite(variation) else None,
+            }
+            for medicine_id, abc_class, xyz_class, revenue_share, cumulative_share, variation in zip(
+                medicine_ids.tolist(), abc.tolist(), xyz.tolist(),
+                share.tolist(), cumulative.tolist(), cv.tolist(),
+            )
+        },
+    }
+
+
+def classification():
+    """Cached classification for today: {'date', 'start', 'classes': {medicine_id: {...}}}"""
+    today = timezone.localdate()
+    data = cache.get(CACHE_KEY)
+    if data is None or data['date'] != today:
+        data = compute_classification(today)
+        cache.set(CACHE_KEY, data, timeout=_seconds_until_midnight())
+    return data
+
+
+def classes_for(medicine_id):
+    """(abc, xyz) for one medicine, or (None, None) without sales in the window"""
+    entry = classification()['classes'].get(medicine_id)
+    return (entry['abc'], entry['xyz']) if entry else (None, None)
@@ -45,8 +45,7 @@ class ReturnItemForm(forms.ModelForm):
             # Set initial returned_price based on unit price
             if 'quantity' in self.initial:
                 self.initial['returned_price'] = (
-                    Decimal(str(self.sale_item.unit_price)) * 
-                    Decimal(str(self.initial['quantity'])))
+                    self.sale_item.unit_price * int(self.initial['quantity']))
     
     def clean_quantity(self):
         quantity = self.cleaned_data['quantity']
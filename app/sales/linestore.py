@@ -0,0 +1,208 @@
+"""
+Append-only columnar copy of sale lines for analytics.
+
+Every SaleItem becomes one row across a set of flat binary column files
+(see COLUMNS) in settings.SALES_STORE_DIR, with meta.json recording how
+many rows are valid and the last SaleItem / ReturnItem ids exported.
+refresh() appends lines newer than the last exported id and brings the
+returned quantities up to date; readers open the columns with
+numpy.memmap, so aggregations over years of history run at array speed
+without building a model instance per row and without reading whole
+files into memory.
+
+Lines of a deleted sale stay in the store with quantity and returned set
+to zero. Lines whose medicine was later deleted keep the old medicine id.
+"""
+import json
+import os
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+# Column name -> dtype; money columns are paisa per unit
+COLUMNS = {
+    'id': np.int64,        # SaleItem id, ascending
+    'day': np.int32,       # local sale date as a date ordinal
+    'medicine': np.int64,  # 0 when the medicine was already deleted
+    'quantity': np.int32,
+    'returned': np.int32,
+    'price': np.int64,
+    'cost': np.int64,
+    'discount': np.int64,
+}
+
+EXPORT_BATCH = 50000
+META_FILE = 'meta.json'
+
+
+def store_dir():
+    return settings.SALES_STORE_DIR
+
+
+def _path(name):
+    return os.path.join(store_dir(), f'{name}.bin')
+
+
+def read_meta():
+    try:
+        with open(os.path.join(store_dir(), META_FILE)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'rows': 0, 'last_item_id': 0, 'last_return_id': 0}
+
+
+def _write_meta(meta):
+    path = os.path.join(store_dir(), META_FILE)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(meta, f)
+    os.replace(path + '.tmp', path)
+
+
+def open_columns(mode='r', names=None):
+    """{column: numpy.memmap} over the valid rows; empty arrays when there are none"""
+    rows = read_meta()['rows']
+    columns = {}
+    for name in names or COLUMNS:
+        dtype = COLUMNS[name]
+        if rows:
+            columns[name] = np.memmap(_path(name), dtype=dtype, mode=mode, shape=(rows,))
+        else:
+            columns[name] = np.empty(0, dtype=dtype)
+    return columns
+
+
+def _append_lines(meta):
+    """Append SaleItems newer than meta['last_item_id']; returns rows appended"""
+    from .models import SaleItem
+
+    sale_days = {}
+    appended = 0
+    while True:
+        lines = list(
+            SaleItem.objects
+            .filter(id__gt=meta['last_item_id'])
+            .order_by('id')
+            .values_list(
+                'id', 'sale_id', 'sale__sale_date', 'medicine_id', 'quantity',
+                'selling_price_per_unit', 'purchase_price_per_unit', 'discount_per_unit',
+            )[:EXPORT_BATCH]
+        )
+        if not lines:
+            return appended
+
+        for sale_id, sale_date in {line[1]: line[2] for line in lines}.items():
+            if sale_id not in sale_days:
+                sale_days[sale_id] = timezone.localtime(sale_date).toordinal()
+
+        batch = {
+            'id': [line[0] for line in lines],
+            'day': [sale_days[line[1]] for line in lines],
+            'medicine': [line[3] or 0 for line in lines],
+            'quantity': [line[4] for line in lines],
+            'returned': [0] * len(lines),
+            'price': [line[5].paisa for line in lines],
+            'cost': [line[6].paisa for line in lines],
+            'discount': [line[7].paisa for line in lines],
+        }
+        for name, dtype in COLUMNS.items():
+            with open(_path(name), 'ab') as f:
+                np.asarray(batch[name], dtype=dtype).tofile(f)
+
+        meta['rows'] += len(lines)
+        meta['last_item_id'] = lines[-1][0]
+        _write_meta(meta)
+        appended += len(lines)
+
+
+def _apply_returns(meta):
+    """Set the returned quantity of every line touched by a new ReturnItem"""
+    from django.db.models import Max, Sum
+    from .models import ReturnItem
+
+    new_returns = ReturnItem.objects.filter(id__gt=meta['last_return_id'])
+    last_return_id = new_returns.aggregate(last=Max('id'))['last']
+    if last_return_id is None:
+        return 0
+
+    # Totals rather than increments, so a refresh interrupted before the
+    # meta file is written can simply run again
+    totals = list(
+        ReturnItem.objects
+        .filter(sale_item__in=new_returns.values('sale_item'), id__lte=last_return_id)
+        .values_list('sale_item')
+        .annotate(total=Sum('quantity'))
+        .order_by()
+    )
+    if totals and meta['rows']:
+        columns = open_columns('r+', ['id', 'returned'])
+        item_ids, returned = (np.array(column, dtype=np.int64) for column in zip(*totals))
+        positions = np.searchsorted(columns['id'], item_ids)
+        found = positions < meta['rows']
+        found[found] &= columns['id'][positions[found]] == item_ids[found]
+        columns['returned'][positions[found]] = returned[found]
+        columns['returned'].flush()
+
+    meta['last_return_id'] = last_return_id
+    _write_meta(meta)
+    return len(totals)
+
+
+def _clear_deleted(meta):
+    """Zero the quantities of exported lines whose sale has since been deleted"""
+    from .models import SaleItem
+
+    if not meta['rows']:
+        return 0
+    columns = open_columns('r+', ['id', 'quantity', 'returned'])
+    live = np.count_nonzero(columns['quantity'])
+    if SaleItem.objects.filter(id__lte=meta['last_item_id']).count() >= live:
+        return 0
+
+    existing = np.fromiter(
+        SaleItem.objects.filter(id__lte=meta['last_item_id']).values_list('id', flat=True).iterator(),
+        dtype=np.int64,
+    )
+    gone = ~np.isin(columns['id'], existing) & (columns['quantity'] != 0)
+    columns['quantity'][gone] = 0
+    columns['returned'][gone] = 0
+    columns['quantity'].flush()
+    columns['returned'].flush()
+    return int(np.count_nonzero(gone))
+
+
+def refresh():
+    """
+    Bring the store up to date incrementally.
+
+    Returns a dict with the number of lines appended, lines whose returned
+    quantity changed and lines cleared because their sale was deleted.
+    """
+    os.makedirs(store_dir(), exist_ok=True)
+    meta = read_meta()
+
+    # Drop anything written after the last complete batch
+    for name, dtype in COLUMNS.items():
+        size = meta['rows'] * np.dtype(dtype).itemsize
+        if os.path.exists(_path(name)):
+            if os.path.getsize(_path(name)) != size:
+                os.truncate(_path(name), size)
+        else:
+            open(_path(name), 'wb').close()
+
+    return {
+        'cleared': _clear_deleted(meta),
+        'appended': _append_lines(meta),
+        'returns': _apply_returns(meta),
+    }
+
+
+def rebuild():
+    """Export every sale line again from scratch"""
+    os.makedirs(store_dir(), exist_ok=True)
+    for name in COLUMNS:
+        if os.path.exists(_path(name)):
+            os.remove(_path(name))
+    _write_meta({'rows': 0, 'last_item_id': 0, 'last_return_id': 0})
+    return refresh()
+
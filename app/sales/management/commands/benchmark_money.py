@@ -0,0 +1,67 @@
+import random
+import timeit
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+
+from app.money import Money
+
+
+class Command(BaseCommand):
+    help = "Micro-benchmark Decimal vs integer paisa (Money) for cart/sale-line math"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lines', type=int, default=1000, help='Cart lines per run')
+        parser.add_argument('--repeat', type=int, default=200, help='Runs per representation')
+
+    def handle(self, *args, **options):
+        rng = random.Random(42)
+        lines = []
+        for _ in range(options['lines']):
+            paisa = rng.randint(100, 500000)
+            lines.append((paisa, rng.choice([0, 5, 10, 12]), rng.randint(1, 20)))
+
+        decimal_lines = [(Decimal(p) / 100, Decimal(d), q) for p, d, q in lines]
+        money_lines = [(Money(p), Decimal(d), q) for p, d, q in lines]
+
+        def decimal_cart():
+            # Mirrors the previous Decimal(str(x)) / quantize style
+            subtotal = Decimal('0.00')
+            discount_amount = Decimal('0.00')
+            for price, discount, quantity in decimal_lines:
+                unit_discount = (Decimal(str(price)) * discount / 100).quantize(Decimal('0.01'))
+                total_price = (Decimal(str(price)) - unit_discount) * Decimal(str(quantity))
+                unit_price = (total_price / Decimal(str(quantity))).quantize(Decimal('0.01'))
+                subtotal += Decimal(str(price)) * quantity
+                discount_amount += unit_discount * quantity
+                subtotal += unit_price - unit_price
+            return subtotal - discount_amount
+
+        def money_cart():
+            subtotal = Money.ZERO
+            discount_amount = Money.ZERO
+            for price, discount, quantity in money_lines:
+                unit_discount = price.percent(discount) if discount else Money.ZERO
+                total_price = (price - unit_discount) * quantity
+                unit_price = total_price / quantity
+                subtotal += price * quantity
+                discount_amount += unit_discount * quantity
+                subtotal += unit_price - unit_price
+            return subtotal - discount_amount
+
+        if decimal_cart() != money_cart().to_decimal():
+            self.stderr.write(self.style.WARNING("Representations disagree on the cart total"))
+
+        repeat = options['repeat']
+        results = {
+            'Decimal': min(timeit.repeat(decimal_cart, number=1, repeat=repeat)),
+            'Money (paisa)': min(timeit.repeat(money_cart, number=1, repeat=repeat)),
+        }
+
+        baseline = results['Decimal']
+        for name, seconds in results.items():
+            per_line = seconds / len(lines) * 1e6
+            self.stdout.write(
+                f"{name:<15} {seconds * 1e3:8.3f} ms per {len(lines)} lines "
+                f"({per_line:.2f} us/line, {baseline / seconds:.2f}x)"
+            )
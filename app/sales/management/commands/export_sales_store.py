@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from app.sales import linestore
+
+
+class Command(BaseCommand):
+    help = "Append new sale lines to the columnar analytics store and sync returned quantities"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help='Discard the store and export every sale line again')
+
+    def handle(self, *args, **options):
+        result = linestore.rebuild() if options['rebuild'] else linestore.refresh()
+        self.stdout.write(self.style.SUCCESS(
+            f"Appended {result['appended']} line(s), updated returns on {result['returns']}, "
+            f"cleared {result['cleared']} deleted line(s); "
+            f"{linestore.read_meta()['rows']} line(s) in {linestore.store_dir()}"
+        ))
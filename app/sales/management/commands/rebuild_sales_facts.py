@@ -0,0 +1,26 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app.sales.models import DailySalesFact, DailySalesTotal
+
+
+class Command(BaseCommand):
+    help = "Rebuild the per-day, per-medicine sales facts and the running daily sales totals"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='First local day to rebuild (YYYY-MM-DD), default: first sale')
+        parser.add_argument('--end', help='Last local day to rebuild (YYYY-MM-DD), default: today')
+        parser.add_argument('--batch-days', type=int, default=31, help='Days rebuilt per transaction')
+
+    def handle(self, *args, **options):
+        try:
+            start = datetime.strptime(options['start'], '%Y-%m-%d').date() if options['start'] else None
+            end = datetime.strptime(options['end'], '%Y-%m-%d').date() if options['end'] else None
+        except ValueError:
+            raise CommandError("Dates must be YYYY-MM-DD")
+
+        written = DailySalesFact.rebuild(start, end, batch_days=options['batch_days'])
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} daily sales fact(s)"))
+        days = DailySalesTotal.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Wrote running totals for {days} day(s)"))
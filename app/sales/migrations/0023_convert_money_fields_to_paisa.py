@@ -0,0 +1,115 @@
+# Converts rupee DecimalFields to integer paisa MoneyFields.
+#
+# Each column is converted by adding a temporary paisa column, copying
+# ROUND(value * 100) into it in one UPDATE, dropping the old column and
+# renaming the new one into place. All steps are reversible.
+
+import app.money
+from django.db import migrations, models
+from django.db.models import BigIntegerField, ExpressionWrapper, F, FloatField, Value
+from django.db.models.functions import Cast, Round
+
+
+def convert_to_paisa(model_name, field_name, decimal_field, money_field):
+    tmp_name = f'{field_name}_paisa'
+
+    def forwards(apps, schema_editor):
+        model = apps.get_model('sales', model_name)
+        model.objects.update(**{
+            tmp_name: Cast(Round(F(field_name) * 100), BigIntegerField())
+        })
+
+    def backwards(apps, schema_editor):
+        model = apps.get_model('sales', model_name)
+        model.objects.update(**{
+            field_name: ExpressionWrapper(F(tmp_name) / Value(100.0), output_field=FloatField())
+        })
+
+    return [
+        migrations.AddField(model_name, tmp_name, app.money.MoneyField(default=0)),
+        migrations.RunPython(forwards, backwards),
+        migrations.AlterField(model_name, field_name, decimal_field),
+        migrations.RemoveField(model_name, field_name),
+        migrations.RenameField(model_name, tmp_name, field_name),
+        migrations.AlterField(model_name, field_name, money_field),
+    ]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0022_remove_returnitem_discount_restored_and_more'),
+    ]
+
+    operations = [
+        *convert_to_paisa(
+            'sale', 'subtotal',
+            models.DecimalField(decimal_places=2, default=0, max_digits=10),
+            app.money.MoneyField(),
+        ),
+        *convert_to_paisa(
+            'sale', 'discount_amount',
+            models.DecimalField(decimal_places=2, default=0, max_digits=10),
+            app.money.MoneyField(default=0),
+        ),
+        *convert_to_paisa(
+            'sale', 'price_deducted',
+            models.DecimalField(decimal_places=2, default=0, max_digits=10),
+            app.money.MoneyField(default=0),
+        ),
+        *convert_to_paisa(
+            'sale', 'final_amount',
+            models.DecimalField(decimal_places=2, default=0, max_digits=10),
+            app.money.MoneyField(),
+        ),
+        *convert_to_paisa(
+            'sale', 'extra',
+            models.DecimalField(decimal_places=2, default=0, max_digits=10),
+            app.money.MoneyField(default=0),
+        ),
+        *convert_to_paisa(
+            'sale', '_net_amount',
+            models.DecimalField(decimal_places=2, default=0, max_digits=10),
+            app.money.MoneyField(default=0),
+        ),
+        *convert_to_paisa(
+            'sale', '_total_profit',
+            models.DecimalField(decimal_places=2, default=0, max_digits=10),
+            app.money.MoneyField(default=0),
+        ),
+        *convert_to_paisa(
+            'sale', '_returned_amount',
+            models.DecimalField(decimal_places=2, default=0, max_digits=10),
+            app.money.MoneyField(default=0),
+        ),
+        *convert_to_paisa(
+            'saleitem', 'selling_price_per_unit',
+            models.DecimalField(decimal_places=2, default=0, max_digits=10),
+            app.money.MoneyField(),
+        ),
+        *convert_to_paisa(
+            'saleitem', 'purchase_price_per_unit',
+            models.DecimalField(decimal_places=2, default=0, max_digits=10),
+            app.money.MoneyField(),
+        ),
+        *convert_to_paisa(
+            'saleitem', 'discount_per_unit',
+            models.DecimalField(decimal_places=2, default=0, max_digits=10),
+            app.money.MoneyField(default=0),
+        ),
+        *convert_to_paisa(
+            'saleitem', 'total_price',
+            models.DecimalField(decimal_places=2, default=0, max_digits=10),
+            app.money.MoneyField(),
+        ),
+        *convert_to_paisa(
+            'return', 'refund_amount',
+            models.DecimalField(decimal_places=0, default=0, max_digits=10),
+            app.money.MoneyField(default=0),
+        ),
+        *convert_to_paisa(
+            'returnitem', 'returned_price',
+            models.DecimalField(decimal_places=0, default=0, max_digits=10),
+            app.money.MoneyField(),
+        ),
+    ]
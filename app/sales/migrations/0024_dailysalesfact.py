@@ -0,0 +1,35 @@
+# Generated by Django 5.2.3 on 2026-10-19 07:33
+
+import app.money
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medicine', '0012_alter_medicine_expiry_date'),
+        ('sales', '0023_convert_money_fields_to_paisa'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySalesFact',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('quantity_sold', models.IntegerField(default=0)),
+                ('quantity_returned', models.IntegerField(default=0)),
+                ('revenue', app.money.MoneyField(default=0)),
+                ('cost', app.money.MoneyField(default=0)),
+                ('discount', app.money.MoneyField(default=0)),
+                ('profit', app.money.MoneyField(default=0)),
+                ('medicine', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='medicine.medicine')),
+            ],
+            options={
+                'ordering': ['-day'],
+                'indexes': [models.Index(fields=['day'], name='sales_daily_day_325e17_idx')],
+                'constraints': [models.UniqueConstraint(fields=('day', 'medicine'), name='unique_daily_sales_fact')],
+            },
+        ),
+    ]
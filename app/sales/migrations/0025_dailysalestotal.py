@@ -0,0 +1,69 @@
+# Generated by Django 5.2.3 on 2026-10-19 07:48
+
+import app.money
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+METRICS = ['sales_count', 'gross', 'net', 'profit', 'returned']
+
+
+def backfill_daily_totals(apps, schema_editor):
+    Sale = apps.get_model('sales', 'Sale')
+    DailySalesTotal = apps.get_model('sales', 'DailySalesTotal')
+
+    rows = (
+        Sale.objects
+        .annotate(day=TruncDate('sale_date', tzinfo=timezone.get_current_timezone()))
+        .values('day')
+        .annotate(
+            sales_count=Count('id'),
+            gross=Sum('final_amount'),
+            net=Sum('_net_amount'),
+            profit=Sum('_total_profit'),
+            returned=Sum('_returned_amount'),
+        )
+        .order_by('day')
+    )
+    running = dict.fromkeys(METRICS, 0)
+    totals = []
+    for row in rows:
+        values = {name: row[name] or 0 for name in METRICS}
+        for name in METRICS:
+            running[name] = running[name] + values[name]
+        totals.append(DailySalesTotal(
+            day=row['day'], **values, **{f'cum_{name}': running[name] for name in METRICS}
+        ))
+    DailySalesTotal.objects.bulk_create(totals, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0024_dailysalesfact'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySalesTotal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(unique=True)),
+                ('sales_count', models.IntegerField(default=0)),
+                ('gross', app.money.MoneyField(default=0)),
+                ('net', app.money.MoneyField(default=0)),
+                ('profit', app.money.MoneyField(default=0)),
+                ('returned', app.money.MoneyField(default=0)),
+                ('cum_sales_count', models.BigIntegerField(default=0)),
+                ('cum_gross', app.money.MoneyField(default=0)),
+                ('cum_net', app.money.MoneyField(default=0)),
+                ('cum_profit', app.money.MoneyField(default=0)),
+                ('cum_returned', app.money.MoneyField(default=0)),
+            ],
+            options={
+                'ordering': ['-day'],
+            },
+        ),
+        migrations.RunPython(backfill_daily_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.3 on 2026-10-19 07:51
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_sale_hour(apps, schema_editor):
+    Sale = apps.get_model('sales', 'Sale')
+
+    sales = []
+    for sale in Sale.objects.only('id', 'sale_date').iterator(chunk_size=2000):
+        local_date = timezone.localtime(sale.sale_date)
+        sale.sale_hour = local_date.hour
+        sale.sale_weekday = local_date.weekday()
+        sales.append(sale)
+        if len(sales) == 2000:
+            Sale.objects.bulk_update(sales, ['sale_hour', 'sale_weekday'], batch_size=500)
+            sales = []
+    Sale.objects.bulk_update(sales, ['sale_hour', 'sale_weekday'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0025_dailysalestotal'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sale',
+            name='sale_hour',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='sale',
+            name='sale_weekday',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_sale_hour, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(fields=['sale_hour'], name='sales_sale_sale_ho_4a8eaa_idx'),
+        ),
+    ]
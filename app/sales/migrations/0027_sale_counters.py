@@ -0,0 +1,52 @@
+# Generated by Django 5.2.3 on 2026-10-19 07:53
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_sale_counters(apps, schema_editor):
+    Sale = apps.get_model('sales', 'Sale')
+    SaleItem = apps.get_model('sales', 'SaleItem')
+    ReturnItem = apps.get_model('sales', 'ReturnItem')
+
+    items = SaleItem.objects.filter(sale=OuterRef('pk')).order_by().values('sale')
+    returns = ReturnItem.objects.filter(sale_item__sale=OuterRef('pk')).order_by().values('sale_item__sale')
+
+    Sale.objects.update(
+        item_count=Coalesce(Subquery(items.annotate(total=Count('id')).values('total')), 0),
+        total_quantity=Coalesce(Subquery(items.annotate(total=Sum('quantity')).values('total')), 0),
+        returned_item_count=Coalesce(Subquery(returns.annotate(total=Count('id')).values('total')), 0),
+        returned_quantity=Coalesce(Subquery(returns.annotate(total=Sum('quantity')).values('total')), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0026_sale_hour'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sale',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='sale',
+            name='returned_item_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='sale',
+            name='returned_quantity',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='sale',
+            name='total_quantity',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_sale_counters, migrations.RunPython.noop),
+    ]
@@ -3,99 +3,234 @@ from django.db.models import Sum , Count
 from decimal import Decimal
 from django.utils import timezone
 from datetime import datetime, timedelta , date
+from app.money import Money, MoneyField
+from app.medicine.pricing import annotated_property
 
 class Sale(models.Model):
     # Existing fields remain the same
     id = models.AutoField(primary_key=True)
-    sale_date = models.DateTimeField(auto_now_add=True)
-    subtotal = models.DecimalField(max_digits=10, decimal_places=2)
-    discount_amount = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))
-    price_deducted = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))
-    final_amount = models.DecimalField(max_digits=10, decimal_places=2)
+    sale_date = models.DateTimeField(default=timezone.now, editable=False)
+    subtotal = MoneyField()
+    discount_amount = MoneyField(default=0)
+    price_deducted = MoneyField(default=0)
+    final_amount = MoneyField()
     discount_applied_on_return = models.BooleanField(default=False)
-    extra = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))
+    extra = MoneyField(default=0)
 
     # New cached fields for performance
-    _net_amount = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))
-    _total_profit = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))
-    _returned_amount = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))
+    _net_amount = MoneyField(default=0)
+    _total_profit = MoneyField(default=0)
+    _returned_amount = MoneyField(default=0)
+
+    # Line counters, kept by checkout and returns
+    item_count = models.PositiveIntegerField(default=0, editable=False)
+    total_quantity = models.PositiveIntegerField(default=0, editable=False)
+    returned_item_count = models.PositiveIntegerField(default=0, editable=False)
+    returned_quantity = models.PositiveIntegerField(default=0, editable=False)
+
+    # Local hour (0-23) and weekday (0 = Monday) of sale_date, for shift filters
+    sale_hour = models.PositiveSmallIntegerField(default=0, editable=False)
+    sale_weekday = models.PositiveSmallIntegerField(default=0, editable=False)
+
+    # Shift -> (first hour, end hour); night wraps past midnight
+    SHIFT_HOURS = {
+        'morning': (6, 12),
+        'afternoon': (12, 17),
+        'evening': (17, 22),
+        'night': (22, 6),
+    }
     
     class Meta:
         ordering = ['-sale_date']
         indexes = [
             models.Index(fields=['-sale_date']),
+            models.Index(fields=['sale_hour']),
         ]
 
     def save(self, *args, **kwargs):
         # Original final amount calculation remains unchanged
         if not self.final_amount:
             self.final_amount = (
-                Decimal(str(self.subtotal)) -
-                Decimal(str(self.discount_amount)) -
-                Decimal(str(self.price_deducted)) +
-                Decimal(str(self.extra))
+                self.subtotal -
+                self.discount_amount -
+                self.price_deducted +
+                self.extra
             )
 
-        super().save(*args, **kwargs)  # First save to get PK
+        local_date = timezone.localtime(self.sale_date)
+        self.sale_hour = local_date.hour
+        self.sale_weekday = local_date.weekday()
 
-        # Calculate returned amount
+        # A new sale has no returns yet, so its cached fields follow from
+        # the totals and the lines given to insert_with_items(), and it is
+        # inserted in one write. Later changes go through recompute().
+        if self._state.adding:
+            self._returned_amount = Money.ZERO
+            self._net_amount = self.calculate_net_amount(has_returns=False)
+            self._total_profit = self.calculate_total_profit(getattr(self, '_new_items', []))
+
+        super().save(*args, **kwargs)
+
+    def insert_with_items(self, items):
+        """
+        Insert this new sale and its unsaved SaleItems: the counters and
+        cached amounts are computed from the items beforehand, so the sale
+        is written by its INSERT alone, then the items by one bulk INSERT.
+        """
+        for item in items:
+            item.returned_quantity = 0
+        self.item_count = len(items)
+        self.total_quantity = sum(item.quantity for item in items)
+        self._new_items = items
+        self.save()
+        del self._new_items
+        return SaleItem.objects.bulk_create(items)
+
+    def recompute(self):
+        """Recalculate the cached amounts from items and returns and save them in one UPDATE"""
+        items = list(self.items.with_returns())
         self._returned_amount = self.calculate_returned_amount()
-        
-        # Check if ANY items were returned
-        has_returns = any(item.returned_quantity > 0 for item in self.items.all())
-        
-        # DEFAULT CASE: No returns - normal calculation
-        if not has_returns:
-            self._net_amount = max(self.final_amount - self._returned_amount, Decimal('0.00'))
-        # RETURN CASE: Add back ALL discounts
-        else:
-            self._net_amount = max(
-                self.final_amount - self._returned_amount + 
-                self.discount_amount + self.price_deducted,
-                Decimal('0.00')
+        self._net_amount = self.calculate_net_amount(
+            has_returns=any(item.returned_quantity > 0 for item in items)
+        )
+        self._total_profit = self.calculate_total_profit(items)
+        super().save(update_fields=['_returned_amount', '_net_amount', '_total_profit'])
+
+    @classmethod
+    def void(cls, pks):
+        """
+        Delete the given sales, putting their unreturned units back in stock
+        and taking them out of the daily facts and totals, in one
+        transaction and a constant number of queries however many sales
+        and lines there are. Returns the number of sales deleted.
+        """
+        from django.db import transaction
+        from app.medicine.models import StockMovement
+
+        with transaction.atomic():
+            sales = {sale.pk: sale for sale in cls.objects.select_for_update().filter(pk__in=pks)}
+            if not sales:
+                return 0
+            items = list(SaleItem.objects.filter(sale__in=list(sales)).with_returns())
+            return_items = list(
+                ReturnItem.objects.filter(sale_item__sale__in=list(sales)).select_related('sale_item')
             )
 
-        self._total_profit = self.calculate_total_profit()
-        super().save(update_fields=['_returned_amount', '_net_amount', '_total_profit'])
+            # Restock only non-returned quantities, one UPDATE for all medicines
+            StockMovement.apply([
+                StockMovement(
+                    medicine_id=item.medicine_id,
+                    kind=StockMovement.SALE_DELETION,
+                    quantity=item.quantity - item.returned_quantity,
+                    reference=f"Sale #{item.sale_id}",
+                )
+                for item in items if item.medicine_id and item.quantity > item.returned_quantity
+            ])
+
+            # Facts and totals are kept per local day, so batch by day
+            by_day = {}
+            for sale in sales.values():
+                day = by_day.setdefault(timezone.localdate(sale.sale_date), {'sale_date': sale.sale_date, 'facts': [], 'values': {}})
+                for name, value in DailySalesTotal.sale_values(sale).items():
+                    day['values'][name] = day['values'].get(name, 0) + value
+            for item in items:
+                by_day[timezone.localdate(sales[item.sale_id].sale_date)]['facts'].append(
+                    (item.medicine_id, DailySalesFact.sale_deltas(item))
+                )
+            for return_item in return_items:
+                sale_item = return_item.sale_item
+                by_day[timezone.localdate(sales[sale_item.sale_id].sale_date)]['facts'].append(
+                    (sale_item.medicine_id,
+                     DailySalesFact.return_deltas(sale_item, return_item.quantity, return_item.returned_price))
+                )
+            for day in by_day.values():
+                DailySalesFact.record_lines(day['sale_date'], day['facts'], sign=-1)
+                DailySalesTotal.record(day['sale_date'], before=day['values'])
+
+            # The item/return post_delete handlers skip sales deleted here
+            cls.objects.filter(pk__in=list(sales)).delete()
+        return len(sales)
+
+    @classmethod
+    def shift_q(cls, shift):
+        """Q() selecting sales made during a shift, on the indexed sale_hour"""
+        first, end = cls.SHIFT_HOURS[shift]
+        if first < end:
+            return models.Q(sale_hour__gte=first, sale_hour__lt=end)
+        return models.Q(sale_hour__gte=first) | models.Q(sale_hour__lt=end)
+
+    @classmethod
+    def hour_weekday_heatmap(cls, queryset=None):
+        """
+        7 x 24 grid (Monday first) of sale count and net amount per local
+        weekday and hour, from one grouped query.
+        """
+        queryset = cls.objects.all() if queryset is None else queryset
+        grid = [
+            [{'sales_count': 0, 'net': Money.ZERO} for hour in range(24)]
+            for weekday in range(7)
+        ]
+        rows = (
+            queryset
+            .values('sale_weekday', 'sale_hour')
+            .annotate(sales_count=Count('id'), net=Sum('_net_amount'))
+            .order_by()
+        )
+        for row in rows:
+            grid[row['sale_weekday']][row['sale_hour']] = {
+                'sales_count': row['sales_count'],
+                'net': row['net'] or Money.ZERO,
+            }
+        return grid
     
     @property
     def total_discount(self):
         """Returns the sum of discount_amount and price_deducted"""
-        return (Decimal(str(self.discount_amount)) + 
-                Decimal(str(self.price_deducted))).quantize(Decimal('0.00'))
+        return self.discount_amount + self.price_deducted
     
     @property
     def is_fully_returned(self):
         """Check if the sale has been fully returned"""
-        return Decimal(str(self.final_amount)) <= Decimal(str(self.returned_amount))
+        return self.final_amount <= self.returned_amount
 
     def calculate_returned_amount(self):
         """Calculate returned amount efficiently"""
         if hasattr(self, '_prefetched_return_items'):
             # Use prefetched data if available
-            return sum(
-                Decimal(str(item.returned_price))
+            return sum((
+                item.returned_price
                 for return_entry in getattr(self, '_prefetched_returns', [])
                 for item in getattr(return_entry, '_prefetched_items', [])
-            )
+            ), Money.ZERO)
         else:
             # Fall back to database query
             return self.returns.aggregate(
                 total=Sum('items__returned_price')
-            )['total'] or Decimal('0.00')
+            )['total'] or Money.ZERO
 
-    def calculate_total_profit(self):
+    def calculate_net_amount(self, has_returns=None):
+        """Final amount less returns; ALL discounts are added back if any item returned"""
+        if has_returns is None:
+            has_returns = self.items.filter(return_items__isnull=False).exists()
+
+        # DEFAULT CASE: No returns - normal calculation
+        if not has_returns:
+            return max(self.final_amount - self._returned_amount, Money.ZERO)
+        # RETURN CASE: Add back ALL discounts
+        return max(self.final_amount - self._returned_amount + self.total_discount, Money.ZERO)
+
+    def calculate_total_profit(self, items=None):
         """Profit calculation where ALL discounts are added back if any item returned"""
-        if hasattr(self, '_prefetched_items'):
-            items = self._prefetched_items
-        else:
-            items = self.items.all()
+        if items is None:
+            items = getattr(self, '_prefetched_items', None)
+        if items is None:
+            items = self.items.with_returns()
 
         # Check if ANY items were returned
         has_returns = any(item.returned_quantity > 0 for item in items)
 
         # Calculate base profit
-        total_profit = Decimal('0.00')
+        total_profit = Money.ZERO
         for item in items:
             unit_profit = item.selling_price_per_unit - item.purchase_price_per_unit
             net_quantity = item.quantity - item.returned_quantity
@@ -112,7 +247,7 @@ class Sale(models.Model):
         else:
             pass  # Don't subtract any sale-level discounts
 
-        return max(total_profit, Decimal('0.00'))
+        return max(total_profit, Money.ZERO)
 
     @property
     def net_amount(self):
@@ -182,23 +317,31 @@ class Sale(models.Model):
         
         return {
             'total_sales': agg_data['total_sales'] or 0,
-            'gross_sales': agg_data['gross_sales'] or Decimal('0.00'),
-            'total_net': agg_data['total_net'] or Decimal('0.00'),
-            'total_profit': agg_data['total_profit'] or Decimal('0.00'),
-            'total_returned': agg_data['total_returned'] or Decimal('0.00'),
+            'gross_sales': agg_data['gross_sales'] or Money.ZERO,
+            'total_net': agg_data['total_net'] or Money.ZERO,
+            'total_profit': agg_data['total_profit'] or Money.ZERO,
+            'total_returned': agg_data['total_returned'] or Money.ZERO,
         }
     
     @classmethod
     def total_store_sales_amount(cls):
         return cls.objects.aggregate(
             total=Sum('_net_amount')
-        )['total'] or Decimal('0.00')
+        )['total'] or Money.ZERO
 
     @classmethod
     def total_store_profit(cls):
         return cls.objects.aggregate(
             total=Sum('_total_profit')
-        )['total'] or Decimal('0.00')
+        )['total'] or Money.ZERO
+
+class SaleItemQuerySet(models.QuerySet):
+    def with_returns(self):
+        """Annotate returned_quantity from one grouped join instead of an aggregate per item"""
+        from django.db.models.functions import Coalesce
+
+        return self.annotate(returned_quantity=Coalesce(Sum('return_items__quantity'), 0))
+
 
 class SaleItem(models.Model):
     sale = models.ForeignKey(Sale, related_name='items', on_delete=models.CASCADE)
@@ -206,62 +349,67 @@ class SaleItem(models.Model):
     quantity = models.PositiveIntegerField()
 
     # Price and cost at time of sale
-    selling_price_per_unit = models.DecimalField(max_digits=10, decimal_places=2)
-    purchase_price_per_unit = models.DecimalField(max_digits=10, decimal_places=2)
-    discount_per_unit = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))
-    total_price = models.DecimalField(max_digits=10, decimal_places=2)
+    selling_price_per_unit = MoneyField()
+    purchase_price_per_unit = MoneyField()
+    discount_per_unit = MoneyField(default=0)
+    total_price = MoneyField()
+
+    objects = SaleItemQuerySet.as_manager()
 
     def save(self, *args, **kwargs):
         if self.medicine and not self.purchase_price_per_unit:
             self.purchase_price_per_unit = self.medicine.purchase_per_unit_price
         if not self.selling_price_per_unit:
             self.selling_price_per_unit = (
-                Decimal(str(self.total_price)) / Decimal(str(self.quantity))
-                if self.quantity else Decimal('0.00')
-            ).quantize(Decimal('0.01'))
+                self.total_price / self.quantity
+                if self.quantity else Money.ZERO
+            )
         super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.medicine.name if self.medicine else 'Deleted Medicine'} x{self.quantity}"
 
-    @property
+    @annotated_property
     def returned_quantity(self):
         """Total quantity returned for this item"""
-        result = self.return_items.aggregate(total=Sum('quantity'))['total'] or 0
-        return Decimal(str(result))
+        prefetched = getattr(self, '_prefetched_objects_cache', {}).get('return_items')
+        if prefetched is not None:
+            return sum(return_item.quantity for return_item in prefetched)
+        return self.return_items.aggregate(total=Sum('quantity'))['total'] or 0
 
     @property
     def is_fully_returned(self):
         """Check if this item has been fully returned"""
-        return self.returned_quantity >= Decimal(str(self.quantity))
+        return self.returned_quantity >= self.quantity
 
     @property
     def net_quantity(self):
         """Remaining quantity after returns"""
-        return Decimal(str(self.quantity)) - Decimal(str(self.returned_quantity))
+        return self.quantity - self.returned_quantity
 
     @property
     def unit_price(self):
         """Price per unit (after discount)"""
         if self.quantity > 0:
-            return (Decimal(str(self.total_price)) / Decimal(str(self.quantity))).quantize(Decimal('0.01'))
-        return Decimal('0.00')
+            return self.total_price / self.quantity
+        return Money.ZERO
 
     @property
     def net_price(self):
         """Total price after returns"""
-        return (Decimal(str(self.unit_price)) * Decimal(str(self.net_quantity))).quantize(Decimal('0.01'))
+        return self.unit_price * self.net_quantity
 
     @property
     def returned_price(self):
         """Total amount returned for this item"""
-        return (Decimal(str(self.unit_price)) * Decimal(str(self.returned_quantity))).quantize(Decimal('0.01'))
+        return self.unit_price * self.returned_quantity
 
 
 class Return(models.Model):
     sale = models.ForeignKey(Sale, on_delete=models.CASCADE, related_name='returns')
     returned_at = models.DateTimeField(auto_now_add=True)
-    refund_amount = models.DecimalField(max_digits=10, decimal_places=0, default=0)
+    # Refunds are settled in whole rupees
+    refund_amount = MoneyField(default=0)
     reason = models.TextField(blank=True, null=True)
 
     @property
@@ -285,9 +433,10 @@ class Return(models.Model):
         # Calculate refund amount as sum of all return items
         if not self.refund_amount and self.pk:
             self.refund_amount = sum(
-                Decimal(str(item.returned_price))
-                for item in self.items.all()
+                (item.returned_price for item in self.items.all()),
+                Money.ZERO
             )
+        self.refund_amount = self.refund_amount.round_to_rupee()
         super().save(*args, **kwargs)
 
 
@@ -295,11 +444,333 @@ class ReturnItem(models.Model):
     return_entry = models.ForeignKey(Return, on_delete=models.CASCADE, related_name='items')
     sale_item = models.ForeignKey(SaleItem, on_delete=models.CASCADE, related_name='return_items')
     quantity = models.PositiveIntegerField()
-    returned_price = models.DecimalField(max_digits=10, decimal_places=0)
+    # Settled in whole rupees, like Return.refund_amount
+    returned_price = MoneyField()
     restocked = models.BooleanField(default=False)
 
     def save(self, *args, **kwargs):
         # Calculate returned price based on unit price (after discounts)
         if not self.returned_price:
-            self.returned_price = Decimal(str(self.sale_item.unit_price)) * Decimal(str(self.quantity))
-        super().save(*args, **kwargs)
\ No newline at end of file
+            self.returned_price = self.sale_item.unit_price * self.quantity
+        self.returned_price = self.returned_price.round_to_rupee()
+        super().save(*args, **kwargs)
+
+def _raw(value):
+    """Integer column value for F() arithmetic; Money is stored in paisa"""
+    return value.paisa if isinstance(value, Money) else value
+
+
+class DailySalesFact(models.Model):
+    """
+    Per local day, per medicine roll-up of sale lines for analytics.
+
+    Returns are booked on the day of the sale they reverse, so a day's
+    revenue and profit are net of everything later returned from it.
+    Kept current by record_lines() on checkout/return/deletion and
+    rebuildable from SaleItem/ReturnItem with rebuild().
+    """
+    day = models.DateField()
+    medicine = models.ForeignKey('medicine.Medicine', on_delete=models.CASCADE, related_name='daily_sales')
+    quantity_sold = models.IntegerField(default=0)
+    quantity_returned = models.IntegerField(default=0)
+    revenue = MoneyField(default=0)
+    cost = MoneyField(default=0)
+    discount = MoneyField(default=0)
+    profit = MoneyField(default=0)
+
+    class Meta:
+        ordering = ['-day']
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'medicine'], name='unique_daily_sales_fact'),
+        ]
+        indexes = [
+            models.Index(fields=['day']),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.medicine_id}: {self.quantity_sold - self.quantity_returned}"
+
+    METRIC_FIELDS = ['quantity_sold', 'quantity_returned', 'revenue', 'cost', 'discount', 'profit']
+
+    @staticmethod
+    def sale_deltas(item):
+        """Fact deltas for a SaleItem"""
+        cost = item.purchase_price_per_unit * item.quantity
+        return {
+            'quantity_sold': item.quantity,
+            'revenue': item.total_price,
+            'cost': cost,
+            'discount': item.discount_per_unit * item.quantity,
+            'profit': item.total_price - cost,
+        }
+
+    @staticmethod
+    def return_deltas(item, quantity, returned_price):
+        """Fact deltas for returning `quantity` units of a SaleItem"""
+        cost = item.purchase_price_per_unit * quantity
+        return {
+            'quantity_returned': quantity,
+            'revenue': -returned_price,
+            'cost': -cost,
+            'profit': cost - returned_price,
+        }
+
+    @classmethod
+    def record_lines(cls, sale_date, lines, sign=1):
+        """
+        Add (medicine_id, deltas) lines to the facts of the sale's local day.
+        sign=-1 takes them back out, e.g. when a sale is deleted.
+        """
+        day = timezone.localdate(sale_date)
+        merged = {}
+        for medicine_id, deltas in lines:
+            if not medicine_id:
+                continue
+            totals = merged.setdefault(medicine_id, {})
+            for name, value in deltas.items():
+                totals[name] = totals.get(name, 0) + value * sign
+
+        existing = set(
+            cls.objects.filter(day=day, medicine_id__in=merged).values_list('medicine_id', flat=True)
+        )
+        if existing:
+            # One UPDATE adding each medicine's own deltas
+            names = {name for medicine_id in existing for name in merged[medicine_id]}
+            cls.objects.filter(day=day, medicine_id__in=existing).update(**{
+                name: models.F(name) + models.Case(
+                    *[
+                        models.When(medicine_id=medicine_id, then=models.Value(_raw(merged[medicine_id][name])))
+                        for medicine_id in existing if name in merged[medicine_id]
+                    ],
+                    default=models.Value(0),
+                )
+                for name in names
+            })
+        cls.objects.bulk_create([
+            cls(day=day, medicine_id=medicine_id, **totals)
+            for medicine_id, totals in merged.items() if medicine_id not in existing
+        ])
+
+    @classmethod
+    def rebuild(cls, start=None, end=None, batch_days=31):
+        """
+        Recompute facts for local days start..end (default: all history) from
+        sale and return lines, one batch of days at a time.
+        """
+        from django.db import transaction
+
+        first_sale = Sale.objects.order_by('sale_date').values_list('sale_date', flat=True).first()
+        if first_sale is None:
+            cls.objects.filter(**({'day__gte': start} if start else {})).delete()
+            return 0
+        start = start or timezone.localdate(first_sale)
+        end = end or timezone.localdate()
+
+        written = 0
+        batch_start = start
+        while batch_start <= end:
+            batch_end = min(batch_start + timedelta(days=batch_days - 1), end)
+            with transaction.atomic():
+                cls.objects.filter(day__gte=batch_start, day__lte=batch_end).delete()
+                facts = cls._aggregate(batch_start, batch_end)
+                cls.objects.bulk_create(facts, batch_size=500)
+            written += len(facts)
+            batch_start = batch_end + timedelta(days=1)
+        return written
+
+    @classmethod
+    def _aggregate(cls, start, end):
+        """Facts for local days start..end from two grouped queries"""
+        from django.db.models import ExpressionWrapper, F
+        from django.db.models.functions import TruncDate
+
+        def money_sum(expression):
+            return Sum(ExpressionWrapper(expression, output_field=MoneyField()))
+
+        tz = timezone.get_current_timezone()
+        facts = {}
+
+        sold = (
+            SaleItem.objects
+            .filter(medicine__isnull=False)
+            .annotate(day=TruncDate('sale__sale_date', tzinfo=tz))
+            .filter(day__gte=start, day__lte=end)
+            .values('day', 'medicine')
+            .annotate(
+                units=Sum('quantity'),
+                revenue=Sum('total_price'),
+                cost=money_sum(F('purchase_price_per_unit') * F('quantity')),
+                discount=money_sum(F('discount_per_unit') * F('quantity')),
+            )
+            .order_by()
+        )
+        for row in sold:
+            facts[row['day'], row['medicine']] = cls(
+                day=row['day'],
+                medicine_id=row['medicine'],
+                quantity_sold=row['units'],
+                revenue=row['revenue'],
+                cost=row['cost'],
+                discount=row['discount'],
+                profit=row['revenue'] - row['cost'],
+            )
+
+        returned = (
+            ReturnItem.objects
+            .filter(sale_item__medicine__isnull=False)
+            .annotate(day=TruncDate('sale_item__sale__sale_date', tzinfo=tz))
+            .filter(day__gte=start, day__lte=end)
+            .values('day', 'sale_item__medicine')
+            .annotate(
+                units=Sum('quantity'),
+                returned=Sum('returned_price'),
+                cost=money_sum(F('sale_item__purchase_price_per_unit') * F('quantity')),
+            )
+            .order_by()
+        )
+        for row in returned:
+            key = (row['day'], row['sale_item__medicine'])
+            if key not in facts:
+                facts[key] = cls(day=key[0], medicine_id=key[1])
+            fact = facts[key]
+            fact.quantity_returned = row['units']
+            fact.revenue -= row['returned']
+            fact.cost -= row['cost']
+            fact.profit = fact.revenue - fact.cost
+
+        return list(facts.values())
+
+
+class DailySalesTotal(models.Model):
+    """
+    Sales totals per local day plus running sums through that day.
+
+    The totals for any range of days are the running sums at the end of
+    the range minus those just before it (see range_totals()), two indexed
+    lookups however long the range. record() keeps both current when a
+    sale is created, returned against or deleted; a change to an earlier
+    day shifts the running sums of that day and every later one.
+    """
+    day = models.DateField(unique=True)
+    sales_count = models.IntegerField(default=0)
+    gross = MoneyField(default=0)
+    net = MoneyField(default=0)
+    profit = MoneyField(default=0)
+    returned = MoneyField(default=0)
+
+    cum_sales_count = models.BigIntegerField(default=0)
+    cum_gross = MoneyField(default=0)
+    cum_net = MoneyField(default=0)
+    cum_profit = MoneyField(default=0)
+    cum_returned = MoneyField(default=0)
+
+    METRICS = ['sales_count', 'gross', 'net', 'profit', 'returned']
+
+    class Meta:
+        ordering = ['-day']
+
+    def __str__(self):
+        return f"{self.day}: {self.sales_count} sale(s), {self.net}"
+
+    @staticmethod
+    def sale_values(sale):
+        """A sale's contribution to its day, from its cached amounts"""
+        return {
+            'sales_count': 1,
+            'gross': sale.final_amount,
+            'net': sale._net_amount,
+            'profit': sale._total_profit,
+            'returned': sale._returned_amount,
+        }
+
+    @classmethod
+    def record(cls, sale_date, before=None, after=None):
+        """
+        Move the sale's day from `before` to `after` sale_values() (None for
+        a sale that did not exist before / no longer exists after).
+        """
+        from django.db import transaction
+        from . import timeseries
+
+        before = before or {}
+        after = after or {}
+        deltas = {}
+        for name in cls.METRICS:
+            delta = after.get(name, 0) - before.get(name, 0)
+            if delta:
+                deltas[name] = delta.paisa if isinstance(delta, Money) else delta
+        if not deltas:
+            return
+
+        day = timezone.localdate(sale_date)
+        with transaction.atomic():
+            if not cls.objects.filter(day=day).exists():
+                previous = cls.objects.filter(day__lt=day).order_by('-day').first()
+                cls.objects.create(day=day, **{
+                    f'cum_{name}': getattr(previous, f'cum_{name}') if previous else 0
+                    for name in cls.METRICS
+                })
+            cls.objects.filter(day=day).update(**{
+                name: models.F(name) + delta for name, delta in deltas.items()
+            })
+            cls.objects.filter(day__gte=day).update(**{
+                f'cum_{name}': models.F(f'cum_{name}') + delta for name, delta in deltas.items()
+            })
+        transaction.on_commit(lambda: timeseries.invalidate_day(day))
+
+    @classmethod
+    def _running_through(cls, day=None):
+        """Running sums at the end of `day` (default: the latest day)"""
+        rows = cls.objects.order_by('-day')
+        if day is not None:
+            rows = rows.filter(day__lte=day)
+        row = rows.values(*[f'cum_{name}' for name in cls.METRICS]).first() or {}
+        return {
+            name: row.get(f'cum_{name}', 0 if name == 'sales_count' else Money.ZERO)
+            for name in cls.METRICS
+        }
+
+    @classmethod
+    def range_totals(cls, start=None, end=None):
+        """Totals for local days start..end inclusive; open ends are unbounded"""
+        through_end = cls._running_through(end)
+        if start is None:
+            return through_end
+        before_start = cls._running_through(start - timedelta(days=1))
+        return {name: through_end[name] - before_start[name] for name in cls.METRICS}
+
+    @classmethod
+    def rebuild(cls):
+        """Recompute every day and running sum from the sales table"""
+        from django.db import transaction
+        from . import timeseries
+        from django.db.models.functions import TruncDate
+
+        rows = (
+            Sale.objects
+            .annotate(day=TruncDate('sale_date', tzinfo=timezone.get_current_timezone()))
+            .values('day')
+            .annotate(
+                sales_count=Count('id'),
+                gross=Sum('final_amount'),
+                net=Sum('_net_amount'),
+                profit=Sum('_total_profit'),
+                returned=Sum('_returned_amount'),
+            )
+            .order_by('day')
+        )
+        totals = []
+        running = {name: 0 for name in cls.METRICS}
+        for row in rows:
+            values = {name: row[name] or 0 for name in cls.METRICS}
+            for name in cls.METRICS:
+                running[name] = running[name] + values[name]
+            totals.append(cls(day=row['day'], **values, **{
+                f'cum_{name}': running[name] for name in cls.METRICS
+            }))
+
+        with transaction.atomic():
+            cls.objects.all().delete()
+            cls.objects.bulk_create(totals, batch_size=500)
+        timeseries.invalidate()
+        return len(totals)
@@ -0,0 +1,157 @@
+"""
+Reorder suggestions from sales velocity.
+
+Net units sold per medicine over rolling 7/30/90 day windows come from two
+grouped queries (sale lines and returns) and are cached until local
+midnight. Checkouts, returns and deletions invalidate() the cache once
+they commit, so the next report recomputes it; patching the cached totals
+in place would lose updates from concurrent checkouts. invalidate() also
+bumps a version counter, so totals computed before a commit but cached
+after it are not served.
+"""
+import math
+from datetime import datetime, time, timedelta
+
+from django.core.cache import cache
+from django.db.models import Q, Sum
+from django.utils import timezone
+
+WINDOWS = (7, 30, 90)
+# Window used for days of cover and suggested quantities
+VELOCITY_WINDOW = 30
+# Suggest a reorder when stock covers fewer days than this...
+REORDER_BELOW_DAYS = 14
+# ...and suggest enough to cover this many days of sales
+TARGET_COVER_DAYS = 30
+
+CACHE_KEY = 'sales:reorder:velocity'
+VERSION_KEY = 'sales:reorder:velocity:version'
+
+
+def _window_starts(today):
+    """Aware datetime at which each window begins (whole local days)"""
+    return {
+        days: timezone.make_aware(datetime.combine(today - timedelta(days=days - 1), time.min))
+        for days in WINDOWS
+    }
+
+
+def _seconds_until_midnight():
+    now = timezone.localtime()
+    midnight = timezone.make_aware(datetime.combine(now.date() + timedelta(days=1), time.min))
+    return max(int((midnight - now).total_seconds()), 1)
+
+
+def compute_sold(today=None):
+    """{medicine_id: [net units sold in each window]} from two grouped queries"""
+    from .models import SaleItem, ReturnItem
+
+    today = today or timezone.localdate()
+    starts = _window_starts(today)
+    oldest = starts[max(WINDOWS)]
+
+    sold = {}
+    sales = (
+        SaleItem.objects
+        .filter(sale__sale_date__gte=oldest, medicine__isnull=False)
+        .values('medicine')
+        .annotate(**{
+            f'w{days}': Sum('quantity', filter=Q(sale__sale_date__gte=starts[days]))
+            for days in WINDOWS
+        })
+        .order_by()
+    )
+    for row in sales:
+        sold[row['medicine']] = [row[f'w{days}'] or 0 for days in WINDOWS]
+
+    # Returns count against the window of the sale they reverse
+    returns = (
+        ReturnItem.objects
+        .filter(sale_item__sale__sale_date__gte=oldest, sale_item__medicine__isnull=False)
+        .values('sale_item__medicine')
+        .annotate(**{
+            f'w{days}': Sum('quantity', filter=Q(sale_item__sale__sale_date__gte=starts[days]))
+            for days in WINDOWS
+        })
+        .order_by()
+    )
+    for row in returns:
+        totals = sold.setdefault(row['sale_item__medicine'], [0] * len(WINDOWS))
+        for index, days in enumerate(WINDOWS):
+            totals[index] -= row[f'w{days}'] or 0
+
+    return {'date': today, 'sold': sold}
+
+
+def _version():
+    cache.add(VERSION_KEY, 0, timeout=None)
+    return cache.get(VERSION_KEY, 0)
+
+
+def velocity_data():
+    today = timezone.localdate()
+    version = _version()
+    data = cache.get(CACHE_KEY)
+    if data is None or data['date'] != today or data['version'] != version:
+        data = {**compute_sold(today), 'version': version}
+        cache.set(CACHE_KEY, data, timeout=_seconds_until_midnight())
+    return data
+
+
+def invalidate():
+    cache.delete(CACHE_KEY)
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        # The counter was evicted; start it again
+        cache.add(VERSION_KEY, 0, timeout=None)
+
+
+def reorder_report(company=None):
+    """
+    Reorder candidates grouped by company, most urgent company first.
+
+    Each row carries net units sold per window, daily velocity, days of
+    cover at current stock and a suggested order in units and packets.
+    """
+    from app.medicine.models import Medicine
+
+    sold = velocity_data()['sold']
+    velocity_index = WINDOWS.index(VELOCITY_WINDOW)
+
+    medicines = Medicine.objects.filter(pk__in=list(sold))
+    if company:
+        medicines = medicines.filter(company__iexact=company)
+
+    groups = {}
+    for medicine_id, name, medicine_company, stock, units_per_box in medicines.values_list(
+        'id', 'name', 'company', 'stock', 'units_per_box'
+    ):
+        totals = sold[medicine_id]
+        velocity = max(totals[velocity_index], 0) / VELOCITY_WINDOW
+        if velocity <= 0:
+            continue
+        days_of_cover = stock / velocity
+        if days_of_cover >= REORDER_BELOW_DAYS:
+            continue
+
+        suggested_units = max(math.ceil(velocity * TARGET_COVER_DAYS - stock), 0)
+        groups.setdefault(medicine_company, []).append({
+            'id': medicine_id,
+            'name': name,
+            'company': medicine_company,
+            'stock': stock,
+            'sold': dict(zip(WINDOWS, totals)),
+            'velocity': round(velocity, 2),
+            'days_of_cover': round(days_of_cover, 1),
+            'suggested_units': suggested_units,
+            'suggested_packets': math.ceil(suggested_units / (units_per_box or 1)),
+        })
+
+    for rows in groups.values():
+        rows.sort(key=lambda row: row['days_of_cover'])
+
+    return [
+        {'company': name, 'items': rows}
+        for name, rows in sorted(groups.items(), key=lambda item: item[1][0]['days_of_cover'])
+    ]
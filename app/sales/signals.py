@@ -1,16 +1,26 @@
 # sales/signals.py
+from django.db.models import QuerySet
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from .models import SaleItem, ReturnItem
+from .models import Sale, SaleItem, ReturnItem
+
+
+def _deleting_sale(origin):
+    """True when the delete cascades from a Sale, which needs no recompute"""
+    if isinstance(origin, QuerySet):
+        return origin.model is Sale
+    return isinstance(origin, Sale)
 
 @receiver([post_save, post_delete], sender=SaleItem)
-def update_sale_profit_on_item_change(sender, instance, **kwargs):
-    """Update sale profit whenever sale items change"""
-    instance.sale._total_profit = instance.sale.calculate_total_profit()
-    instance.sale.save(update_fields=['_total_profit'])
+def update_sale_profit_on_item_change(sender, instance, origin=None, **kwargs):
+    """Recompute the sale's cached amounts whenever sale items change"""
+    if _deleting_sale(origin):
+        return
+    instance.sale.recompute()
 
 @receiver([post_save, post_delete], sender=ReturnItem)
-def update_sale_profit_on_return_change(sender, instance, **kwargs):
-    """Update sale profit whenever return items change"""
-    instance.return_entry.sale._total_profit = instance.return_entry.sale.calculate_total_profit()
-    instance.return_entry.sale.save(update_fields=['_total_profit'])
\ No newline at end of file
+def update_sale_profit_on_return_change(sender, instance, origin=None, **kwargs):
+    """Recompute the sale's cached amounts whenever return items change"""
+    if _deleting_sale(origin):
+        return
+    instance.return_entry.sale.recompute()
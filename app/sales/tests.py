@@ -1,3 +1,889 @@
-from django.test import TestCase
+import json
+import tempfile
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from io import StringIO
+
+import numpy as np
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db.models import Sum
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
+
+from app.medicine.barcodes import barcode_index
+from app.medicine.models import Medicine, StockMovement
+from app.money import Money, MoneyField, MoneyJSONEncoder
+
+from . import classification, linestore, reorder, timeseries
+from .models import DailySalesFact, DailySalesTotal, Sale
+
+
+def make_medicine(name='Panadol', **fields):
+    values = {
+        'company': 'Acme', 'rack_number': 'A1', 'stock': 100, 'units_per_box': 10,
+        'packet_price': Money.coerce(100), 'retailers_price': Money.coerce(80),
+        'price': Money.coerce(10), 'expiry_date': '2030-01-01',
+    }
+    values.update(fields)
+    return Medicine.objects.create(name=name, **values)
+
+
+def as_money(value):
+    """Money from a JSON amount"""
+    return Money.coerce(str(value))
+
+
+def _at(day):
+    return timezone.make_aware(datetime.combine(day, time(12)))
+
+
+def _values(gross, profit=0, returned=0):
+    gross = Money.coerce(gross)
+    returned = Money.coerce(returned)
+    return {
+        'sales_count': 1,
+        'gross': gross,
+        'net': gross - returned,
+        'profit': Money.coerce(profit),
+        'returned': returned,
+    }
+
+
+class SalesFlowMixin:
+    """Checkouts and returns through the views, running their on_commit hooks"""
+
+    def checkout(self, lines, discount=0, price_deducted=0, extra=0):
+        """Sell {medicine: quantity}; returns the new Sale"""
+        session = self.client.session
+        session['cart'] = {str(medicine.pk): quantity for medicine, quantity in lines.items()}
+        session.save()
+        subtotal = sum((medicine.price * quantity for medicine, quantity in lines.items()), Money.ZERO)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('sales:checkout'), {
+                'subtotal': str(subtotal), 'discount': str(discount),
+                'price_deducted': str(price_deducted), 'extra': str(extra),
+            })
+        match = resolve(response.url)
+        self.assertEqual(match.url_name, 'receipt')
+        return Sale.objects.get(pk=match.kwargs['pk'])
+
+    def return_items(self, sale, lines, restock=True):
+        """Return {medicine: quantity} from a sale through the return form"""
+        data = {'reason': 'Returned'}
+        for item in sale.items.all():
+            if item.medicine in lines:
+                data[f'item_{item.pk}-quantity'] = lines[item.medicine]
+                if restock:
+                    data[f'item_{item.pk}-restock'] = 'on'
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('sales:create_return', args=[sale.pk]), data)
+        self.assertEqual(response.status_code, 302)
+        return sale.returns.latest('pk')
+
+
+class LineStoreMixin:
+    """Point SALES_STORE_DIR at an empty temporary directory"""
+
+    def setUp(self):
+        super().setUp()
+        store = tempfile.TemporaryDirectory()
+        self.addCleanup(store.cleanup)
+        self.store_dir = store.name
+        settings_override = override_settings(SALES_STORE_DIR=self.store_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        cache.clear()
+
+
+class CartBatchTests(TestCase):
+    def setUp(self):
+        self.panadol = make_medicine('Panadol')
+        self.brufen = make_medicine('Brufen', packet_price=Money.coerce(50), units_per_box=5)
+
+    def post(self, payload):
+        return self.client.post(reverse('sales:cart'), json.dumps(payload), content_type='application/json').json()
+
+    def test_batch_applies_operations_in_order(self):
+        data = self.post({'operations': [
+            {'action': 'add', 'medicine_id': self.panadol.pk, 'quantity': 2},
+            {'action': 'add', 'medicine_id': self.brufen.pk},
+            {'action': 'add', 'medicine_id': self.panadol.pk, 'quantity': 3},
+            {'action': 'update', 'medicine_id': self.brufen.pk, 'quantity': 4},
+        ]})
+        self.assertTrue(data['success'])
+        self.assertEqual(data['cart'], {str(self.panadol.pk): 5, str(self.brufen.pk): 4})
+        self.assertEqual(data['cart_count'], 2)
+        self.assertEqual(as_money(data['subtotal']), Money.coerce(90))
+        self.assertEqual(self.client.session['cart'], data['cart'])
+
+    def test_single_operation_is_a_batch_of_one(self):
+        data = self.post({'action': 'add', 'medicine_id': self.panadol.pk, 'quantity': 2})
+        self.assertEqual(data['cart'], {str(self.panadol.pk): 2})
+
+        data = self.post({'action': 'update', 'medicine_id': self.panadol.pk, 'quantity': 0})
+        self.assertEqual(data['cart'], {})
+
+    def test_failing_operation_leaves_the_cart_untouched(self):
+        self.post({'action': 'add', 'medicine_id': self.panadol.pk, 'quantity': 1})
+        data = self.post({'operations': [
+            {'action': 'add', 'medicine_id': self.brufen.pk, 'quantity': 2},
+            {'action': 'remove', 'medicine_id': self.panadol.pk},
+            {'action': 'explode', 'medicine_id': self.panadol.pk},
+        ]})
+        self.assertFalse(data['success'])
+        self.assertIn('explode', data['error'])
+        self.assertEqual(self.client.session['cart'], {str(self.panadol.pk): 1})
+
+    def test_operations_must_be_a_list(self):
+        data = self.post({'operations': {'action': 'add', 'medicine_id': self.panadol.pk}})
+        self.assertFalse(data['success'])
+        self.assertNotIn('cart', self.client.session)
+
+
+class CartScanTests(TestCase):
+    def setUp(self):
+        barcode_index.invalidate()
+        self.addCleanup(barcode_index.invalidate)
+        self.panadol = make_medicine('Panadol', barcode='8961100123', batch_no='PN-7')
+        self.calpol = make_medicine('Calpol', batch_no='SHARED')
+        self.brufen = make_medicine('Brufen', batch_no='SHARED')
+
+    def scan(self, code, quantity=1):
+        response = self.client.post(
+            reverse('sales:cart_scan'), json.dumps({'code': code, 'quantity': quantity}),
+            content_type='application/json',
+        )
+        return response.status_code, response.json()
+
+    def test_barcode_and_batch_number_add_to_cart(self):
+        status, data = self.scan(' 8961100123 ', quantity=2)
+        self.assertEqual(status, 200)
+        self.assertEqual((data['medicine_id'], data['quantity']), (self.panadol.pk, 2))
+
+        status, data = self.scan('pn-7')
+        self.assertEqual((data['medicine_id'], data['quantity']), (self.panadol.pk, 3))
+        self.assertEqual(self.client.session['cart'], {str(self.panadol.pk): 3})
+
+    def test_unknown_code(self):
+        status, data = self.scan('NOPE')
+        self.assertEqual(status, 404)
+        self.assertFalse(data['success'])
+
+    def test_ambiguous_batch_lists_candidates(self):
+        status, data = self.scan('shared')
+        self.assertEqual(status, 409)
+        self.assertEqual({candidate['id'] for candidate in data['candidates']}, {self.calpol.pk, self.brufen.pk})
+        self.assertNotIn('cart', self.client.session)
+
+    def test_barcode_wins_over_batch_number(self):
+        self.brufen.barcode = 'shared'
+        self.brufen.save()
+        status, data = self.scan('SHARED')
+        self.assertEqual((status, data['medicine_id']), (200, self.brufen.pk))
+
+    def test_index_follows_saves_and_deletes(self):
+        self.scan('PN-7')
+        self.panadol.batch_no = 'PN-8'
+        self.panadol.save()
+        self.assertEqual(self.scan('PN-7')[0], 404)
+        self.assertEqual(self.scan('PN-8')[1]['medicine_id'], self.panadol.pk)
+
+        self.calpol.delete()
+        status, data = self.scan('SHARED')
+        self.assertEqual((status, data['medicine_id']), (200, self.brufen.pk))
+
+
+class MoneyTests(TestCase):
+    def test_coerce_takes_rupees(self):
+        self.assertEqual(Money.coerce(12).paisa, 1200)
+        self.assertEqual(Money.coerce('12.34').paisa, 1234)
+        self.assertEqual(Money.coerce(Decimal('0.5')).paisa, 50)
+        self.assertEqual(Money.coerce(1.1).paisa, 110)
+        self.assertIs(Money.coerce(Money(5)).__class__, Money)
+        with self.assertRaises(TypeError):
+            Money.coerce([1])
+
+    def test_coerce_rounds_half_even(self):
+        self.assertEqual(Money.coerce(Decimal('1.005')), Money(100))
+        self.assertEqual(Money.coerce('1.015'), Money(102))
+
+    def test_arithmetic(self):
+        self.assertEqual(Money(150) + Money(50), Money(200))
+        self.assertEqual(Money(100) + 1, Money(200))
+        self.assertEqual(5 - Money(150), Money(350))
+        self.assertEqual(sum([Money(1), Money(2)]), Money(3))
+        self.assertEqual(Money(250) * 3, Money(750))
+        self.assertEqual(Money(101) * Decimal('0.5'), Money(50))
+        self.assertEqual(Money(300) / Money(200), Decimal('1.5'))
+        self.assertEqual(-Money(5), Money(-5))
+
+    def test_division_and_percent_round_half_even(self):
+        self.assertEqual(Money(100) / 3, Money(33))
+        self.assertEqual(Money(250) / 4, Money(62))
+        self.assertEqual(Money(350) / 4, Money(88))
+        self.assertEqual(Money(5).percent(10), Money(0))
+        self.assertEqual(Money(15).percent(10), Money(2))
+        self.assertEqual(Money(1000).percent(Decimal('2.5')), Money(25))
+
+    def test_rounding_to_rupees(self):
+        self.assertEqual(Money(150).round_to_rupee(), Money(200))
+        self.assertEqual(Money(250).round_to_rupee(), Money(200))
+        self.assertEqual(round(Money(150)), 2)
+        self.assertEqual(round(Money(155), 1), Money(160))
+        self.assertEqual(round(Money(155), 2), Money(155))
+
+    def test_comparison_and_hash_match_decimal(self):
+        self.assertEqual(Money(150), Decimal('1.5'))
+        self.assertEqual(hash(Money(150)), hash(Decimal('1.50')))
+        self.assertEqual(hash(Money(200)), hash(2))
+        self.assertLess(Money(10), 1)
+        self.assertFalse(Money.ZERO)
+
+    def test_str(self):
+        self.assertEqual(str(Money(1234)), '12.34')
+        self.assertEqual(str(Money(-5)), '-0.05')
+        self.assertEqual(f'{Money(1234):.1f}', '12.3')
+
+    def test_json_encoder_writes_decimal_strings(self):
+        self.assertEqual(
+            json.dumps({'total': Money(1250), 'rate': Decimal('2.5')}, cls=MoneyJSONEncoder),
+            '{"total": "12.50", "rate": "2.5"}',
+        )
+
+
+class MoneyFieldTests(TestCase):
+    def test_round_trip(self):
+        total = DailySalesTotal.objects.create(day=date(2026, 1, 1), gross=Decimal('12.34'), net='5.5')
+        self.assertEqual(total.gross, Money(1234))
+        self.assertEqual(total.net, Money(550))
+
+        total = DailySalesTotal.objects.get(pk=total.pk)
+        self.assertIs(type(total.gross), Money)
+        self.assertEqual(total.gross, Money(1234))
+        self.assertEqual(total.net, Money(550))
+        self.assertEqual(DailySalesTotal.objects.values_list('profit', flat=True).get(), Money.ZERO)
+
+    def test_lookups_and_aggregates(self):
+        DailySalesTotal.objects.create(day=date(2026, 1, 1), gross=Money(1001))
+        DailySalesTotal.objects.create(day=date(2026, 1, 2), gross=Money(999))
+        self.assertTrue(DailySalesTotal.objects.filter(gross=Decimal('10.01')).exists())
+        self.assertEqual(DailySalesTotal.objects.filter(gross__gt=Money(1000)).count(), 1)
+        self.assertEqual(DailySalesTotal.objects.aggregate(total=Sum('gross'))['total'], Money(2000))
+
+    def test_to_python_rejects_non_amounts(self):
+        field = MoneyField()
+        self.assertEqual(field.to_python('3.25'), Money(325))
+        with self.assertRaises(ValidationError):
+            field.to_python('three')
+
+
+class ReorderTests(SalesFlowMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.panadol = make_medicine('Panadol', stock=40)
+
+    def report(self, **params):
+        return self.client.get(reverse('sales:reorder_data'), params).json()['groups']
+
+    def row(self, medicine):
+        for group in self.report():
+            for row in group['items']:
+                if row['id'] == medicine.pk:
+                    return row
+        return None
+
+    def test_suggestion_from_thirty_day_velocity(self):
+        self.checkout({self.panadol: 30})
+        row = self.row(self.panadol)
+        self.assertEqual(row['stock'], 10)
+        self.assertEqual(row['sold'], {'7': 30, '30': 30, '90': 30})
+        self.assertEqual((row['velocity'], row['days_of_cover']), (1.0, 10.0))
+        self.assertEqual((row['suggested_units'], row['suggested_packets']), (20, 2))
+
+    def test_well_stocked_medicines_are_left_out(self):
+        self.checkout({self.panadol: 5})
+        self.assertIsNone(self.row(self.panadol))
+
+    def test_windows_count_whole_local_days(self):
+        for days_ago, quantity in ((0, 3), (20, 5), (60, 7)):
+            sale = self.checkout({self.panadol: quantity})
+            Sale.objects.filter(pk=sale.pk).update(sale_date=timezone.now() - timedelta(days=days_ago))
+        reorder.invalidate()
+        self.assertEqual(reorder.velocity_data()['sold'][self.panadol.pk], [3, 8, 15])
+
+    def test_returns_reduce_units_sold(self):
+        sale = self.checkout({self.panadol: 30})
+        self.row(self.panadol)
+        self.return_items(sale, {self.panadol: 6}, restock=False)
+        row = self.row(self.panadol)
+        self.assertEqual(row['sold']['30'], 24)
+        self.assertEqual((row['velocity'], row['days_of_cover'], row['suggested_units']), (0.8, 12.5, 14))
+
+    def test_cached_until_a_checkout_commits(self):
+        self.checkout({self.panadol: 30})
+        reorder.velocity_data()
+        with self.assertNumQueries(0):
+            reorder.velocity_data()
+
+        self.checkout({self.panadol: 2})
+        self.assertEqual(self.row(self.panadol)['sold']['30'], 32)
+
+    def test_totals_cached_after_an_invalidation_are_not_served(self):
+        self.checkout({self.panadol: 30})
+        stale = reorder.velocity_data()
+        self.checkout({self.panadol: 2})
+        # A report that read the old totals caches them after the checkout
+        cache.set(reorder.CACHE_KEY, stale)
+        self.assertEqual(reorder.velocity_data()['sold'][self.panadol.pk][1], 32)
+
+    def test_company_filter(self):
+        brufen = make_medicine('Brufen', company='Zen', stock=18)
+        self.checkout({self.panadol: 30, brufen: 15})
+        self.assertEqual([group['company'] for group in self.report()], ['Zen', 'Acme'])
+        self.assertEqual([group['company'] for group in self.report(company='acme')], ['Acme'])
+
+
+class DailySalesFactTests(SalesFlowMixin, TestCase):
+    def setUp(self):
+        # 10% off a Rs 10 unit bought at Rs 8
+        self.panadol = make_medicine('Panadol', discount=10)
+        self.brufen = make_medicine('Brufen', company='Zen')
+
+    def facts(self):
+        return {
+            fact.medicine_id: {name: getattr(fact, name) for name in DailySalesFact.METRIC_FIELDS}
+            for fact in DailySalesFact.objects.filter(day=timezone.localdate())
+        }
+
+    def test_checkout_and_return_update_the_day(self):
+        sale = self.checkout({self.panadol: 3, self.brufen: 2})
+        self.checkout({self.panadol: 1})
+        self.return_items(sale, {self.panadol: 1})
+
+        facts = self.facts()
+        self.assertEqual(facts[self.panadol.pk], {
+            'quantity_sold': 4, 'quantity_returned': 1, 'revenue': Money.coerce(27),
+            'cost': Money.coerce(24), 'discount': Money.coerce(4), 'profit': Money.coerce(3),
+        })
+        self.assertEqual(facts[self.brufen.pk]['revenue'], Money.coerce(20))
+
+    def test_rebuild_matches_the_incremental_facts(self):
+        sale = self.checkout({self.panadol: 3, self.brufen: 2})
+        self.return_items(sale, {self.brufen: 1})
+        incremental = self.facts()
+
+        DailySalesFact.objects.all().delete()
+        self.assertEqual(DailySalesFact.rebuild(), 2)
+        self.assertEqual(self.facts(), incremental)
+
+    def test_top_medicines(self):
+        sale = self.checkout({self.panadol: 3, self.brufen: 2})
+        self.return_items(sale, {self.brufen: 1})
+        url = reverse('sales:analytics_top')
+
+        data = self.client.get(url, {'metric': 'quantity'}).json()
+        self.assertEqual(
+            [(row['medicine'], row['net_quantity']) for row in data['results']],
+            [(self.panadol.pk, 3), (self.brufen.pk, 1)],
+        )
+        data = self.client.get(url, {'metric': 'returns', 'limit': 1}).json()
+        self.assertEqual([row['medicine'] for row in data['results']], [self.brufen.pk])
+        self.assertEqual(as_money(data['results'][0]['revenue']), Money.coerce(10))
+
+        tomorrow = timezone.localdate() + timedelta(days=1)
+        data = self.client.get(url, {'start': tomorrow.isoformat()}).json()
+        self.assertEqual(data['results'], [])
+
+    def test_top_medicines_rejects_bad_parameters(self):
+        url = reverse('sales:analytics_top')
+        self.assertEqual(self.client.get(url, {'metric': 'colour'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'start': '2026-13-01'}).status_code, 400)
+
+    def test_by_company(self):
+        self.checkout({self.panadol: 3, self.brufen: 2})
+        data = self.client.get(reverse('sales:analytics_companies')).json()
+        self.assertEqual([row['company'] for row in data['results']], ['Acme', 'Zen'])
+        acme = data['results'][0]
+        self.assertEqual((as_money(acme['revenue']), as_money(acme['profit'])), (Money.coerce(27), Money.coerce(3)))
+        self.assertEqual(acme['margin'], 11.11)
+
+
+class ClassifyArraysTests(TestCase):
+    def test_abc_by_revenue_and_xyz_by_weekly_variation(self):
+        start = date(2026, 1, 5)
+        day = start.toordinal()
+        # (medicine, week, units, revenue)
+        lines = [
+            (1, 0, 5, 125), (1, 1, 5, 125), (1, 2, 5, 125), (1, 3, 5, 125),
+            (2, 0, 10, 200), (2, 2, 10, 200),
+            (3, 1, 20, 60),
+            (4, 3, 0, 40),
+        ]
+        medicines, weeks, units, revenue = (np.array(column, dtype=np.int64) for column in zip(*lines))
+        ids, abc, xyz, share, cumulative, cv = classification.classify_arrays(
+            medicines, day + weeks * classification.PERIOD_DAYS, units, revenue, start=start, periods=4,
+        )
+        self.assertEqual(ids.tolist(), [1, 2, 3, 4])
+        self.assertEqual(abc.tolist(), ['A', 'A', 'B', 'C'])
+        self.assertEqual(xyz.tolist(), ['X', 'Y', 'Z', 'Z'])
+        self.assertEqual(share.tolist(), [0.5, 0.4, 0.06, 0.04])
+        self.assertAlmostEqual(cumulative[2], 0.96)
+        self.assertEqual(cv[1], 1.0)
+        self.assertEqual(cv[3], np.inf)
+
+
+class AbcXyzViewTests(LineStoreMixin, SalesFlowMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.panadol = make_medicine('Panadol')
+        self.brufen = make_medicine('Brufen')
+        self.calpol = make_medicine('Calpol')
+
+    def test_classes_matrix_and_filters(self):
+        self.checkout({self.panadol: 9, self.brufen: 1})
+        url = reverse('sales:analytics_abc_xyz')
+
+        data = self.client.get(url).json()
+        self.assertEqual(data['matrix'], {'AZ': 1, 'BZ': 1})
+        self.assertEqual([row['id'] for row in data['results']], [self.panadol.pk, self.brufen.pk])
+        self.assertEqual(data['results'][0]['revenue_share'], 0.9)
+
+        data = self.client.get(url, {'abc': 'b'}).json()
+        self.assertEqual([row['id'] for row in data['results']], [self.brufen.pk])
+
+    def test_cached_for_the_day(self):
+        self.checkout({self.panadol: 1})
+        self.assertEqual(classification.classes_for(self.panadol.pk), ('A', 'Z'))
+        self.checkout({self.calpol: 5})
+        self.assertEqual(classification.classes_for(self.calpol.pk), (None, None))
+
+
+class LineStoreTests(LineStoreMixin, SalesFlowMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.panadol = make_medicine('Panadol', discount=10)
+        self.brufen = make_medicine('Brufen')
+
+    def rows(self):
+        columns = linestore.open_columns()
+        return [
+            {name: int(columns[name][row]) for name in ('medicine', 'quantity', 'returned', 'price', 'cost', 'discount')}
+            for row in range(len(columns['id']))
+        ]
+
+    def test_refresh_appends_new_lines(self):
+        self.assertEqual(linestore.refresh(), {'cleared': 0, 'appended': 0, 'returns': 0})
+        self.checkout({self.panadol: 3, self.brufen: 2})
+        self.assertEqual(linestore.refresh()['appended'], 2)
+        self.checkout({self.brufen: 1})
+        self.assertEqual(linestore.refresh()['appended'], 1)
+
+        self.assertEqual(self.rows(), [
+            {'medicine': self.panadol.pk, 'quantity': 3, 'returned': 0, 'price': 1000, 'cost': 800, 'discount': 100},
+            {'medicine': self.brufen.pk, 'quantity': 2, 'returned': 0, 'price': 1000, 'cost': 800, 'discount': 0},
+            {'medicine': self.brufen.pk, 'quantity': 1, 'returned': 0, 'price': 1000, 'cost': 800, 'discount': 0},
+        ])
+        columns = linestore.open_columns(names=['day'])
+        self.assertEqual(set(columns['day'].tolist()), {timezone.localdate().toordinal()})
+
+    def test_refresh_syncs_returns_and_clears_deleted_sales(self):
+        sale = self.checkout({self.panadol: 3})
+        kept = self.checkout({self.brufen: 2})
+        linestore.refresh()
+
+        self.return_items(sale, {self.panadol: 1})
+        self.return_items(sale, {self.panadol: 1})
+        self.assertEqual(linestore.refresh()['returns'], 1)
+        self.assertEqual(self.rows()[0]['returned'], 2)
+
+        self.client.get(reverse('sales:delete', args=[sale.pk]))
+        self.assertEqual(linestore.refresh()['cleared'], 1)
+        self.assertEqual([(row['quantity'], row['returned']) for row in self.rows()], [(0, 0), (2, 0)])
+        self.assertTrue(kept.items.exists())
+
+    def test_rebuild_drops_deleted_lines(self):
+        sale = self.checkout({self.panadol: 3})
+        self.checkout({self.brufen: 2})
+        linestore.refresh()
+        self.client.get(reverse('sales:delete', args=[sale.pk]))
+
+        self.assertEqual(linestore.rebuild()['appended'], 1)
+        self.assertEqual(linestore.read_meta()['rows'], 1)
+        self.assertEqual(self.rows()[0]['medicine'], self.brufen.pk)
+
+    def test_classification_reads_store_and_newer_lines_alike(self):
+        self.checkout({self.panadol: 3, self.brufen: 2})
+        self.checkout({self.brufen: 5})
+        queried = classification.compute_classification()
+        linestore.refresh()
+        self.assertEqual(classification.compute_classification(), queried)
+
+        self.checkout({self.panadol: 4})
+        mixed = classification.compute_classification()
+        self.assertNotEqual(mixed, queried)
+        linestore.refresh()
+        self.assertEqual(classification.compute_classification(), mixed)
+
+    def test_export_command(self):
+        self.checkout({self.panadol: 3})
+        out = StringIO()
+        call_command('export_sales_store', stdout=out)
+        self.assertIn('Appended 1 line(s)', out.getvalue())
+        call_command('export_sales_store', '--rebuild', stdout=out)
+        self.assertEqual(linestore.read_meta()['rows'], 1)
+
+
+class DailySalesTotalTests(TestCase):
+    def setUp(self):
+        DailySalesTotal.record(_at(date(2026, 3, 1)), after=_values(100, profit=10))
+        DailySalesTotal.record(_at(date(2026, 3, 3)), after=_values(300, profit=30))
+        DailySalesTotal.record(_at(date(2026, 3, 5)), after=_values(500, profit=50))
+
+    def test_range_totals(self):
+        totals = DailySalesTotal.range_totals(date(2026, 3, 2), date(2026, 3, 5))
+        self.assertEqual(totals['sales_count'], 2)
+        self.assertEqual(totals['gross'], Money.coerce(800))
+        self.assertEqual(totals['profit'], Money.coerce(80))
+
+    def test_open_and_empty_ranges(self):
+        self.assertEqual(DailySalesTotal.range_totals()['gross'], Money.coerce(900))
+        self.assertEqual(DailySalesTotal.range_totals(end=date(2026, 3, 3))['sales_count'], 2)
+        self.assertEqual(DailySalesTotal.range_totals(date(2026, 3, 4))['gross'], Money.coerce(500))
+        empty = DailySalesTotal.range_totals(date(2026, 2, 1), date(2026, 2, 28))
+        self.assertEqual(empty, {name: 0 for name in DailySalesTotal.METRICS})
+
+    def test_earlier_change_shifts_later_running_sums(self):
+        DailySalesTotal.record(_at(date(2026, 3, 2)), after=_values(200, profit=20))
+        self.assertEqual(DailySalesTotal.range_totals(date(2026, 3, 3), date(2026, 3, 3))['gross'], Money.coerce(300))
+        self.assertEqual(DailySalesTotal.range_totals(end=date(2026, 3, 5))['gross'], Money.coerce(1100))
+
+    def test_returns_and_deletions(self):
+        day = _at(date(2026, 3, 3))
+        DailySalesTotal.record(day, before=_values(300, profit=30), after=_values(300, profit=20, returned=100))
+        totals = DailySalesTotal.range_totals(date(2026, 3, 3), date(2026, 3, 3))
+        self.assertEqual(totals['net'], Money.coerce(200))
+        self.assertEqual(totals['returned'], Money.coerce(100))
+        self.assertEqual(totals['profit'], Money.coerce(20))
+
+        DailySalesTotal.record(day, before=_values(300, profit=20, returned=100))
+        totals = DailySalesTotal.range_totals(date(2026, 3, 1), date(2026, 3, 5))
+        self.assertEqual(totals['sales_count'], 2)
+        self.assertEqual(totals['gross'], Money.coerce(600))
+
+
+class DailySalesTotalFlowTests(SalesFlowMixin, TestCase):
+    def setUp(self):
+        self.panadol = make_medicine('Panadol')
+
+    def test_checkout_return_and_delete_match_a_rebuild(self):
+        sale = self.checkout({self.panadol: 3}, discount=2)
+        self.checkout({self.panadol: 2})
+        self.return_items(sale, {self.panadol: 1})
+        kept = DailySalesTotal.range_totals()
+        self.assertEqual(kept['sales_count'], 2)
+        self.assertEqual(kept['gross'], Money.coerce(48))
+        self.assertEqual(kept['returned'], Money.coerce(10))
+
+        DailySalesTotal.objects.all().delete()
+        DailySalesTotal.rebuild()
+        self.assertEqual(DailySalesTotal.range_totals(), kept)
+
+        self.client.get(reverse('sales:delete', args=[sale.pk]))
+        totals = DailySalesTotal.range_totals()
+        self.assertEqual((totals['sales_count'], totals['gross'], totals['returned']), (1, Money.coerce(20), 0))
+
+
+class TimeseriesTests(SalesFlowMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            for day, gross in ((date(2026, 3, 2), 100), (date(2026, 3, 3), 200), (date(2026, 3, 9), 400)):
+                DailySalesTotal.record(_at(day), after=_values(gross, profit=gross // 10))
+
+    def get(self, **params):
+        response = self.client.get(reverse('sales:timeseries'), params)
+        return response.status_code, response.json()
+
+    def test_daily_weekly_and_monthly_buckets(self):
+        status, data = self.get(interval='daily', start='2026-03-02', end='2026-03-04')
+        self.assertEqual(status, 200)
+        self.assertEqual([bucket['bucket'] for bucket in data['buckets']], ['2026-03-02', '2026-03-03', '2026-03-04'])
+        self.assertEqual([bucket['sales_count'] for bucket in data['buckets']], [1, 1, 0])
+        self.assertEqual(as_money(data['buckets'][1]['net']), Money.coerce(200))
+
+        status, data = self.get(interval='weekly', start='2026-03-04', end='2026-03-15')
+        self.assertEqual([bucket['bucket'] for bucket in data['buckets']], ['2026-03-02', '2026-03-09'])
+        self.assertEqual([as_money(bucket['profit']) for bucket in data['buckets']], [Money.coerce(30), Money.coerce(40)])
+
+        status, data = self.get(interval='monthly', start='2026-02-10', end='2026-03-31')
+        self.assertEqual([bucket['sales_count'] for bucket in data['buckets']], [0, 3])
+
+    def test_closed_buckets_are_cached_until_their_day_changes(self):
+        timeseries.series('daily', date(2026, 3, 1), date(2026, 3, 10))
+        with self.assertNumQueries(0):
+            timeseries.series('daily', date(2026, 3, 1), date(2026, 3, 10))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            DailySalesTotal.record(_at(date(2026, 3, 3)), after=_values(50))
+        with self.assertNumQueries(1):
+            buckets = timeseries.series('daily', date(2026, 3, 1), date(2026, 3, 10))
+        self.assertEqual(buckets[2]['sales_count'], 2)
+        self.assertEqual(buckets[2]['net'], Money.coerce(250))
+
+    def test_open_bucket_is_always_queried(self):
+        panadol = make_medicine('Panadol')
+        today = timezone.localdate()
+        self.checkout({panadol: 1})
+        self.assertEqual(timeseries.series('daily', today, today)[0]['sales_count'], 1)
+        self.checkout({panadol: 2})
+        self.assertEqual(timeseries.series('daily', today, today)[0]['sales_count'], 2)
+
+        buckets = timeseries.series('hourly', today, today)
+        self.assertEqual(len(buckets), 24)
+        hour = timezone.localtime().replace(minute=0, second=0, microsecond=0, tzinfo=None)
+        self.assertEqual({bucket['bucket']: bucket['sales_count'] for bucket in buckets}[hour], 2)
+
+    def test_bad_parameters(self):
+        self.assertEqual(self.get(interval='yearly')[0], 400)
+        self.assertEqual(self.get(start='2026-03-05', end='2026-03-01')[0], 400)
+        self.assertEqual(self.get(interval='hourly', start='2026-01-01', end='2026-03-01')[0], 400)
+
+
+class ShiftTests(TestCase):
+    def sale_at(self, moment, amount=10):
+        return Sale.objects.create(
+            sale_date=timezone.make_aware(moment), subtotal=Money.coerce(amount), final_amount=Money.coerce(amount),
+        )
+
+    def setUp(self):
+        # 2 March 2026 is a Monday
+        self.morning = self.sale_at(datetime(2026, 3, 2, 9, 15))
+        self.late = self.sale_at(datetime(2026, 3, 2, 23, 30), amount=30)
+        self.small_hours = self.sale_at(datetime(2026, 3, 3, 1, 5), amount=20)
+
+    def test_local_hour_and_weekday_are_stored(self):
+        self.assertEqual((self.late.sale_hour, self.late.sale_weekday), (23, 0))
+        self.assertEqual((self.small_hours.sale_hour, self.small_hours.sale_weekday), (1, 1))
+        utc = Sale.objects.create(
+            sale_date=datetime(2026, 3, 2, 20, 0, tzinfo=dt_timezone.utc), subtotal=Money.coerce(5), final_amount=Money.coerce(5),
+        )
+        self.assertEqual((utc.sale_hour, utc.sale_weekday), (1, 1))
+
+    def test_night_shift_wraps_past_midnight(self):
+        self.assertEqual(
+            set(Sale.objects.filter(Sale.shift_q('night'))),
+            {self.late, self.small_hours},
+        )
+        self.assertEqual(list(Sale.objects.filter(Sale.shift_q('morning'))), [self.morning])
+        self.assertFalse(Sale.objects.filter(Sale.shift_q('evening')).exists())
+
+    def test_heatmap(self):
+        data = self.client.get(reverse('sales:heatmap')).json()
+        self.assertEqual(data['weekdays'][0], 'Monday')
+        self.assertEqual(data['grid'][0][23]['sales_count'], 1)
+        self.assertEqual(as_money(data['grid'][1][1]['net']), Money.coerce(20))
+        self.assertEqual(sum(cell['sales_count'] for row in data['grid'] for cell in row), 3)
+
+        data = self.client.get(reverse('sales:heatmap'), {'hour_filter': 'night', 'start': '2026-03-03'}).json()
+        self.assertEqual(sum(cell['sales_count'] for row in data['grid'] for cell in row), 1)
+        self.assertEqual(data['grid'][1][1]['sales_count'], 1)
+
+
+class SaleCounterTests(SalesFlowMixin, TestCase):
+    def setUp(self):
+        self.panadol = make_medicine('Panadol')
+        self.brufen = make_medicine('Brufen')
+
+    def test_checkout_and_returns_keep_counters(self):
+        sale = self.checkout({self.panadol: 3, self.brufen: 2})
+        self.assertEqual((sale.item_count, sale.total_quantity), (2, 5))
+        self.assertEqual((sale.returned_item_count, sale.returned_quantity), (0, 0))
+
+        self.return_items(sale, {self.panadol: 1, self.brufen: 2})
+        self.return_items(sale, {self.panadol: 1})
+        sale.refresh_from_db()
+        self.assertEqual((sale.returned_item_count, sale.returned_quantity), (3, 4))
+        self.assertEqual(sale.returned_amount, Money.coerce(40))
+
+    def list_queries(self, name):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(name))
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_list_queries_do_not_grow_with_sales(self):
+        sale = self.checkout({self.panadol: 1})
+        self.return_items(sale, {self.panadol: 1})
+        counts = {name: self.list_queries(name) for name in ('sales:list', 'sales:report', 'sales:return')}
+
+        for quantity in range(2, 6):
+            sale = self.checkout({self.panadol: quantity, self.brufen: 1})
+            self.return_items(sale, {self.brufen: 1})
+        self.assertEqual({name: self.list_queries(name) for name in counts}, counts)
+
+
+class ReturnTests(SalesFlowMixin, TestCase):
+    def setUp(self):
+        # Rs 8.50 a unit after 15% off
+        self.panadol = make_medicine('Panadol', discount=15)
+        self.brufen = make_medicine('Brufen', discount=15)
+
+    def test_refund_is_the_sum_of_the_rounded_lines(self):
+        sale = self.checkout({self.panadol: 2, self.brufen: 2})
+        return_entry = self.return_items(sale, {self.panadol: 1, self.brufen: 1})
+        prices = list(return_entry.items.values_list('returned_price', flat=True))
+        self.assertEqual(prices, [Money.coerce(8), Money.coerce(8)])
+        self.assertEqual(return_entry.refund_amount, Money.coerce(16))
+
+        sale.refresh_from_db()
+        self.assertEqual(sale.returned_amount, Money.coerce(16))
+
+    def test_restock_is_optional(self):
+        sale = self.checkout({self.panadol: 5, self.brufen: 5})
+        return_entry = self.return_items(sale, {self.panadol: 2})
+        self.return_items(sale, {self.brufen: 3}, restock=False)
+
+        self.panadol.refresh_from_db()
+        self.brufen.refresh_from_db()
+        self.assertEqual((self.panadol.stock, self.brufen.stock), (97, 95))
+        movement = StockMovement.objects.get(kind=StockMovement.RETURN_RESTOCK)
+        self.assertEqual(
+            (movement.medicine_id, movement.quantity, movement.reference),
+            (self.panadol.pk, 2, f"Return #{return_entry.pk}"),
+        )
+
+    def test_cannot_return_more_than_is_left(self):
+        sale = self.checkout({self.panadol: 2})
+        self.return_items(sale, {self.panadol: 2})
+        item = sale.items.get()
+        response = self.client.post(reverse('sales:create_return', args=[sale.pk]), {
+            'reason': 'Again', f'item_{item.pk}-quantity': 1, f'item_{item.pk}-restock': 'on',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sale.returns.count(), 1)
+        self.panadol.refresh_from_db()
+        self.assertEqual(self.panadol.stock, 100)
+
+
+class VoidSalesTests(SalesFlowMixin, TestCase):
+    def setUp(self):
+        self.panadol = make_medicine('Panadol')
+        self.brufen = make_medicine('Brufen')
+
+    def void(self, data):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('sales:void'), data)
+        return response.status_code, response.json()
+
+    def test_delete_restocks_unreturned_units_and_reverses_facts(self):
+        sale = self.checkout({self.panadol: 5, self.brufen: 2})
+        self.return_items(sale, {self.panadol: 2})
+        kept = self.checkout({self.brufen: 1})
+
+        self.client.get(reverse('sales:delete', args=[sale.pk]))
+        self.panadol.refresh_from_db()
+        self.brufen.refresh_from_db()
+        self.assertEqual((self.panadol.stock, self.brufen.stock), (100, 99))
+        self.assertEqual(
+            StockMovement.objects.filter(kind=StockMovement.SALE_DELETION, reference=f"Sale #{sale.pk}").count(), 2,
+        )
+
+        facts = {fact.medicine_id: fact for fact in DailySalesFact.objects.all()}
+        self.assertEqual((facts[self.panadol.pk].quantity_sold, facts[self.panadol.pk].revenue), (0, Money.ZERO))
+        self.assertEqual((facts[self.brufen.pk].quantity_sold, facts[self.brufen.pk].revenue), (1, Money.coerce(10)))
+        self.assertEqual(DailySalesTotal.range_totals()['net'], kept.net_amount)
+
+    def test_void_by_ids_reverses_each_sales_own_day(self):
+        old = self.checkout({self.panadol: 4})
+        Sale.objects.filter(pk=old.pk).update(sale_date=timezone.now() - timedelta(days=3))
+        DailySalesFact.rebuild()
+        DailySalesTotal.rebuild()
+        new = self.checkout({self.panadol: 1})
+
+        status, data = self.void({'sale_ids': [old.pk, new.pk, 999999]})
+        self.assertEqual((status, data), (200, {'deleted': 2}))
+        self.assertFalse(Sale.objects.exists())
+        self.panadol.refresh_from_db()
+        self.assertEqual(self.panadol.stock, 100)
+        self.assertEqual(set(DailySalesFact.objects.values_list('quantity_sold', flat=True)), {0})
+        self.assertEqual(DailySalesTotal.range_totals()['sales_count'], 0)
+
+    def test_void_a_shift(self):
+        morning = self.checkout({self.panadol: 1})
+        night = self.checkout({self.brufen: 1})
+        day = timezone.localdate()
+        Sale.objects.filter(pk=morning.pk).update(sale_hour=9)
+        Sale.objects.filter(pk=night.pk).update(sale_hour=23)
+
+        status, data = self.void({'date': day.isoformat(), 'shift': 'night'})
+        self.assertEqual(data, {'deleted': 1})
+        self.assertEqual(list(Sale.objects.all()), [morning])
+
+    def test_queries_do_not_grow_with_sales(self):
+        def void_queries(count):
+            pks = [self.checkout({self.panadol: 1, self.brufen: 1}).pk for _ in range(count)]
+            with CaptureQueriesContext(connection) as queries:
+                self.void({'sale_ids': pks})
+            return len(queries)
+
+        self.assertEqual(void_queries(1), void_queries(4))
+
+    def test_bad_requests(self):
+        self.assertEqual(self.void({'sale_ids': ['x']})[0], 400)
+        self.assertEqual(self.void({})[0], 400)
+        self.assertEqual(self.void({'date': '2026-03-02', 'shift': 'lunch'})[0], 400)
+        self.assertEqual(self.void({'sale_ids': [12345]}), (200, {'deleted': 0}))
+
+
+class CheckoutTests(SalesFlowMixin, TestCase):
+    def setUp(self):
+        self.panadol = make_medicine('Panadol', discount=10)
+        self.brufen = make_medicine('Brufen')
+
+    def test_sale_is_written_by_one_insert(self):
+        with CaptureQueriesContext(connection) as queries:
+            sale = self.checkout({self.panadol: 3, self.brufen: 2}, discount=2, extra=1)
+        writes = [
+            query['sql'] for query in queries
+            if query['sql'].startswith(('INSERT INTO "sales_sale" ', 'UPDATE "sales_sale" '))
+        ]
+        self.assertEqual(len(writes), 1)
+        self.assertTrue(writes[0].startswith('INSERT'))
+
+        self.assertEqual((sale.item_count, sale.total_quantity), (2, 5))
+        self.assertEqual(sale.final_amount, Money.coerce(49))
+        self.assertEqual(sale.net_amount, Money.coerce(49))
+        # 27 + 20 revenue less 40 cost, less the discount, plus the extra
+        self.assertEqual(sale.total_profit, Money.coerce(6))
+        self.assertEqual(sale.returned_amount, Money.ZERO)
+        self.assertEqual(sale.items.count(), 2)
+
+    def test_cached_amounts_match_a_recompute(self):
+        sale = self.checkout({self.panadol: 3, self.brufen: 2}, discount=2, price_deducted=1)
+        cached = (sale._net_amount, sale._total_profit, sale._returned_amount)
+        sale.recompute()
+        sale.refresh_from_db()
+        self.assertEqual((sale._net_amount, sale._total_profit, sale._returned_amount), cached)
+
+    def test_stock_goes_down_once_per_line(self):
+        self.checkout({self.panadol: 3, self.brufen: 2})
+        self.panadol.refresh_from_db()
+        self.brufen.refresh_from_db()
+        self.assertEqual((self.panadol.stock, self.brufen.stock), (97, 98))
+        self.assertEqual(StockMovement.objects.filter(kind=StockMovement.SALE).count(), 2)
+
+    def test_short_stock_fails_without_writing(self):
+        session = self.client.session
+        session['cart'] = {str(self.panadol.pk): 1, str(self.brufen.pk): 101}
+        session.save()
+        response = self.client.post(reverse('sales:checkout'), {'subtotal': '1020'})
+        self.assertEqual(resolve(response.url).url_name, 'cart')
+        self.assertFalse(Sale.objects.exists())
+        self.panadol.refresh_from_db()
+        self.assertEqual(self.panadol.stock, 100)
 
-# Create your tests here.
@@ -0,0 +1,176 @@
+"""
+Bucketed sales series for dashboard charts.
+
+series() returns sale count, net, profit and returned amount per hour,
+day, week or month. Daily, weekly and monthly buckets are one GROUP BY
+over the indexed day column of DailySalesTotal; hourly buckets are one
+GROUP BY over the sales in the requested hours.
+
+Each closed bucket is cached under its own key and never recomputed
+until DailySalesTotal.record() changes a sale on one of its days; only
+the open (current) bucket and buckets missing from the cache are
+queried, in a single query per request.
+"""
+from datetime import datetime, time, timedelta
+
+from django.core.cache import cache
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncHour, TruncMonth, TruncWeek
+from django.utils import timezone
+
+from app.money import Money
+
+INTERVALS = ['hourly', 'daily', 'weekly', 'monthly']
+METRICS = ['sales_count', 'net', 'profit', 'returned']
+# Default number of buckets when no start is given
+DEFAULT_BUCKETS = {'hourly': 24, 'daily': 30, 'weekly': 12, 'monthly': 12}
+MAX_BUCKETS = 1000
+
+CACHE_PREFIX = 'sales:timeseries'
+GENERATION_KEY = f'{CACHE_PREFIX}:generation'
+
+
+def bucket_start(interval, moment):
+    """Start of the bucket holding a local date or naive local datetime"""
+    if interval == 'hourly':
+        return moment.replace(minute=0, second=0, microsecond=0)
+    day = moment.date() if isinstance(moment, datetime) else moment
+    if interval == 'weekly':
+        return day - timedelta(days=day.weekday())
+    if interval == 'monthly':
+        return day.replace(day=1)
+    return day
+
+
+def next_bucket(interval, bucket):
+    if interval == 'hourly':
+        return bucket + timedelta(hours=1)
+    if interval == 'weekly':
+        return bucket + timedelta(days=7)
+    if interval == 'monthly':
+        return (bucket + timedelta(days=32)).replace(day=1)
+    return bucket + timedelta(days=1)
+
+
+def buckets_between(interval, start, end):
+    """Bucket starts covering local days start..end"""
+    if interval == 'hourly':
+        bucket = datetime.combine(start, time.min)
+        stop = datetime.combine(end + timedelta(days=1), time.min)
+    else:
+        bucket = bucket_start(interval, start)
+        stop = end + timedelta(days=1)
+
+    buckets = []
+    while bucket < stop:
+        buckets.append(bucket)
+        if len(buckets) > MAX_BUCKETS:
+            raise ValueError(f"Range spans more than {MAX_BUCKETS} {interval} buckets")
+        bucket = next_bucket(interval, bucket)
+    return buckets
+
+
+def default_start(interval, end):
+    count = DEFAULT_BUCKETS[interval]
+    if interval == 'hourly':
+        return end
+    if interval == 'daily':
+        return end - timedelta(days=count - 1)
+    if interval == 'weekly':
+        return bucket_start(interval, end) - timedelta(weeks=count - 1)
+    first = bucket_start(interval, end)
+    for _ in range(count - 1):
+        first = (first - timedelta(days=1)).replace(day=1)
+    return first
+
+
+def _key(interval, bucket, generation):
+    return f'{CACHE_PREFIX}:{generation}:{interval}:{bucket.isoformat()}'
+
+
+def _generation():
+    return cache.get_or_set(GENERATION_KEY, 0, timeout=None)
+
+
+def _empty():
+    return {'sales_count': 0, 'net': Money.ZERO, 'profit': Money.ZERO, 'returned': Money.ZERO}
+
+
+def _query(interval, first, last):
+    """{bucket: values} for buckets first..last from one grouped query"""
+    from .models import DailySalesTotal, Sale
+
+    if interval == 'hourly':
+        tz = timezone.get_current_timezone()
+        rows = (
+            Sale.objects
+            .filter(
+                sale_date__gte=timezone.make_aware(first),
+                sale_date__lt=timezone.make_aware(next_bucket(interval, last)),
+            )
+            .annotate(bucket=TruncHour('sale_date', tzinfo=tz))
+            .values('bucket')
+            .annotate(
+                sales_count=Count('id'),
+                net=Sum('_net_amount'),
+                profit=Sum('_total_profit'),
+                returned=Sum('_returned_amount'),
+            )
+            .order_by()
+        )
+        key = lambda row: timezone.make_naive(row['bucket'], tz)
+    else:
+        truncate = {'daily': F('day'), 'weekly': TruncWeek('day'), 'monthly': TruncMonth('day')}[interval]
+        rows = (
+            DailySalesTotal.objects
+            .filter(day__gte=first, day__lt=next_bucket(interval, last))
+            .annotate(bucket=truncate)
+            .values('bucket')
+            .annotate(**{name: Sum(name) for name in METRICS})
+            .order_by()
+        )
+        key = lambda row: row['bucket']
+
+    empty = _empty()
+    return {key(row): {name: row[name] or empty[name] for name in METRICS} for row in rows}
+
+
+def series(interval, start, end):
+    """[{'bucket': start, **metrics}] for each bucket covering local days start..end"""
+    buckets = buckets_between(interval, start, end)
+    open_bucket = bucket_start(interval, timezone.make_naive(timezone.now()) if interval == 'hourly'
+                               else timezone.localdate())
+
+    generation = _generation()
+    closed = {bucket: _key(interval, bucket, generation) for bucket in buckets if bucket < open_bucket}
+    cached = cache.get_many(list(closed.values()))
+
+    values = {bucket: cached[key] for bucket, key in closed.items() if key in cached}
+    missing = [bucket for bucket in buckets if bucket <= open_bucket and bucket not in values]
+    if missing:
+        found = _query(interval, missing[0], missing[-1])
+        for bucket in missing:
+            values[bucket] = found.get(bucket) or _empty()
+        cache.set_many(
+            {closed[bucket]: values[bucket] for bucket in missing if bucket in closed},
+            timeout=None,
+        )
+
+    # Buckets after the open one have no sales yet
+    return [{'bucket': bucket, **values.get(bucket, _empty())} for bucket in buckets]
+
+
+def invalidate_day(day):
+    """Drop the cached buckets holding a local day whose sales changed"""
+    generation = _generation()
+    keys = [_key(interval, bucket_start(interval, day), generation) for interval in ('daily', 'weekly', 'monthly')]
+    keys += [_key('hourly', datetime.combine(day, time(hour)), generation) for hour in range(24)]
+    cache.delete_many(keys)
+
+
+def invalidate():
+    """Drop every cached bucket"""
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, 1, timeout=None)
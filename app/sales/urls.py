@@ -1,13 +1,16 @@
 from django.urls import path
 from .views import (
-    CartView, CheckoutView, ReceiptView,
-    SalesDashboardView, SaleDetailView, SalesListView , ReportListView , CreateReturnView , ReturnView , delete_sale
+    CartView, CartScanView, CheckoutView, ReceiptView,
+    SalesDashboardView, SaleDetailView, SalesListView , ReportListView , CreateReturnView , ReturnView , delete_sale , void_sales ,
+    ReorderReportView, reorder_suggestions, analytics_top_medicines, analytics_by_company,
+    analytics_abc_xyz, sales_timeseries, sales_heatmap
 )
 app_name = 'sales'
 urlpatterns = [
     path('', SalesDashboardView.as_view(), name='dashboard'),
     path('cart/', CartView.as_view(), name='cart'),
     path('cart/update/', CartView.as_view(), name='update_cart'),
+    path('cart/scan/', CartScanView.as_view(), name='cart_scan'),
     path('checkout/', CheckoutView.as_view(), name='checkout'),
     path('receipt/<int:pk>/', ReceiptView.as_view(), name='receipt'),
     path('list/', SalesListView.as_view(), name='list'),
@@ -16,5 +19,13 @@ urlpatterns = [
     path('<int:sale_id>/return/', CreateReturnView.as_view(), name='create_return'),
     path('return/', ReturnView.as_view(), name='return'),
     path('delete-sale/<int:pk>/', delete_sale, name='delete'),
+    path('void/', void_sales, name='void'),
+    path('reorder/', ReorderReportView.as_view(), name='reorder'),
+    path('reorder/data/', reorder_suggestions, name='reorder_data'),
+    path('analytics/top/', analytics_top_medicines, name='analytics_top'),
+    path('analytics/companies/', analytics_by_company, name='analytics_companies'),
+    path('analytics/abc-xyz/', analytics_abc_xyz, name='analytics_abc_xyz'),
+    path('timeseries/', sales_timeseries, name='timeseries'),
+    path('heatmap/', sales_heatmap, name='heatmap'),
 
 ]
\ No newline at end of file
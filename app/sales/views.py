@@ -2,10 +2,13 @@ from django.views.generic import View, TemplateView , ListView, DetailView, Temp
 from django.shortcuts import render, redirect , get_object_or_404
 from django.http import JsonResponse
 from django.contrib import messages
-from app.medicine.models import Medicine
-from .models import Sale, SaleItem , Return , ReturnItem
+from app.medicine.models import Medicine, StockMovement
+from app.medicine.barcodes import barcode_index
+from app.money import Money, MoneyField, MoneyJSONEncoder
+from .models import Sale, SaleItem , Return , ReturnItem , DailySalesFact , DailySalesTotal
 import json
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 from django.utils.decorators import method_decorator
 from django.shortcuts import render
 from django.utils import timezone
@@ -19,10 +22,11 @@ from django.db.models import Subquery, OuterRef
 from django.db.models.functions import Coalesce
 from django.db.models import Sum, F, ExpressionWrapper, DecimalField , Q , Prefetch
 from .forms import ReturnForm, ReturnItemForm
+from . import analytics, classification, reorder, timeseries
 from django.db import transaction
 from django.urls import reverse
 from datetime import time
-from datetime import date, timedelta
+from datetime import date, datetime, timedelta
 from decimal import Decimal
 
 
@@ -31,11 +35,11 @@ class CartView(View):
     def get(self, request):
         cart = request.session.get('cart', {})
         medicine_ids = cart.keys()
-        medicines = Medicine.objects.filter(id__in=medicine_ids)
+        medicines = Medicine.objects.with_pricing().filter(id__in=medicine_ids)
         
         cart_items = []
-        subtotal = 0
-        discount_amount = 0
+        subtotal = Money.ZERO
+        discount_amount = Money.ZERO
         
         for medicine in medicines:
             quantity = cart[str(medicine.id)]
@@ -66,51 +70,116 @@ class CartView(View):
     def post(self, request):
         try:
             data = json.loads(request.body.decode('utf-8'))
-            medicine_id = str(data.get('medicine_id'))
-            action = data.get('action')
-            
-            cart = request.session.get('cart', {})
-            
-            if action == 'add':
-                quantity = int(data.get('quantity', 1))
-                cart[medicine_id] = cart.get(medicine_id, 0) + quantity
-            elif action == 'update':
-                quantity = int(data.get('quantity', 1))
-                if quantity > 0:
-                    cart[medicine_id] = quantity
-                else:
-                    del cart[medicine_id]
-            elif action == 'remove':
-                if medicine_id in cart:
-                    del cart[medicine_id]
-            
+
+            # A batch carries an ordered list of operations; a plain request
+            # is treated as a batch of one so both share the same code path.
+            operations = data.get('operations')
+            if operations is None:
+                operations = [data]
+            if not isinstance(operations, list):
+                raise ValueError("operations must be a list")
+
+            # Work on a copy so a failing operation leaves the session untouched
+            cart = dict(request.session.get('cart', {}))
+            for operation in operations:
+                self.apply_operation(cart, operation)
+
             request.session['cart'] = cart
             request.session.modified = True
-            
-            # Calculate updated totals
-            subtotal = 0
-            discount_amount = 0
-            medicine_ids = cart.keys()
-            medicines = Medicine.objects.filter(id__in=medicine_ids)
-            
-            for medicine in medicines:
-                quantity = cart[str(medicine.id)]
-                item_total = medicine.price * quantity
-                item_discount = medicine.calculated_discount * quantity
-                subtotal += item_total
-                discount_amount += item_discount
-            
+
+            # Calculate updated totals once for the whole batch
+            subtotal, discount_amount = self.cart_totals(cart)
+
             return JsonResponse({
                 'success': True,
+                'cart': cart,
                 'cart_count': len(cart),
                 'subtotal': subtotal,
                 'discount_amount': discount_amount,
                 'total': subtotal - discount_amount
-            })
+            }, encoder=MoneyJSONEncoder)
             
         except Exception as e:
             return JsonResponse({'success': False, 'error': str(e)})
 
+    @staticmethod
+    def apply_operation(cart, operation):
+        """Apply a single add/update/remove operation to the cart dict"""
+        medicine_id = str(operation.get('medicine_id'))
+        action = operation.get('action')
+
+        if action == 'add':
+            quantity = int(operation.get('quantity', 1))
+            cart[medicine_id] = cart.get(medicine_id, 0) + quantity
+        elif action == 'update':
+            quantity = int(operation.get('quantity', 1))
+            if quantity > 0:
+                cart[medicine_id] = quantity
+            else:
+                cart.pop(medicine_id, None)
+        elif action == 'remove':
+            cart.pop(medicine_id, None)
+        else:
+            raise ValueError(f"Unknown cart action: {action}")
+
+    @staticmethod
+    def cart_totals(cart):
+        """Return (subtotal, discount_amount) for the cart in one query"""
+        subtotal = Money.ZERO
+        discount_amount = Money.ZERO
+        medicines = Medicine.objects.with_pricing().filter(id__in=cart.keys())
+
+        for medicine in medicines:
+            quantity = cart[str(medicine.id)]
+            subtotal += medicine.price * quantity
+            discount_amount += medicine.calculated_discount * quantity
+
+        return subtotal, discount_amount
+
+@method_decorator(csrf_exempt, name='dispatch')
+class CartScanView(View):
+    """Resolve a scanned barcode / batch number and add it to the cart in one round trip"""
+
+    def post(self, request):
+        try:
+            data = json.loads(request.body.decode('utf-8'))
+            code = data.get('code', '')
+            quantity = int(data.get('quantity', 1))
+
+            matches = barcode_index.resolve(code)
+            if not matches:
+                return JsonResponse({'success': False, 'error': f"No medicine found for code {code}"}, status=404)
+            if len(matches) > 1:
+                candidates = Medicine.objects.filter(id__in=matches).values('id', 'name', 'company', 'stock')
+                return JsonResponse({
+                    'success': False,
+                    'error': f"Code {code} matches more than one medicine",
+                    'candidates': list(candidates)
+                }, status=409)
+
+            medicine_id = matches[0]
+            cart = dict(request.session.get('cart', {}))
+            CartView.apply_operation(cart, {'action': 'add', 'medicine_id': medicine_id, 'quantity': quantity})
+
+            request.session['cart'] = cart
+            request.session.modified = True
+
+            subtotal, discount_amount = CartView.cart_totals(cart)
+
+            return JsonResponse({
+                'success': True,
+                'medicine_id': medicine_id,
+                'quantity': cart[str(medicine_id)],
+                'cart': cart,
+                'cart_count': len(cart),
+                'subtotal': subtotal,
+                'discount_amount': discount_amount,
+                'total': subtotal - discount_amount
+            }, encoder=MoneyJSONEncoder)
+
+        except Exception as e:
+            return JsonResponse({'success': False, 'error': str(e)})
+
 class CheckoutView(View):
     def get(self, request):
         cart = request.session.get('cart', {})
@@ -120,37 +189,38 @@ class CheckoutView(View):
 
         try:
             items = []
-            subtotal = 0
-            discount_amount = 0
+            subtotal = Money.ZERO
+            discount_amount = Money.ZERO
+
+            medicines = Medicine.objects.with_pricing().in_bulk(cart.keys())
 
             for medicine_id, quantity in cart.items():
-                try:
-                    medicine = Medicine.objects.get(id=medicine_id)
-                    item_total = medicine.price * quantity
-                    item_discount = medicine.calculated_discount * quantity
+                medicine = medicines.get(int(medicine_id))
+                if medicine is None:
+                    messages.warning(request, f"Medicine ID {medicine_id} no longer available")
+                    continue
 
-                    items.append({
-                        'medicine': medicine,
-                        'quantity': quantity,
-                        'price': medicine.price,
-                        'discount': medicine.calculated_discount,
-                        'total': item_total - item_discount
-                    })
+                item_total = medicine.price * quantity
+                item_discount = medicine.calculated_discount * quantity
 
-                    subtotal += item_total
-                    discount_amount += item_discount
+                items.append({
+                    'medicine': medicine,
+                    'quantity': quantity,
+                    'price': medicine.price,
+                    'discount': medicine.calculated_discount,
+                    'total': item_total - item_discount
+                })
 
-                except Medicine.DoesNotExist:
-                    messages.warning(request, f"Medicine ID {medicine_id} no longer available")
-                    continue
+                subtotal += item_total
+                discount_amount += item_discount
 
             if not items:
                 messages.error(request, "No valid items in cart")
                 return redirect('sales:cart')
 
             # Default adjustment fields
-            price_deducted = 0
-            extra = 0
+            price_deducted = Money.ZERO
+            extra = Money.ZERO
             total = subtotal - discount_amount - price_deducted + extra
 
             context = {
@@ -176,12 +246,11 @@ class CheckoutView(View):
 
         try:
             # 1. First validate and convert all inputs
-            subtotal = Decimal(request.POST.get('subtotal', '0'))
-            discount = Decimal(request.POST.get('discount', '0'))
-            price_deducted = Decimal(request.POST.get('price_deducted', '0'))
-            extra = Decimal(request.POST.get('extra', '0'))
+            subtotal = Money.coerce(request.POST.get('subtotal') or '0')
+            discount = Money.coerce(request.POST.get('discount') or '0')
+            price_deducted = Money.coerce(request.POST.get('price_deducted') or '0')
+            extra = Money.coerce(request.POST.get('extra') or '0')
 
-            # 2. Create the Sale WITHOUT specifying ID
             sale = Sale(
                 subtotal=subtotal,
                 discount_amount=discount,
@@ -189,16 +258,13 @@ class CheckoutView(View):
                 extra=extra,
                 final_amount=subtotal - discount - price_deducted + extra
             )
-            sale.save()  # Let Django handle the ID assignment
 
-            # 3. Verify the sale has an ID
-            if not sale.id:
-                raise ValueError("Sale was not properly saved - no ID assigned")
-
-            # 4. Process items
+            # 2. Build the lines, so the sale's counters and cached amounts
+            # are known before it is inserted
+            sale_items = []
             for medicine_id, quantity in cart.items():
                 try:
-                    medicine = Medicine.objects.select_for_update().get(id=medicine_id)
+                    medicine = Medicine.objects.with_pricing().select_for_update().get(id=medicine_id)
                     quantity = int(quantity)
 
                     if quantity <= 0:
@@ -206,21 +272,40 @@ class CheckoutView(View):
                     if medicine.stock < quantity:
                         raise ValueError(f"Not enough stock for {medicine.name}")
 
-                    SaleItem.objects.create(
+                    sale_items.append(SaleItem(
                         sale=sale,
                         medicine=medicine,
                         quantity=quantity,
                         selling_price_per_unit=medicine.price,
+                        purchase_price_per_unit=medicine.purchase_per_unit_price,
                         discount_per_unit=medicine.calculated_discount,
                         total_price=(medicine.price - medicine.calculated_discount) * quantity
-                    )
-
-                    medicine.stock -= quantity
-                    medicine.save()
+                    ))
 
                 except Medicine.DoesNotExist:
                     continue
 
+            # 3. One INSERT for the sale and one for all of its lines
+            sale.insert_with_items(sale_items)
+            movements = [
+                StockMovement(
+                    medicine=item.medicine,
+                    kind=StockMovement.SALE,
+                    quantity=-item.quantity,
+                    reference=f"Sale #{sale.id}",
+                )
+                for item in sale_items
+            ]
+            # Stock goes down for all lines in one UPDATE; the medicines
+            # are not saved, so their signals do not run per line
+            StockMovement.apply(movements)
+            DailySalesFact.record_lines(
+                sale.sale_date,
+                [(item.medicine_id, DailySalesFact.sale_deltas(item)) for item in sale_items],
+            )
+            DailySalesTotal.record(sale.sale_date, after=DailySalesTotal.sale_values(sale))
+            transaction.on_commit(reorder.invalidate)
+
             request.session['cart'] = {}
             return redirect('sales:receipt', pk=sale.id)
 
@@ -326,25 +411,44 @@ class SaleDetailView(DetailView):
     context_object_name = 'sale'
 
     def get_queryset(self):
+        # Items carry returned_quantity from one grouped query, so the
+        # per-item return properties need no further queries
         return super().get_queryset().prefetch_related(
-            'items__medicine',
-            'items__return_items',
-            'returns__items__sale_item'
+            Prefetch('items', queryset=SaleItem.objects.with_returns().select_related('medicine')),
+            'returns__items__sale_item__medicine',
         )
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         sale = self.object
+        returns = sale.returns.all()
         context.update({
-            'returns': sale.returns.all(),
+            'returns': returns,
             'total_returned_amount': sale.returned_amount,
             'net_amount': sale.net_amount,
             'total_profit': sale.total_profit,
             'is_fully_returned': sale.is_fully_returned,
-            'has_returns': sale.returns.exists(),
+            'has_returns': bool(returns),
         })
         return context
 
+def _parse_date(value):
+    """YYYY-MM-DD query value as a date, None when empty or malformed"""
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date() if value else None
+    except ValueError:
+        return None
+
+
+def _filter_sale_dates(queryset, date_from=None, date_to=None):
+    """Limit sales to local days date_from..date_to as a range on the indexed sale_date"""
+    if date_from:
+        queryset = queryset.filter(sale_date__gte=timezone.make_aware(datetime.combine(date_from, time.min)))
+    if date_to:
+        queryset = queryset.filter(sale_date__lt=timezone.make_aware(datetime.combine(date_to + timedelta(days=1), time.min)))
+    return queryset
+
+
 class SalesListView(ListView):
     model = Sale
     template_name = 'sales/list.html'
@@ -356,29 +460,17 @@ class SalesListView(ListView):
         queryset = super().get_queryset()
         
         # Date range filtering
-        date_from = self.request.GET.get('date_from')
-        date_to = self.request.GET.get('date_to')
-        
-        if date_from:
-            queryset = queryset.filter(sale_date__date__gte=date_from)
-        if date_to:
-            queryset = queryset.filter(sale_date__date__lte=date_to)
+        queryset = _filter_sale_dates(
+            queryset,
+            _parse_date(self.request.GET.get('date_from')),
+            _parse_date(self.request.GET.get('date_to')),
+        )
         
-        # Optimized prefetching with annotations
+        # Counters and returned amount are plain columns on Sale
         return queryset.select_related().prefetch_related(
             Prefetch('items', 
                     queryset=SaleItem.objects.select_related('medicine')
-                            .annotate(returned_qty=Coalesce(Sum('return_items__quantity'), 0))),
-            Prefetch('returns__items',
-                    queryset=ReturnItem.objects.select_related('sale_item'))
-        ).annotate(
-            item_count=Count('items', distinct=True),
-            returned_item_count=Count('items__return_items', distinct=True),
-            total_returned=Coalesce(
-                Sum('returns__items__returned_price'),
-                0,
-                output_field=DecimalField(max_digits=10, decimal_places=2)
-            )
+                            .annotate(returned_qty=Coalesce(Sum('return_items__quantity'), 0)))
         )
 
     def get_context_data(self, **kwargs):
@@ -390,27 +482,16 @@ class SalesListView(ListView):
         context['date_from'] = date_from
         context['date_to'] = date_to
         
-        # Get the already-evaluated queryset from the view
-        sales = context['sales']
+        # Totals for the whole filtered range from the running daily sums
+        totals = DailySalesTotal.range_totals(_parse_date(date_from), _parse_date(date_to))
+        context['total_sales'] = totals['sales_count']
+        context['total_amount'] = totals['net']
+        context['total_profit'] = totals['profit']
         
-        # Calculate totals using annotated fields
-        context['total_sales'] = sales.count()
-        context['total_amount'] = sum(
-            sale._net_amount for sale in sales 
-            if not sale.is_fully_returned
-        )
-        context['total_profit'] = sum(
-            sale._total_profit for sale in sales
-        )
-        
-        # Optimize all-time totals calculation
         if date_from or date_to:
-            context['all_time_total_amount'] = Sale.objects.aggregate(
-                total=Sum('_net_amount')
-            )['total'] or Decimal('0.00')
-            context['all_time_total_profit'] = Sale.objects.aggregate(
-                total=Sum('_total_profit')
-            )['total'] or Decimal('0.00')
+            all_time = DailySalesTotal.range_totals()
+            context['all_time_total_amount'] = all_time['net']
+            context['all_time_total_profit'] = all_time['profit']
         
         return context
 
@@ -425,29 +506,17 @@ class ReportListView(ListView):
         queryset = super().get_queryset()
         
         # Date range filtering
-        date_from = self.request.GET.get('date_from')
-        date_to = self.request.GET.get('date_to')
-        
-        if date_from:
-            queryset = queryset.filter(sale_date__date__gte=date_from)
-        if date_to:
-            queryset = queryset.filter(sale_date__date__lte=date_to)
+        queryset = _filter_sale_dates(
+            queryset,
+            _parse_date(self.request.GET.get('date_from')),
+            _parse_date(self.request.GET.get('date_to')),
+        )
         
-        # Optimized prefetching with annotations
+        # Counters and returned amount are plain columns on Sale
         return queryset.select_related().prefetch_related(
             Prefetch('items', 
                     queryset=SaleItem.objects.select_related('medicine')
-                            .annotate(returned_qty=Coalesce(Sum('return_items__quantity'), 0))),
-            Prefetch('returns__items',
-                    queryset=ReturnItem.objects.select_related('sale_item'))
-        ).annotate(
-            item_count=Count('items', distinct=True),
-            returned_item_count=Count('items__return_items', distinct=True),
-            total_returned=Coalesce(
-                Sum('returns__items__returned_price'),
-                0,
-                output_field=DecimalField(max_digits=10, decimal_places=2)
-            )
+                            .annotate(returned_qty=Coalesce(Sum('return_items__quantity'), 0)))
         )
 
     def get_context_data(self, **kwargs):
@@ -459,27 +528,16 @@ class ReportListView(ListView):
         context['date_from'] = date_from
         context['date_to'] = date_to
         
-        # Get the already-evaluated queryset from the view
-        sales = context['sales']
-        
-        # Calculate totals using annotated fields
-        context['total_sales'] = sales.count()
-        context['total_amount'] = sum(
-            sale._net_amount for sale in sales 
-            if not sale.is_fully_returned
-        )
-        context['total_profit'] = sum(
-            sale._total_profit for sale in sales
-        )
+        # Totals for the whole filtered range from the running daily sums
+        totals = DailySalesTotal.range_totals(_parse_date(date_from), _parse_date(date_to))
+        context['total_sales'] = totals['sales_count']
+        context['total_amount'] = totals['net']
+        context['total_profit'] = totals['profit']
         
-        # Optimize all-time totals calculation
         if date_from or date_to:
-            context['all_time_total_amount'] = Sale.objects.aggregate(
-                total=Sum('_net_amount')
-            )['total'] or Decimal('0.00')
-            context['all_time_total_profit'] = Sale.objects.aggregate(
-                total=Sum('_total_profit')
-            )['total'] or Decimal('0.00')
+            all_time = DailySalesTotal.range_totals()
+            context['all_time_total_amount'] = all_time['net']
+            context['all_time_total_profit'] = all_time['profit']
         
         return context
 
@@ -498,7 +556,7 @@ class CreateReturnView(CreateView):
         
         # Initialize forms for each returnable item
         item_forms = []
-        for item in sale.items.all():
+        for item in sale.items.with_returns().select_related('medicine'):
             available_to_return = item.net_quantity
             if available_to_return > 0:
                 form_prefix = f'item_{item.id}'
@@ -524,18 +582,21 @@ class CreateReturnView(CreateView):
 
     @transaction.atomic
     def form_valid(self, form):
-        sale = get_object_or_404(Sale, pk=self.kwargs['sale_id'])
+        sale = get_object_or_404(Sale.objects.select_for_update(), pk=self.kwargs['sale_id'])
+        sale_before = DailySalesTotal.sale_values(sale)
         form.instance.sale = sale
         form.instance.processed_by = self.request.user
         
         # First save the return to get an ID
         response = super().form_valid(form)
         
-        total_refund = Decimal('0')
-        any_items_returned = False
+        total_refund = Money.ZERO
+        movements = []
+        fact_lines = []
+        return_items = []
         
-        # Process each item form
-        for item in sale.items.all():
+        # Validate each item form against its remaining quantity
+        for item in sale.items.with_returns().select_related('medicine'):
             form_prefix = f'item_{item.id}'
             item_form = ReturnItemForm(
                 data=self.request.POST,
@@ -548,41 +609,57 @@ class CreateReturnView(CreateView):
                 restock = item_form.cleaned_data['restock']
                 
                 if quantity > 0:
-                    any_items_returned = True
-                    returned_price = item.unit_price * Decimal(str(quantity))
-                    
-                    # Create return item
-                    ReturnItem.objects.create(
+                    returned_price = item.unit_price * quantity
+                    return_item = ReturnItem(
                         return_entry=self.object,
                         sale_item=item,
                         quantity=quantity,
-                        returned_price=returned_price,
+                        # Settled in whole rupees, as ReturnItem.save would
+                        returned_price=returned_price.round_to_rupee(),
                         restocked=restock
                     )
+                    return_items.append(return_item)
+                    if item.medicine_id:
+                        fact_lines.append((
+                            item.medicine_id,
+                            DailySalesFact.return_deltas(item, quantity, return_item.returned_price),
+                        ))
                     
-                    # Update medicine stock if restocked
-                    if restock and item.medicine:
-                        item.medicine.stock += quantity
-                        item.medicine.save()
+                    # Restock the medicine if requested
+                    if restock and item.medicine_id:
+                        movements.append(StockMovement(
+                            medicine_id=item.medicine_id,
+                            kind=StockMovement.RETURN_RESTOCK,
+                            quantity=quantity,
+                            reference=f"Return #{self.object.pk}",
+                        ))
                     
-                    total_refund += returned_price
+                    total_refund += return_item.returned_price
         
-        if not any_items_returned:
+        if not return_items:
             # No items were actually returned, so delete the return entry
             self.object.delete()
             form.add_error(None, "You must return at least one item")
             return self.form_invalid(form)
+
+        ReturnItem.objects.bulk_create(return_items)
+        StockMovement.apply(movements)
+        DailySalesFact.record_lines(sale.sale_date, fact_lines)
+        transaction.on_commit(reorder.invalidate)
         
         # Update return with total refund amount
         self.object.refund_amount = total_refund
         self.object.save()
-        
+
+        Sale.objects.filter(pk=sale.pk).update(
+            returned_item_count=F('returned_item_count') + len(return_items),
+            returned_quantity=F('returned_quantity') + sum(return_item.quantity for return_item in return_items),
+        )
+
         # Update sale cached values
         sale.refresh_from_db()
-        sale._returned_amount = sale.calculate_returned_amount()
-        sale._net_amount = max(sale.final_amount - sale._returned_amount, Decimal('0.00'))
-        sale._total_profit = sale.calculate_total_profit()
-        sale.save(update_fields=['_returned_amount', '_net_amount', '_total_profit'])
+        sale.recompute()
+        DailySalesTotal.record(sale.sale_date, before=sale_before, after=DailySalesTotal.sale_values(sale))
         
         return response
     
@@ -596,41 +673,22 @@ class ReturnView(ListView):
     def get_queryset(self):
         queryset = super().get_queryset()
         
-        # Date range filtering
-        date_from = self.request.GET.get('date_from')
-        date_to = self.request.GET.get('date_to')
-        hour_filter = self.request.GET.get('hour_filter')
-        
-        if date_from:
-            queryset = queryset.filter(sale_date__date__gte=date_from)
-        if date_to:
-            queryset = queryset.filter(sale_date__date__lte=date_to)
+        queryset = _filter_sale_dates(
+            queryset,
+            _parse_date(self.request.GET.get('date_from')),
+            _parse_date(self.request.GET.get('date_to')),
+        )
         
-        # Hour filter implementation
-        if hour_filter:
-            hour_filters = {
-                'morning': Q(sale_date__time__gte=time(6, 0), sale_date__time__lt=time(12, 0)),
-                'afternoon': Q(sale_date__time__gte=time(12, 0), sale_date__time__lt=time(17, 0)),
-                'evening': Q(sale_date__time__gte=time(17, 0), sale_date__time__lt=time(22, 0)),
-                'night': Q(sale_date__time__gte=time(22, 0)) | Q(sale_date__time__lt=time(6, 0))
-            }
-            queryset = queryset.filter(hour_filters[hour_filter])
+        # Shift filter on the indexed local hour
+        hour_filter = self.request.GET.get('hour_filter')
+        if hour_filter in Sale.SHIFT_HOURS:
+            queryset = queryset.filter(Sale.shift_q(hour_filter))
         
-        # Optimized prefetching with annotations
+        # Counters and returned amount are plain columns on Sale
         return queryset.prefetch_related(
             Prefetch('items', 
                    queryset=SaleItem.objects.select_related('medicine')
-                          .annotate(returned_qty=Coalesce(Sum('return_items__quantity'), 0))),
-            Prefetch('returns__items',
-                   queryset=ReturnItem.objects.select_related('sale_item'))
-        ).annotate(
-            item_count=Count('items', distinct=True),
-            returned_item_count=Count('items__return_items', distinct=True),
-            total_returned=Coalesce(
-                Sum('returns__items__returned_price'),
-                0,
-                output_field=DecimalField(max_digits=10, decimal_places=2)
-            )
+                          .annotate(returned_qty=Coalesce(Sum('return_items__quantity'), 0)))
         )
 
     def get_context_data(self, **kwargs):
@@ -645,24 +703,185 @@ class ReturnView(ListView):
         # Calculate totals using prefetched data
         if queryset.exists():
             context['total_sales'] = queryset.count()
-            context['total_amount'] = sum(
+            context['total_amount'] = sum((
                 sale._net_amount for sale in queryset 
                 if not sale.is_fully_returned
-            )
+            ), Money.ZERO)
         
         return context
 
+@transaction.atomic
 def delete_sale(request, pk):
-    sale = get_object_or_404(Sale, pk=pk)
-    
-    # Restock only non-returned quantities
-    for item in sale.items.all():
-        if item.medicine:  # Check if medicine still exists
-            restock_quantity = item.quantity - item.returned_quantity
-            if restock_quantity > 0:
-                item.medicine.stock += restock_quantity
-                item.medicine.save()
-    
-    sale.delete()
+    get_object_or_404(Sale, pk=pk)
+    Sale.void([pk])
+    # The sale drops out of the velocity history entirely
+    transaction.on_commit(reorder.invalidate)
     messages.success(request, f'Sale #{pk} deleted successfully. Medicines restocked.')
-    return redirect('sales:list')
\ No newline at end of file
+    return redirect('sales:list')
+
+
+@require_POST
+@transaction.atomic
+def void_sales(request):
+    """
+    Delete many sales at once, e.g. to void a shift: either sale_ids=1&sale_ids=2
+    or date=YYYY-MM-DD with an optional shift (morning/afternoon/evening/night).
+    """
+    sale_ids = request.POST.getlist('sale_ids')
+    if sale_ids:
+        try:
+            pks = [int(sale_id) for sale_id in sale_ids]
+        except ValueError:
+            return JsonResponse({'error': "sale_ids must be integers"}, status=400)
+    else:
+        day = _parse_date(request.POST.get('date'))
+        shift = request.POST.get('shift')
+        if day is None or (shift and shift not in Sale.SHIFT_HOURS):
+            return JsonResponse({'error': "Give sale_ids, or a date with an optional shift"}, status=400)
+        sales = _filter_sale_dates(Sale.objects.all(), day, day)
+        if shift:
+            sales = sales.filter(Sale.shift_q(shift))
+        pks = list(sales.values_list('pk', flat=True))
+
+    deleted = Sale.void(pks)
+    if deleted:
+        transaction.on_commit(reorder.invalidate)
+    return JsonResponse({'deleted': deleted})
+
+
+class ReorderReportView(TemplateView):
+    template_name = 'sales/reorder.html'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        company = self.request.GET.get('company', '').strip()
+        context.update({
+            'groups': reorder.reorder_report(company or None),
+            'company': company,
+            'windows': reorder.WINDOWS,
+            'reorder_below_days': reorder.REORDER_BELOW_DAYS,
+            'target_cover_days': reorder.TARGET_COVER_DAYS,
+        })
+        return context
+
+
+def reorder_suggestions(request):
+    """JSON reorder candidates grouped by company (?company= to narrow)"""
+    company = request.GET.get('company', '').strip()
+    return JsonResponse({'groups': reorder.reorder_report(company or None)})
+
+
+def _analytics_range(request):
+    start, end = analytics.default_range()
+    try:
+        if request.GET.get('start'):
+            start = datetime.strptime(request.GET['start'], '%Y-%m-%d').date()
+        if request.GET.get('end'):
+            end = datetime.strptime(request.GET['end'], '%Y-%m-%d').date()
+    except ValueError:
+        raise ValueError("start and end must be YYYY-MM-DD dates")
+    return start, end
+
+
+def analytics_top_medicines(request):
+    """Top-N medicines: ?metric=quantity|revenue|profit|returns&limit=10&start=&end="""
+    try:
+        start, end = _analytics_range(request)
+        metric = request.GET.get('metric', 'revenue')
+        if metric not in analytics.METRICS:
+            raise ValueError(f"metric must be one of {', '.join(analytics.METRICS)}")
+        limit = min(max(int(request.GET.get('limit', 10)), 1), 100)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    return JsonResponse({
+        'start': start, 'end': end, 'metric': metric,
+        'results': analytics.top_medicines(start, end, metric, limit),
+    }, encoder=MoneyJSONEncoder)
+
+
+def analytics_by_company(request):
+    """Sales, cost, discount, profit and margin per company: ?start=&end="""
+    try:
+        start, end = _analytics_range(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    return JsonResponse({
+        'start': start, 'end': end,
+        'results': analytics.by_company(start, end),
+    }, encoder=MoneyJSONEncoder)
+
+
+def analytics_abc_xyz(request):
+    """ABC/XYZ class per medicine with a count per class pair: ?abc=A&xyz=X"""
+    abc = request.GET.get('abc', '').upper()
+    xyz = request.GET.get('xyz', '').upper()
+    data = classification.classification()
+    classes = data['classes']
+
+    matrix = {}
+    for entry in classes.values():
+        pair = entry['abc'] + entry['xyz']
+        matrix[pair] = matrix.get(pair, 0) + 1
+
+    selected = [
+        medicine_id for medicine_id, entry in classes.items()
+        if (not abc or entry['abc'] == abc) and (not xyz or entry['xyz'] == xyz)
+    ]
+    medicines = Medicine.objects.in_bulk(selected)
+    results = [
+        {
+            'id': medicine_id,
+            'name': medicines[medicine_id].name,
+            'company': medicines[medicine_id].company,
+            'stock': medicines[medicine_id].stock,
+            **classes[medicine_id],
+        }
+        for medicine_id in selected if medicine_id in medicines
+    ]
+    results.sort(key=lambda row: -row['revenue_share'])
+
+    return JsonResponse({
+        'date': data['date'], 'start': data['start'],
+        'matrix': matrix,
+        'results': results,
+    })
+
+
+def sales_timeseries(request):
+    """Bucketed sales series: ?interval=hourly|daily|weekly|monthly&start=&end="""
+    interval = request.GET.get('interval', 'daily')
+    if interval not in timeseries.INTERVALS:
+        return JsonResponse({'error': f"interval must be one of {', '.join(timeseries.INTERVALS)}"}, status=400)
+
+    end = _parse_date(request.GET.get('end')) or timezone.localdate()
+    start = _parse_date(request.GET.get('start')) or timeseries.default_start(interval, end)
+    if start > end:
+        return JsonResponse({'error': "start must not be after end"}, status=400)
+    try:
+        buckets = timeseries.series(interval, start, end)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    return JsonResponse({
+        'interval': interval, 'start': start, 'end': end,
+        'buckets': buckets,
+    }, encoder=MoneyJSONEncoder)
+
+
+def sales_heatmap(request):
+    """Sale count and net amount per local weekday and hour: ?start=&end=&hour_filter="""
+    sales = _filter_sale_dates(
+        Sale.objects.all(),
+        _parse_date(request.GET.get('start')),
+        _parse_date(request.GET.get('end')),
+    )
+    hour_filter = request.GET.get('hour_filter')
+    if hour_filter in Sale.SHIFT_HOURS:
+        sales = sales.filter(Sale.shift_q(hour_filter))
+
+    return JsonResponse({
+        'weekdays': ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday'],
+        'grid': Sale.hour_weekday_heatmap(sales),
+    }, encoder=MoneyJSONEncoder)
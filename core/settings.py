@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import sys
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -25,6 +26,9 @@ SECRET_KEY = 'django-insecure-g!@vyj98gjm&ocmr$u4xx63gz3xuhl-gif(66*^mgq(-+$jk_a
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = True
 
+# The debug toolbar refuses to run under the test runner
+TESTING = 'test' in sys.argv[1:2]
+
 ALLOWED_HOSTS = []
 
 
@@ -44,7 +48,7 @@ PROJECT_APPS = [
     'app.sales',
 ]
 
-THIRD_PARTY_APPS = [
+THIRD_PARTY_APPS = [] if TESTING else [
     'debug_toolbar',
 ]
 
@@ -58,8 +62,9 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'debug_toolbar.middleware.DebugToolbarMiddleware',
 ]
+if not TESTING:
+    MIDDLEWARE.append('debug_toolbar.middleware.DebugToolbarMiddleware')
 
 ROOT_URLCONF = 'core.urls'
 
@@ -146,6 +151,9 @@ STATICFILES_DIRS = [
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Columnar copy of sale lines for analytics (manage.py export_sales_store)
+SALES_STORE_DIR = BASE_DIR / 'sales_store'
+
 
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = 'smtp.gmail.com'
@@ -28,7 +28,7 @@ urlpatterns = [
     path('', RedirectView.as_view(url='/', permanent=True))
 ]
 
-if settings.DEBUG:
+if settings.DEBUG and not settings.TESTING:
     import debug_toolbar
     urlpatterns = [
         path('__debug__/', include(debug_toolbar.urls)),